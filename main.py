@@ -6,30 +6,39 @@ import webbrowser
 import logging
 import multiprocessing
 import subprocess
+import queue
 
 # Include the nested folders with modules and assets for importing
 sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
 sys.path.append(os.path.join(os.path.dirname(__file__), 'assets'))
+
+# Command-line mode (python main.py batch ...) runs the pipeline without loading the GUI, any other
+# arguments (Qt options such as -style) are left to the GUI
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] in ("batch", "history"):
+    from ITk_CLI import cli
+    sys.exit(cli(sys.argv[1:]))
 # 
 # GUI modules - Qt Framework
 from PySide6.QtWidgets import *
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtCore import Qt, QSize, QTimer
 from PySide6.QtGui import QAction, QIcon, QPalette, QColor, QClipboard
 # User Interface made with Qt Designer
 from ui_mainwindow import Ui_MainWindow
 
 # Personal modules specific for the program's purpose
 from ITk_DB_Login import validate_login
+from ITk_ComponentCache import current_component
 from ITk_Importers import *
 from ITk_Measurements import *
 from ITk_GraphPlotter import graph_plot
 from ITk_Logger import *
 from ITk_DB_Upload import *
-from ITk_Spreadsheet import upload_sh
+from ITk_Spreadsheet import upload_sh, warm_up, SHEETS_WARM_UP
 from ITk_IREF_Fetcher import iref_values
 from ITk_About import CustomInfoWindow
 from ITk_ChipOrientation import ChipOrientation
 from ITk_ScanComponent import *
+from ITk_Watcher import ScanWatcher, scan_signature
 
 class MyApp(QMainWindow):
     def __init__(self, clipboard):
@@ -171,8 +180,19 @@ class MyApp(QMainWindow):
         self.queue = multiprocessing.Queue()
         self.ui.progressBar.setMaximum(100)
 
+        # Watch-folder mode - scans exported into ITK_WATCH_DIR are measured in the background
+        # and kept for review until the operator imports them
+        self.review = {}
+        self.watcher = None
+        watch_dir = os.environ.get("ITK_WATCH_DIR")
+        if watch_dir and os.path.isdir(watch_dir):
+            self.watcher = ScanWatcher(watch_dir)
+            self.watcher.start()
+            logger.info(f"Watching {watch_dir} for new Smartscope scans")
+            QTimer.singleShot(1000, self.check_watcher)
+
         self.ui.gobackButton.clicked.connect(self.go_back)
-        self.ui.itkButton.clicked.connect(lambda: upload_itk(self.component,self.results,self.client,self.csv_path))
+        self.ui.itkButton.clicked.connect(self.upload_database)
         self.ui.sheetButton.clicked.connect(self.upload_sheets)
 
     def custom_messagebox(self,title,maintext,info_text,icon,button):
@@ -208,6 +228,9 @@ class MyApp(QMainWindow):
         if valid:
             self.user = user
             self.client = client
+            # Google Sheets is opened while the user gets on with the scans
+            if SHEETS_WARM_UP:
+                warm_up()
             fName = self.user['firstName']
             lName = self.user['lastName']
             dict = {"title":"Welcome",
@@ -273,7 +296,7 @@ class MyApp(QMainWindow):
     
     def import_csv_file(self):
         try:
-            self.csv_list, self.csv_basename, self.csv_path = csv_import(self.ui.csv_text,self.ui.csv_label)
+            self.pull_data, self.csv_basename, self.csv_path = csv_import(self.ui.csv_text,self.ui.csv_label)
         except Exception as e:
             print(e)
 
@@ -295,11 +318,19 @@ class MyApp(QMainWindow):
             dat_basename = os.path.basename(self.dat_path[0])
             sta_basename = os.path.basename(self.sta_path[0])
 
+            # Results measured in the background are used as long as the files have not changed since
+            stage_results = None
+            key = (os.path.abspath(self.dat_path[0]), os.path.abspath(self.sta_path[0]))
+            entry = self.review.get(key)
+            if entry is not None and entry["error"] is None and entry["signature"] == scan_signature(*key):
+                stage_results = entry[f"{entry['stage']}_results"]
+
             success, results = met_measurements(self.dat_path[0],
                                                 self.sta_path[0],
                                                 dat_basename,
                                                 sta_basename,
-                                                self.client)
+                                                self.client,
+                                                stage_results)
             if success:
                 # Clear pre-loaded csv files
                 self.csv_path = ""
@@ -336,7 +367,9 @@ class MyApp(QMainWindow):
             QApplication.setAttribute(Qt.ApplicationAttribute.AA_DontUseNativeDialogs, False)
             return
         else:
-            results = csv_measurements(self.csv_list,self.csv_basename[0],self.client)
+            results = csv_measurements(self.pull_data,self.csv_basename[0],self.client,self.csv_path[0])
+            if results is None:
+                return
             self.results = results
             self.component_id = results["component_id"]
             self.component = results["component"]
@@ -433,6 +466,17 @@ class MyApp(QMainWindow):
             self.ui.stackedWidget.setCurrentIndex(1)
             self.ui.tabWidget.setCurrentIndex(0)
     
+    def upload_database(self):
+        """
+        Upload to the ITk database, checked against the component as it is in the database now
+        """
+        try:
+            self.component = current_component(self.client,self.component)
+        except Exception as e:
+            logging.error(f"Could not retrieve {self.component.get('serialNumber')} from the ITk database\n{e}")
+            return
+        upload_itk(self.component,self.results,self.client,self.csv_path)
+
     def upload_sheets(self):
         """
         Start the upload process using threading method to retrieve incriments for the progressbar
@@ -464,6 +508,30 @@ class MyApp(QMainWindow):
         except multiprocessing.queues.Empty:
             QTimer.singleShot(100, lambda: self.check_queue(queue))
     
+    def check_watcher(self):
+        """
+        Collects the scans measured by the watch-folder mode and keeps them for review
+        """
+        while True:
+            try:
+                entry = self.watcher.results.get_nowait()
+            except queue.Empty:
+                break
+
+            key = (os.path.abspath(entry["dat_path"]), os.path.abspath(entry["sta_path"]))
+            self.review[key] = entry
+            if entry["error"] is None:
+                logging.info(f"Scan ready for review: {os.path.basename(entry['dat_path'])}")
+            else:
+                logging.error(f"Background measurement of {os.path.basename(entry['dat_path'])} failed: {entry['error']}")
+
+        QTimer.singleShot(1000, self.check_watcher)
+
+    def closeEvent(self, event):
+        if self.watcher is not None:
+            self.watcher.stop()
+        super().closeEvent(event)
+
     def hide_label(self):
         """
         Hides the text behind the input when typing in characters
@@ -0,0 +1,120 @@
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ITk_Importers import acquire_array, acquire_data, read_pulltest
+from ITk_Engine import stage_measurements, pulltest_measurements
+
+"""
+Batch ingestion of Smartscope exports: scans a directory for the metrology .DAT/.STA files of every stage,
+pairs them by the serial prefix of the file name and parses and processes every pair in a process pool.
+"""
+
+# Serial prefix, assembly stage and extension of a Smartscope metrology export
+scan_pattern = re.compile(r"^([a-z0-9]+)_vc3_(bare_flex|bare_module|assembled_module)_metrology\.(DAT|STA)$",
+                          re.IGNORECASE)
+
+# File name stage to the short stage names used across the measurements
+stage_names = {"bare_flex": "flex",
+               "bare_module": "bare",
+               "assembled_module": "assem"}
+
+def find_scan_pairs(directory: str, warn_unpaired: bool = True):
+    """
+    Finds all .DAT/.STA pairs in a directory. Returns a list of (serial, stage, dat_path, sta_path)
+    sorted by serial; files without their counterpart are left out (and logged with warn_unpaired)
+    """
+    return pair_scan_files([os.path.join(directory, name) for name in sorted(os.listdir(directory))],
+                           warn_unpaired)
+
+def pair_scan_files(file_names: list, warn_unpaired: bool = True):
+    """
+    Pairs a list of .DAT/.STA files by serial and stage, as find_scan_pairs() - other files are ignored
+    """
+    found = {}
+
+    for file_name in file_names:
+        match = scan_pattern.match(os.path.basename(file_name))
+        if not match:
+            continue
+        serial, stage, extension = match.groups()
+        key = (serial.upper(), stage_names[stage.lower()])
+        found.setdefault(key, {})[extension.upper()] = file_name
+
+    pairs = []
+    for (serial, stage), files in sorted(found.items()):
+        if "DAT" in files and "STA" in files:
+            pairs.append((serial, stage, files["DAT"], files["STA"]))
+        elif warn_unpaired:
+            logging.warning(f"No matching {'.STA' if 'DAT' in files else '.DAT'} file for {serial} ({stage}), skipping")
+
+    return pairs
+
+def measure_pair(dat_path: str, sta_path: str, stage: str):
+    """
+    Parses and processes one .DAT/.STA pair, returns the results of the stage (as in met_measurements)
+    """
+    new_dat = acquire_array(dat_path)
+    new_sta = acquire_data(sta_path)
+    return stage_measurements[stage](new_dat, new_sta)
+
+def process_pair(serial: str, stage: str, dat_path: str, sta_path: str):
+    """
+    Worker entry for one pair - returns the serial, stage, file paths and either
+    the stage results or the error that stopped the pair from being processed
+    """
+    entry = {"component_id": serial,
+             "stage": stage,
+             "dat_path": dat_path,
+             "sta_path": sta_path,
+             f"{stage}_results": None,
+             "error": None}
+    try:
+        entry[f"{stage}_results"] = measure_pair(dat_path, sta_path, stage)
+    except Exception as e:
+        entry["error"] = f"{e}"
+    return entry
+
+def process_pulltest(csv_path: str):
+    """
+    Worker entry for one wirebond pull test .CSV file, as process_pair()
+    """
+    entry = {"component_id": None,
+             "stage": "pulltest",
+             "csv_path": csv_path,
+             "pulltest_results": None,
+             "error": None}
+    try:
+        object_id, grades, pulls = read_pulltest(csv_path)
+        if object_id is None:
+            raise ValueError("Object ID not found in the file header")
+        entry["component_id"] = object_id
+        entry["pulltest_results"] = pulltest_measurements({"grade": grades, "pull": pulls})
+    except Exception as e:
+        entry["error"] = f"{e}"
+    return entry
+
+def batch_ingest(directory: str, max_workers: int = None):
+    """
+    Measures every .DAT/.STA pair found in the directory across all cores,
+    returns the process_pair() entry of every pair
+    """
+    pairs = find_scan_pairs(directory)
+    batch = []
+
+    if not pairs:
+        return batch
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_pair, *pair) for pair in pairs]
+
+        for future in as_completed(futures):
+            entry = future.result()
+            if entry["error"] is not None:
+                logging.error(f"Processing {os.path.basename(entry['dat_path'])} failed: {entry['error']}")
+            batch.append(entry)
+
+    # Same order as the directory listing regardless of which worker finished first
+    batch.sort(key=lambda entry: (entry["component_id"], entry["stage"]))
+
+    return batch
@@ -0,0 +1,386 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ITk_Batch import pair_scan_files, process_pair, process_pulltest
+from ITk_ComponentCache import current_component
+from ITk_Engine import measure_scan, measure_pulltest, MeasurementError, MeasurementResult, ComponentLookup
+from ITk_ResultsStore import record_result, results_store, operators
+
+"""
+Command-line entry point of the metrology pipeline (python main.py batch ...). Parses, processes and evaluates
+a directory or a list of .DAT/.STA/.CSV files across all cores without the GUI and writes the results as
+JSON lines or CSV, optionally uploading them to the ITk database and the Google Sheet. Every result is kept
+in the local results store, which python main.py history ... queries.
+"""
+
+# Component type and stage the database upload expects for every measurement stage (ITk_DB_Upload.test_dict)
+upload_stages = {"flex": ("flextype", "flexstage"),
+                 "bare": ("baretype", "barestage"),
+                 "assem": ("assemtype", "assemstage"),
+                 "pulltest": ("assemtype", "wirestage")}
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="metrologist",
+                                     description="ITk Metrologist - metrology and wirebond pull test processing")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch",
+                                help="process a directory or a list of .DAT/.STA/.CSV files",
+                                description="Processes every .DAT/.STA pair and pull test .CSV file in parallel "
+                                            "and writes one result per component and stage")
+    batch.add_argument("paths", nargs="+",
+                       help="directories and/or .DAT, .STA and .CSV files")
+    batch.add_argument("-o", "--output", default="-",
+                       help="output file, standard output by default")
+    batch.add_argument("-f", "--format", choices=("jsonl", "csv"),
+                       help="output format, taken from the output file extension by default (jsonl otherwise)")
+    batch.add_argument("-j", "--workers", type=int, default=None,
+                       help="number of worker processes, all cores by default")
+    batch.add_argument("--upload", action="store_true",
+                       help="upload the results to the ITk database (access codes from the environment)")
+    batch.add_argument("--operator",
+                       help="operator name recorded with the uploaded test runs, required with --upload")
+    batch.add_argument("--sheets", action="store_true",
+                       help="update the Google Sheet with the metrology results, every component in one batched update")
+    batch.add_argument("--assembled", choices=("yes", "no"),
+                       help="answer to the assembly call of the Google Sheet update, asked per component otherwise")
+    batch.add_argument("--assembly-date",
+                       help="assembly date (dd/mm/yy) of the Google Sheet update, asked per module otherwise")
+    batch.add_argument("-v", "--verbose", action="store_true",
+                       help="log the progress of every file")
+    batch.add_argument("--no-store", action="store_true",
+                       help="do not keep the results in the local results store")
+    batch.set_defaults(func=run_batch)
+
+    history = commands.add_parser("history",
+                                  help="query the local results store",
+                                  description="Lists the stored measurements, newest first")
+    history.add_argument("serial", nargs="?",
+                         help="serial number of the component, all components by default")
+    history.add_argument("--stage", choices=("flex", "bare", "assem", "pulltest"),
+                         help="measurement stage")
+    history.add_argument("--since",
+                         help="measured on or after this date (YYYY-MM-DD)")
+    history.add_argument("--until",
+                         help="measured before this date (YYYY-MM-DD)")
+    verdict = history.add_mutually_exclusive_group()
+    verdict.add_argument("--passed", dest="passed", action="store_const", const=True,
+                         help="only the measurements that passed")
+    verdict.add_argument("--failed", dest="passed", action="store_const", const=False,
+                         help="only the measurements that failed")
+    history.add_argument("-w", "--where", action="append", default=[], type=metric_condition,
+                         help="metric condition, e.g. \"avg_fe_thickness>150\" (repeatable)")
+    history.add_argument("--latest", action="store_true",
+                         help="only the newest measurement of every component and stage")
+    history.add_argument("-n", "--limit", type=int,
+                         help="maximum number of measurements")
+    history.add_argument("-o", "--output", default="-",
+                         help="output file, standard output by default")
+    history.add_argument("-f", "--format", choices=("jsonl", "csv"),
+                         help="output format, taken from the output file extension by default (jsonl otherwise)")
+    history.add_argument("-v", "--verbose", action="store_true",
+                         help="log the number of measurements found")
+    history.set_defaults(func=run_history)
+
+    return parser
+
+def metric_condition(text: str):
+    """
+    "metric<op>value" argument as (metric, operator, value)
+    """
+    pattern = "|".join(re.escape(operator) for operator in sorted(operators, key=len, reverse=True))
+    match = re.fullmatch(rf"\s*([\w\[\]]+)\s*({pattern})\s*(\S+)\s*", text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"{text} is not a metric condition such as avg_fe_thickness>150")
+    name, operator, value = match.groups()
+    try:
+        return name, operator, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+
+def collect_jobs(paths: list):
+    """
+    Expands the directories and sorts the files into .DAT/.STA pairs and pull test .CSV files
+    """
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_names.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+        elif os.path.isfile(path):
+            file_names.append(path)
+        else:
+            logging.error(f"{path} does not exist, skipping")
+
+    pairs = pair_scan_files(file_names)
+    csv_files = [file_name for file_name in file_names if file_name.lower().endswith(".csv")]
+
+    return pairs, csv_files
+
+def process_jobs(pairs: list, csv_files: list, max_workers: int = None, submitted=None):
+    """
+    Runs every pair and pull test through the measurement engine in a process pool,
+    returns the entries sorted by component and stage.
+    submitted - called once every job is submitted, while the pool is working on them
+    """
+    entries = []
+    if not pairs and not csv_files:
+        return entries
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_pair, *pair) for pair in pairs]
+        futures.extend(executor.submit(process_pulltest, csv_path) for csv_path in csv_files)
+
+        # The worker processes exist by now, threads started here are not forked into them
+        if submitted is not None:
+            submitted()
+
+        for future in as_completed(futures):
+            entry = future.result()
+            name = os.path.basename(entry.get("dat_path") or entry.get("csv_path"))
+            if entry["error"] is not None:
+                logging.error(f"Processing {name} failed: {entry['error']}")
+            else:
+                logging.info(f"Processed {name}")
+            entries.append(entry)
+
+    entries.sort(key=lambda entry: (entry["component_id"] or "", entry["stage"]))
+    return entries
+
+def entry_result(entry: dict, client, lookup: ComponentLookup = None):
+    """
+    MeasurementResult of a processed entry with the component, mass and carrier looked up in the database
+    """
+    stage_results = entry[f"{entry['stage']}_results"]
+    if entry["stage"] == "pulltest":
+        return measure_pulltest(None, entry["component_id"], client, stage_results=stage_results)
+    return measure_scan(None, None, os.path.basename(entry["dat_path"]), os.path.basename(entry["sta_path"]),
+                        client, stage_results=stage_results, lookup=lookup)
+
+def upload_entry(result, csv_path, client, operator: str):
+    """
+    Uploads one result to the database. Components in another location or stage are left for the GUI,
+    where the stage can be changed or the upload set as retroactive
+    """
+    from ITk_DB_Upload import upload_itk, test_dict
+
+    type_key, stage_key = upload_stages[result.stage]
+    # Checked against the database as it is now, not the component looked up while processing
+    component = current_component(client, result.component)
+    if component['componentType']['code'] != test_dict[type_key]:
+        raise MeasurementError(f"Component type {component['componentType']['code']} does not match "
+                               f"{test_dict[type_key]}")
+    if component['currentLocation']['code'] != "LIV":
+        raise MeasurementError(f"Component is located at {component['currentLocation']['code']}, not LIV")
+    if component['currentStage']['code'] != test_dict[stage_key]:
+        raise MeasurementError(f"Component stage {component['currentStage']['code']} does not match "
+                               f"{test_dict[stage_key]}, upload it from the GUI")
+
+    test_upload = upload_itk(component, result.to_results(), client, csv_path,
+                             operator=operator, open_browser=False)
+    if test_upload is None:
+        raise MeasurementError("Upload to the ITk database failed")
+    return test_upload['testRun']['id']
+
+def login():
+    from ITk_DB_Login import validate_login
+
+    if "ITKDB_ACCESS_CODE1" not in os.environ or "ITKDB_ACCESS_CODE2" not in os.environ:
+        raise SystemExit("ITKDB_ACCESS_CODE1 and ITKDB_ACCESS_CODE2 must be set to upload")
+    success, client, user = validate_login("", "")
+    if not success:
+        raise SystemExit("Could not log in to the ITk database")
+    return client
+
+def publish(entries: list, args, client, lookups: dict):
+    """
+    Upload and Google Sheet update of the successfully processed entries, with the component
+    lookups started before processing (lookups by .DAT path)
+    """
+    prompts = {"open_results": "no"}
+    if args.assembled is not None:
+        prompts["assembled"] = args.assembled
+    if args.assembly_date is not None:
+        prompts["date_assembled"] = args.assembly_date
+
+    sheet_entries = []
+    for entry in entries:
+        if entry["error"] is not None:
+            continue
+        try:
+            result = entry_result(entry, client, lookups.get(entry.get("dat_path")))
+            entry["result"] = result
+            if args.upload:
+                entry["test_run"] = upload_entry(result, entry.get("csv_path", ""), client, args.operator)
+            # The pull test has no spreadsheet columns
+            if args.sheets and result.stage != "pulltest":
+                sheet_entries.append(entry)
+        except Exception as e:
+            entry["error"] = f"{e}"
+            logging.error(f"{entry['component_id']} ({entry['stage']}): {e}")
+
+    if sheet_entries:
+        publish_sheets(sheet_entries, prompts)
+
+def publish_sheets(entries: list, prompts: dict):
+    """
+    Writes the results of every entry to the Google Sheet together, with one batched update
+    """
+    from ITk_Spreadsheet import upload_many
+
+    try:
+        written = upload_many([entry["result"].to_results() for entry in entries], queue.Queue(), prompts)
+    except Exception as e:
+        for entry in entries:
+            entry["error"] = f"Google Sheet update failed: {e}"
+        logging.error(f"Google Sheet update failed: {e}")
+        return
+
+    written = {component_id for component_id, _, _ in written}
+    for entry in entries:
+        if entry["result"].component_id in written:
+            entry["sheets"] = True
+    logging.info(f"Wrote {len(written)} components to the Google Sheet")
+
+def entry_record(entry: dict):
+    """
+    Output record of one entry - files, overall pass/fail and the stage results
+    """
+    stage_results = entry[f"{entry['stage']}_results"]
+    files = [entry[key] for key in ("dat_path", "sta_path", "csv_path") if key in entry]
+
+    record = {"component_id": entry["component_id"],
+              "stage": entry["stage"],
+              "files": files,
+              "passed": all(stage_results["pass_fail"]) if stage_results is not None else None,
+              "error": entry["error"]}
+    for key in ("test_run", "sheets"):
+        if key in entry:
+            record[key] = entry[key]
+    record["results"] = stage_results
+    return record
+
+def json_default(value):
+    # NumPy scalars and arrays that made it into the results
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def write_jsonl(records: list, file):
+    for record in records:
+        file.write(json.dumps(record, default=json_default) + "\n")
+
+def store_entries(entries: list):
+    """
+    Keeps every processed entry in the local results store, with the component data when it was looked up
+    """
+    for entry in entries:
+        stage_results = entry[f"{entry['stage']}_results"]
+        if stage_results is None:
+            continue
+        result = entry.get("result") or MeasurementResult(entry["component_id"], entry["stage"], stage_results)
+        record_result(result, entry.get("dat_path"), entry.get("sta_path"), entry.get("csv_path"))
+
+def write_csv(records: list, file, columns: list = None):
+    """
+    One row per record, the stage results flattened into columns and lists written as JSON
+    """
+    columns = list(columns or ["component_id", "stage", "files", "passed", "error", "test_run", "sheets"])
+    rows = []
+    for record in records:
+        row = {key: value for key, value in record.items() if key != "results"}
+        for key, value in (record["results"] or {}).items():
+            if key not in columns:
+                columns.append(key)
+            row[key] = value
+        rows.append({key: json.dumps(value, default=json_default) if isinstance(value, (list, dict)) else value
+                     for key, value in row.items()})
+
+    writer = csv.DictWriter(file, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def run_batch(args):
+    if args.upload and not args.operator:
+        raise SystemExit("--operator is required with --upload")
+
+    pairs, csv_files = collect_jobs(args.paths)
+    if not pairs and not csv_files:
+        logging.error("No .DAT/.STA pairs or .CSV files found")
+        return 1
+
+    client = login() if args.upload or args.sheets else None
+    lookups = {}
+
+    def start_lookups():
+        # The database lookups of every pair run while the pairs are processed
+        for serial, stage, dat_path, sta_path in pairs:
+            lookups[dat_path] = ComponentLookup.for_scan(client, os.path.basename(dat_path),
+                                                         os.path.basename(sta_path))
+
+    entries = process_jobs(pairs, csv_files, args.workers, start_lookups if client is not None else None)
+    if client is not None:
+        publish(entries, args, client, lookups)
+
+    if not args.no_store:
+        store_entries(entries)
+
+    records = [entry_record(entry) for entry in entries]
+    write_records(records, args)
+
+    failed = sum(1 for record in records if record["error"] is not None)
+    logging.info(f"{len(records)} processed, {failed} failed")
+    return 1 if failed else 0
+
+def write_records(records: list, args, columns: list = None):
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+
+    if args.output == "-":
+        file = sys.stdout
+    else:
+        file = open(args.output, "w", newline="" if output_format == "csv" else None)
+    try:
+        if output_format == "csv":
+            write_csv(records, file, columns)
+        else:
+            write_jsonl(records, file)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+def run_history(args):
+    store = results_store()
+    if store is None:
+        logging.error("The local results store is turned off or cannot be opened")
+        return 1
+
+    rows = store.query(serial=args.serial, stage=args.stage, since=args.since, until=args.until,
+                       passed=args.passed, metrics=args.where,
+                       latest=args.latest, limit=args.limit)
+
+    records = [{"component_id": row["serial"],
+                "stage": row["stage"],
+                "measured_at": row["measured_at"],
+                "component_type": row["component_type"],
+                "passed": row["passed"],
+                "spec_version": row["spec_version"],
+                "files": list(row["files"].values()),
+                "results": row["results"]} for row in rows]
+    write_records(records, args, ["component_id", "stage", "measured_at", "component_type", "passed",
+                                  "spec_version", "files"])
+    logging.info(f"{len(records)} measurements")
+    return 0
+
+def cli(argv: list = None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s: %(message)s")
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(cli())
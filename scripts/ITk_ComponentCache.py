@@ -0,0 +1,146 @@
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from ITk_HTTPCache import invalidate_http_cache
+
+"""
+ComponentCache - in-memory cache of getComponent lookups shared by every tab of the program. The client
+returned by validate_login() is wrapped in a CachedClient, so the metrology, pull test, IREF and scan
+component lookups of the same serial within the TTL are answered without another round trip to the
+database. Writes that change a component (setComponentStage, uploadTestRunResults) drop its entry.
+"""
+
+# Lifetime [s] and number of cached components, both can be changed through the environment (.env file)
+COMPONENT_CACHE_TTL = float(os.environ.get("ITK_COMPONENT_CACHE_TTL", 300))
+COMPONENT_CACHE_SIZE = int(os.environ.get("ITK_COMPONENT_CACHE_SIZE", 256))
+
+# Endpoints that change the component they are posted for
+invalidating_endpoints = ("setComponentStage", "uploadTestRunResults")
+
+class ComponentCache:
+
+    def __init__(self, ttl: float = COMPONENT_CACHE_TTL, max_entries: int = COMPONENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Lookup key -> (time stored, component), least recently used first
+        self._entries = OrderedDict()
+        # Serial numbers, alternative identifiers and database codes -> lookup keys of the same component
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Cached component of the lookup key, None when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Callers get their own copy, so nothing they change leaks into the cache
+                return copy.deepcopy(entry[1])
+
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, component: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(component))
+            self._entries.move_to_end(key)
+
+            for identifier in (key[0], component.get('code'), component.get('serialNumber'),
+                               component.get('alternativeIdentifier')):
+                if identifier:
+                    self._aliases.setdefault(identifier, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, identifier: str):
+        """
+        Drops every entry of a component, by serial number, alternative identifier or database code
+        """
+        with self._lock:
+            for key in list(self._aliases.get(identifier, ())):
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        component = entry[1]
+        for identifier in (key[0], component.get('code'), component.get('serialNumber'),
+                           component.get('alternativeIdentifier')):
+            keys = self._aliases.get(identifier)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._aliases[identifier]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+class CachedClient:
+    """
+    Proxy in front of the itkdb Client - getComponent goes through the component cache, the writes
+    invalidate it and everything else is passed straight to the client
+    """
+
+    def __init__(self, client, cache: ComponentCache = None):
+        self.client = client
+        self.cache = cache if cache is not None else ComponentCache()
+
+    def get(self, endpoint, json: dict = None, fresh: bool = False, **kwargs):
+        """
+        fresh - skips both the component cache and the persistent HTTP cache, for data that must be current
+        """
+        if fresh:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Cache-Control": "no-cache"}
+
+        if endpoint != 'getComponent' or not json or "component" not in json:
+            return self.client.get(endpoint, json=json, **kwargs)
+
+        key = (json["component"], bool(json.get("alternativeIdentifier", False)))
+        component = None if fresh else self.cache.get(key)
+        if component is None:
+            component = self.client.get(endpoint, json=json, **kwargs)
+            # The cache keeps its own copy of the component
+            self.cache.put(key, component)
+        return component
+
+    def post(self, endpoint, json: dict = None, **kwargs):
+        try:
+            return self.client.post(endpoint, json=json, **kwargs)
+        finally:
+            # Dropped even if the request failed, the write may still have gone through
+            if endpoint in invalidating_endpoints and json and json.get("component"):
+                self.cache.invalidate(json["component"])
+                invalidate_http_cache(self.client, endpoint)
+                logging.debug(f"Component cache entry of {json['component']} invalidated after {endpoint}")
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def current_component(client: CachedClient, component: dict):
+    """
+    The component as it is in the database now, past both caches - for the type, location and stage
+    checks that decide whether an upload goes ahead
+    """
+    return client.get('getComponent', json={"component": component['code']}, fresh=True)
@@ -2,10 +2,21 @@
 import itkdb
 import logging
 import os
+from ITk_ComponentCache import CachedClient
+from ITk_HTTPCache import HTTP_CACHE, enable_http_cache
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QMessageBox, QApplication
 ##########################################################
 
+def new_client(**kwargs):
+    """
+    itkdb client, with the persistent response cache of the read-only lookups when ITK_HTTP_CACHE is set
+    """
+    client = itkdb.Client(**kwargs)
+    if HTTP_CACHE:
+        enable_http_cache(client)
+    return client
+
 def validate_login(db_passcode1: str, db_passcode2: str):
 
     """
@@ -18,7 +29,8 @@ def validate_login(db_passcode1: str, db_passcode2: str):
     if db_passcode1 and db_passcode2:
         try:
             u = itkdb.core.User(access_code1=db_passcode1, access_code2=db_passcode2)
-            client = itkdb.Client(user=u)
+            # Component lookups of all tabs go through the shared component cache
+            client = CachedClient(new_client(user=u))
             client.user.authenticate()
             user = client.get('getUser', json={'userIdentity': client.user.identity})
             print("Accessing ITk Database...\nHello {} {}, \nWelcome to the ITk Database".format(user["firstName"], user["lastName"]))
@@ -38,7 +50,7 @@ def validate_login(db_passcode1: str, db_passcode2: str):
     # Allows faster logging in to the database by storing both passwords in an .env file within the same directory
     elif "ITKDB_ACCESS_CODE1" in os.environ and "ITKDB_ACCESS_CODE2" in os.environ:
         try: 
-            client = itkdb.Client()
+            client = CachedClient(new_client())
             client.user.authenticate()
             user = client.get('getUser', json={'userIdentity': client.user.identity})
             print("Accessing ITk Database...\nHello {} {}, \nWelcome to the ITk Database".format(user["firstName"], user["lastName"]))
@@ -12,33 +12,38 @@ def operator_identity():
     if ok:
         return name
 
-def upload_itk(component: dict,results: dict,client: Client,csv_path):
+# Component dictionary for types and stage names
+test_dict = {"flextype": "PCB",
+            "baretype": "BARE_MODULE",
+            "assemtype": "MODULE",
+            "flexstage": "PCB_RECEPTION_MODULE_SITE",
+            "barestage": "BAREMODULERECEPTION",
+            "assemstage": "MODULE/ASSEMBLY",
+            "wirestage": "MODULE/WIREBONDING",
+            "flextest": "METROLOGY",
+            "baretest": "QUAD_BARE_MODULE_METROLOGY",
+            "assemtest": "QUAD_MODULE_METROLOGY",
+            "wiretest": "WIREBOND_PULL_TEST"}
+
+def upload_itk(component: dict,results: dict,client: Client,csv_path,operator: str = None,open_browser: bool = True):
         
     """
     Uploading fucntion that takes the component information and metrology
     results as arguments. Sets the data to test-type schemas and uploads them
     deirectly to the ITk database.
-    
+    operator - name of the operator, asked for in a dialog when not given
+    open_browser - opens the uploaded test run in the browser
+    Returns the uploaded test run, None if the upload failed
     """
 
+    if operator is None:
+        operator = operator_identity()
+
     # Date and time in ISO format for upload
     today = datetime.today().strftime('%d/%m/%Y')
     mydate = datetime.strptime(today, '%d/%m/%Y')
     datetimeobject = datetime.combine(mydate,datetime.now(timezone.utc).time())
 
-    # Component dictionary for types and stage names
-    test_dict = {"flextype": "PCB",
-                "baretype": "BARE_MODULE",
-                "assemtype": "MODULE",
-                "flexstage": "PCB_RECEPTION_MODULE_SITE",
-                "barestage": "BAREMODULERECEPTION",
-                "assemstage": "MODULE/ASSEMBLY",
-                "wirestage": "MODULE/WIREBONDING",
-                "flextest": "METROLOGY",
-                "baretest": "QUAD_BARE_MODULE_METROLOGY",
-                "assemtest": "QUAD_MODULE_METROLOGY",
-                "wiretest": "WIREBOND_PULL_TEST"}
-    
     if re.match(test_dict["flextype"], component['componentType']['code'], re.IGNORECASE):
 
         # Prearing the upload template
@@ -51,7 +56,7 @@ def upload_itk(component: dict,results: dict,client: Client,csv_path):
                     "passed": check_passed(results["flex_results"]["pass_fail"]),
                     "problems": False,
                     "properties": {
-                        "OPERATOR": operator_identity(),
+                        "OPERATOR": operator,
                         "INSTRUMENT": "Smartscope OGP",
                         "ANALYSIS_VERSION": None
                     },
@@ -84,7 +89,7 @@ def upload_itk(component: dict,results: dict,client: Client,csv_path):
                     "problems": False,
                     "properties": {
                         "ANALYSIS_VERSION": None,
-                        "OPERATOR_IDENTITY": operator_identity(),
+                        "OPERATOR_IDENTITY": operator,
                         "MEASUREMENT_DATE": datetimeobject.astimezone().isoformat(timespec='milliseconds'),
                         "MEASUREMENT_DURATION": None
                         
@@ -117,7 +122,7 @@ def upload_itk(component: dict,results: dict,client: Client,csv_path):
                     "problems": False,
                     "properties": {
                         "ANALYSIS_VERSION": None,
-                        "OPERATOR_IDENTITY": operator_identity(),
+                        "OPERATOR_IDENTITY": operator,
                         "MEASUREMENT_DATE": datetimeobject.astimezone().isoformat(timespec='milliseconds'),
                         "MEASUREMENT_DURATION": None
                     },
@@ -146,7 +151,7 @@ def upload_itk(component: dict,results: dict,client: Client,csv_path):
                     "properties": {
                         "INSTRUMENT": "Dage 4000 Plus",
                         "ANALYSIS_VERSION": None,
-                        "OPERATOR_IDENTITY": operator_identity(),
+                        "OPERATOR_IDENTITY": operator,
                         "MEASUREMENT_DATE": datetimeobject.astimezone().isoformat(timespec='milliseconds'),
                         "MEASUREMENT_DURATION": None
                     },
@@ -178,7 +183,10 @@ def upload_itk(component: dict,results: dict,client: Client,csv_path):
         return
     
     # Opening test web page
-    webbrowser.open(f"https://itkpd-test.unicorncollege.cz/testRunView?id={test_upload['testRun']['id']}",new = 2)
+    if open_browser:
+        webbrowser.open(f"https://itkpd-test.unicorncollege.cz/testRunView?id={test_upload['testRun']['id']}",new = 2)
+
+    return test_upload
 
 def auto_run_number(component,test_type,stage_list,client: Client):
 
@@ -0,0 +1,466 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from statistics import stdev, mean
+import numpy as np
+from ITk_ModuleProcessors import FlexProcessor, BareProcessor, AssemProcessor
+from ITk_Specs import specs
+
+"""
+Measurement engine - the numerical part of the metrology and pull test measurements without any Qt
+dialogs or reports. Takes the parsed scan arrays (or pull test data) with the component metadata and
+returns a MeasurementResult, or raises one of the MeasurementError types below. The GUI only renders
+what comes out of here, so the same code runs in worker processes, batch jobs and without a display.
+"""
+
+# Raised with every change of the processing or the measurements that changes their results,
+# results memoized or stored under another version are measured again
+PROCESSOR_VERSION = 1
+
+class MeasurementError(Exception):
+    """
+    Base class of every error raised by the measurement engine
+    """
+
+class SerialMismatch(MeasurementError):
+    """
+    The .DAT and .STA files belong to different components
+    """
+
+class UnknownScanType(MeasurementError):
+    """
+    The file names do not match any of the metrology scan stages
+    """
+
+class ComponentNotFound(MeasurementError):
+    """
+    The component could not be retrieved from the database
+    """
+
+class HVCapacitorError(MeasurementError):
+    """
+    The HV capacitor thickness cannot be singled out in the .STA file
+    """
+
+@dataclass
+class MeasurementResult:
+    component_id: str
+    # "flex", "bare", "assem" or "pulltest"
+    stage: str
+    # Results of the stage, as uploaded to the database and the spreadsheet
+    stage_results: dict
+    component: dict = None
+    mass: float = None
+    carrier: str = None
+    token: str = None
+
+    def to_results(self):
+        """
+        Results dictionary used across the GUI, the database upload and the spreadsheet
+        """
+        if self.stage == "pulltest":
+            results = {"pulltest": self.stage_results}
+        else:
+            results = {"flex_results": None,
+                       "bare_results": None,
+                       "assem_results": None,
+                       "mass": self.mass,
+                       "carrier": self.carrier}
+            results[f"{self.stage}_results"] = self.stage_results
+
+        results["component_id"] = self.component_id
+        results["component"] = self.component
+        results["token"] = self.token
+        return results
+
+# File name types stores in dictionary
+patterns = {"flex": r"^([a-z0-9]+)_vc3_bare_flex_metrology\.(DAT|STA)",
+            "bare": r"^([a-z0-9]+)_vc3_bare_module_metrology\.(DAT|STA)",
+            "assem": r"^([a-z0-9]+)_vc3_assembled_module_metrology\.(DAT|STA)"}
+
+# Test type holding the mass measurement of each stage
+mass_tests = {"flex": "MASS",
+              "bare": "MASS_MEASUREMENT",
+              "assem": "MASS_MEASUREMENT"}
+
+def scan_type(dat_basename: str,sta_basename: str):
+    """
+    Returns the assembly stage ("flex", "bare" or "assem") that both file names belong to, None otherwise
+    """
+    for stage, pattern in patterns.items():
+        if re.match(pattern, dat_basename, re.IGNORECASE) and re.match(pattern, sta_basename, re.IGNORECASE):
+            return stage
+    return None
+
+def fetch_component(client, component_id: str):
+    """
+    Retrieves the component from the database, raises ComponentNotFound otherwise
+    """
+    try:
+        return client.get('getComponent',
+                          json={"component":component_id,
+                                "alternativeIdentifier":False})
+    except Exception as e:
+        raise ComponentNotFound(f"Component {component_id} not found") from e
+
+def component_mass(client, component: dict, code: str):
+    """
+    Mass measurement of the component for the Google Sheet input, None if it has not been uploaded yet
+    """
+    try:
+        test_id = [item['id']
+                for element in component['tests']
+                for item in element['testRuns'][0:]
+                if element['code'] == code]
+        test_run = client.get('getTestRun',
+                                json={"testRun": test_id[0]})
+        return test_run['results'][0]['value']
+    except Exception:
+        logging.error("Mass Measurement test run has not been found in the database" \
+        "\nConsider uploading it first before updating Google Sheets")
+        return None
+
+def component_carrier(component: dict):
+    """
+    Serial number of the carrier the module is mounted on, None if it is not associated in the database
+    """
+    try:
+        return [
+            element['component']['serialNumber']
+            for element in component['children']
+            if element['type']['code'] == "CARRIER"
+        ][0]
+    except Exception:
+        logging.info("The carrier serial number is not associated with the module in the database\n" \
+        "Consider updating this information before uploading to Google Sheets")
+        return None
+
+# Threads running the database lookups next to the parsing and processing
+lookup_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="itkdb-lookup")
+
+class ComponentLookup:
+    """
+    Component and mass lookups of a serial started in the background as soon as the serial is known,
+    so the database round trips overlap with parsing and processing the scan
+    """
+
+    def __init__(self, client, component_id: str, stage: str = None):
+        self.component = lookup_pool.submit(fetch_component, client, component_id)
+        self.mass = None
+        if stage in mass_tests:
+            self.mass = lookup_pool.submit(self._mass, client, mass_tests[stage])
+
+    def _mass(self, client, code: str):
+        # Queued after the component lookup, so waiting for it cannot block the pool
+        try:
+            component = self.component.result()
+        except ComponentNotFound:
+            return None
+        return component_mass(client, component, code)
+
+    @classmethod
+    def for_scan(cls, client, dat_basename: str, sta_basename: str):
+        """
+        Lookups of a .DAT/.STA pair, None for files that measure_scan() rejects anyway
+        """
+        if client is None or dat_basename[:14] != sta_basename[:14]:
+            return None
+        return cls(client, dat_basename[:14], scan_type(dat_basename, sta_basename))
+
+def measure_scan(new_dat,new_sta: list,dat_basename: str,sta_basename: str,client=None,
+                 component: dict = None,stage_results: dict = None,lookup: ComponentLookup = None):
+    """
+    Metrology measurement of a parsed .DAT/.STA pair.
+    client - database client for the component, mass and carrier lookups, without it (and without
+    component) only the stage results are filled in
+    component - component already retrieved from the database, skips the getComponent call
+    stage_results - results already computed for these files, the scan is then not processed again
+    lookup - ComponentLookup started before the files were parsed, takes the place of the client lookups
+    """
+    component_id = dat_basename[:14]
+    if component_id != sta_basename[:14]:
+        raise SerialMismatch(f"{dat_basename} and {sta_basename} do not belong to the same component")
+
+    stage = scan_type(dat_basename, sta_basename)
+    if stage is None:
+        raise UnknownScanType(f"{dat_basename} and {sta_basename} are not metrology scans of the same stage")
+
+    if lookup is None and component is None and client is not None:
+        lookup = ComponentLookup(client, component_id, stage)
+
+    if stage_results is None:
+        try:
+            stage_results = stage_measurements[stage](new_dat, new_sta)
+        except MeasurementError:
+            # A missing component is reported first, as when it was looked up before processing
+            if lookup is not None:
+                lookup.component.result()
+            raise
+
+    if lookup is not None:
+        component = lookup.component.result()
+
+    result = MeasurementResult(component_id, stage, stage_results, component)
+
+    if lookup is not None and lookup.mass is not None:
+        result.mass = lookup.mass.result()
+    elif client is not None:
+        result.mass = component_mass(client, component, mass_tests[stage])
+    if stage == "assem" and component is not None:
+        result.carrier = component_carrier(component)
+
+    return result
+
+def measure_pulltest(pull_data: dict,csv_basename: str,client=None,component: dict = None,stage_results: dict = None):
+    """
+    Pull test measurement of the parsed pull test data, with the component lookup as in measure_scan()
+    """
+    if component is None and client is not None:
+        component = fetch_component(client, csv_basename)
+
+    if stage_results is None:
+        stage_results = pulltest_measurements(pull_data)
+
+    return MeasurementResult(csv_basename, "pulltest", stage_results, component, token="token")
+
+def flex_measurements(new_dat,new_sta: list):
+    """
+    Bare flex metrology from the parsed .DAT points and .STA rows, without any database lookups or dialogs.
+    Raises HVCapacitorError when the HV capacitor thickness cannot be singled out in the .STA file
+    """
+
+    processor = FlexProcessor(new_dat)
+    processor.process_all()
+
+    # Standard deviation of the pick up points
+    avg_stdev = processor.stats["quad_data"].stdev
+
+    y_dimension = new_sta[-1][0]
+    x_dimension = new_sta[-2][0]
+    ga_thickness = [row[2] for row in new_sta[-9:-5] if row[2] < 1.300]
+    avg_thickness = round(mean(ga_thickness),4)
+    ftm_flex_thickness = new_sta[-10][2]
+    hv_thickness_list = [row[2] for row in new_sta[-13:-10] if row[2] > ftm_flex_thickness]
+
+    # Ensuring that there is only one value pulled from the list which corresponds to the HV cap
+    if len(hv_thickness_list) == 1:
+        hv_thickness = hv_thickness_list[0]
+    else:
+        raise HVCapacitorError("HV capacitor thickness does not contain exactly one element in the .STA file\n\nPlease check the file")
+
+    # X-Y envelope, HV cap, individual pick-up point thickness and FTM checked against the flex specification
+    checks = specs["flex"].check({"x_dimension": x_dimension,
+                                  "y_dimension": y_dimension,
+                                  "hv_thickness": hv_thickness,
+                                  "ga_thickness": ga_thickness,
+                                  "ftm_flex_thickness": ftm_flex_thickness})
+    flex_pass_fail = specs["flex"].pass_fail(checks)
+    xy_envelope = checks["xy_envelope"]
+    hv_envelope = checks["hv_envelope"]
+
+    return {"pass_fail": flex_pass_fail,
+            "avg_thickness": round(avg_thickness,3),
+            "quad_thickness": ga_thickness,
+            "ftm_flex_thickness": ftm_flex_thickness,
+            "hv_thickness": hv_thickness,
+            "hv_envelope": hv_envelope,
+            "avg_stdev": round(avg_stdev,4),
+            "xy_envelope": xy_envelope,
+            "x_dimension": x_dimension,
+            "y_dimension": y_dimension}
+
+def bare_measurements(new_dat,new_sta: list):
+    """
+    Bare module metrology from the parsed .DAT points and .STA rows, without any database lookups or dialogs
+    """
+
+    processor = BareProcessor(new_dat)
+    processor.process_all()
+
+    # Standard deviations for the sensor and FE chips
+    avg_stdev_fe = processor.stats["fe_data"].stdev
+    avg_stdev_bare = processor.stats["sensor_data"].stdev
+
+    avg_bare_thickness = [float(val)*1000 for val in new_sta[-1]][0]
+    avg_fe_thickness = [float(val)*1000 for val in new_sta[-3]][0]
+    fe_y = new_sta[-5][0]
+    fe_x = new_sta[-6][0]
+    sensor_y = new_sta[-7][0]
+    sensor_x = new_sta[-8][0]
+
+    # Pass/Fail criteria of the bare module specification
+    bare_pass_fail = specs["bare"].pass_fail(specs["bare"].check({"fe_x": fe_x,
+                                                                  "fe_y": fe_y,
+                                                                  "sensor_x": sensor_x,
+                                                                  "sensor_y": sensor_y,
+                                                                  "avg_bare_thickness": avg_bare_thickness,
+                                                                  "avg_fe_thickness": avg_fe_thickness}))
+
+    return {"pass_fail": bare_pass_fail,
+            "avg_bare_thickness": round(avg_bare_thickness),
+            "avg_stdev_bare": round(avg_stdev_bare*1000,3),
+            "fe_x": fe_x,
+            "fe_y": fe_y,
+            "avg_fe_thickness": round(avg_fe_thickness),
+            "avg_stdev_fe": round(avg_stdev_fe*1000,3),
+            "sensor_x": sensor_x,
+            "sensor_y": sensor_y}
+
+def assem_measurements(new_dat,new_sta: list):
+    """
+    Assembled module metrology from the parsed .DAT points and .STA rows, without any database lookups or dialogs
+    """
+
+    # removing the last row in the list if it doesn't equal to 1 element
+    # affects automated value fetching from the data set
+    if len(new_sta[-1]) != 1:
+        new_sta = new_sta[:-1]
+
+    processor = AssemProcessor(new_dat)
+    processor.process_all()
+
+    # Standard deviation of the pick up points
+    quad_stdev_all = round(processor.stats["assem_quad"].stdev*1000,2)
+
+    ftm_thickness = [float(val)*1000 for val in new_sta[-1]][0]
+    hv_assem_thickness = [float(val)*1000 for val in new_sta[-2]][0]
+    fiducial_br = new_sta[-3][:2]
+    fiducial_tl = new_sta[-4][:2]
+    avg_assem_thickness = [float(row[2])*1000 for row in new_sta[-15:-11] if row[2] < 0.800]
+    x_value = [float(val) for val in new_sta[-7] if len(new_sta[-7]) == 1][0]
+    y_value = [float(val) for val in new_sta[-6] if 40.0 < val < 42.0][0]
+
+    # Modified fiducial values to be in µm units
+    fiducial_br_micro = [round(fp*1000) for fp in fiducial_br]
+    fiducial_tl_micro = [round(fp*1000) for fp in fiducial_tl]
+
+    # Pass/Fail criteria of the assembled module specification
+    assem_pass_fail = specs["assem"].pass_fail(specs["assem"].check({"ftm_thickness": ftm_thickness,
+                                                                     "hv_assem_thickness": hv_assem_thickness,
+                                                                     "avg_assem_thickness": avg_assem_thickness,
+                                                                     "fiducial_br_x": fiducial_br[0],
+                                                                     "fiducial_br_y": fiducial_br[1],
+                                                                     "fiducial_tl_x": fiducial_tl[0],
+                                                                     "fiducial_tl_y": fiducial_tl[1],
+                                                                     "x_value": x_value,
+                                                                     "y_value": y_value}))
+
+    return {"pass_fail": assem_pass_fail,
+            "avg_assem_thickness": avg_assem_thickness,
+            "fiducial_br": fiducial_br_micro,
+            "fiducial_tl": fiducial_tl_micro,
+            "hv_assem_thickness": hv_assem_thickness,
+            "ftm_thickness": ftm_thickness,
+            "quad_stdev_all": quad_stdev_all,
+            "x_value": x_value,
+            "y_value": y_value}
+
+stage_measurements = {"flex": flex_measurements,
+                      "bare": bare_measurements,
+                      "assem": assem_measurements}
+
+def pulltest_measurements(pull_data: dict):
+    """
+    Wire pull test results from the parsed pull strengths [g] and failure grades, evaluated on the arrays
+    """
+
+    pulls = np.asarray(pull_data["pull"], dtype=np.float64)
+    grades = np.asarray(pull_data["grade"], dtype=np.float64)
+    val_pull_list = pulls.tolist()
+    n_wires = len(grades)
+
+    # Taking a mean average value and standard deviation - statistics keeps the exact rounding the
+    # limits were set with, the summation of a few dozen wires costs nothing next to the rest
+    mean_pull = mean(val_pull_list)
+    standard_deviation = stdev(val_pull_list)
+
+    # Obtaining values that break before 5g strength
+    before5g_wires = pulls[pulls < 5.0].tolist()
+    before5g_count = len(before5g_wires)
+    if before5g_count == 0:
+        before5g_wires = 0
+
+    # Minimum and maximum values
+    minimum_pull = float(pulls.min())
+    maximum_pull = float(pulls.max())
+
+    # Failure type of the upload and number of wires of every grade
+    grade_webApp, grade_values = map_grades(grades)
+    codes = grade_webApp.astype(np.int64)
+    integral = (codes == grade_webApp) & (codes >= 0)
+    grade_counts = np.bincount(codes[integral], minlength=5)
+
+    # Pull location (GA1, GA2 or GA3) of every wire
+    pull_location = pull_locations(grade_webApp)
+
+    # {[x1,y1,z1],[x2,y2,z2]...} where x = pull strength, failure type integer, pull location
+    pull_strength_data = [[[x],[y],[z]] for x,y,z in zip(val_pull_list,grade_values,pull_location.tolist())]
+
+    # Percentage of specific grade pulls
+    percentage_2 = (int(grade_counts[2])/n_wires)*100
+    percentage_1 = (int(grade_counts[1])/n_wires)*100
+    percentage_3or4 = (int(grade_counts[3] + grade_counts[4])/n_wires)*100
+
+    # Percentage of bondpeels less that 7g
+    bondpeel = (grade_webApp == 3) | (grade_webApp == 4)
+    bondpeel_less7 = int(np.count_nonzero(bondpeel & (pulls < 7.0)))
+    if bondpeel_less7 == 0:
+        percentage_less7 = float(0.0)
+    else:
+        percentage_less7 = (bondpeel_less7/n_wires)*100
+
+    # Pass/Fail criteria of the pull test specification
+    pull_pass_fail = specs["pulltest"].pass_fail(specs["pulltest"].check({"mean_pull": mean_pull,
+                                                                          "standard_deviation": standard_deviation,
+                                                                          "before5g_count": before5g_count,
+                                                                          "percentage_3or4": percentage_3or4}))
+
+    return {"pass_fail": pull_pass_fail,
+            "mean_pull": round(mean_pull,3),
+            "standard_deviation": round(standard_deviation,3),
+            "before5g_wires": before5g_wires,
+            "minimum_pull": round(minimum_pull,3),
+            "maximum_pull": round(maximum_pull,3),
+            "percentage_2": round(percentage_2,2),
+            "percentage_1": round(percentage_1,2),
+            "percentage_3or4": round(percentage_3or4,2),
+            "percentage_less7": round(percentage_less7,2),
+            "numberofwires": n_wires,
+            "pull_strength_data": pull_strength_data}
+
+def map_grades(grades):
+    """
+    grade_mapping() over an array of grades - returns the mapped grades as an array and as a list
+    of the same int/float values grade_mapping() gives, which end up in the upload
+    """
+    grades = np.asarray(grades, dtype=np.float64)
+    shifted = grades >= 4
+    mapped = np.where(shifted, grades - 1, np.where(grades == 3, 0, np.trunc(grades)))
+    values = [value if float_value else int(value) for value, float_value in zip(mapped.tolist(), shifted.tolist())]
+    return mapped, values
+
+def pull_locations(grade_webApp):
+    """
+    Pull location of every wire from the mapped grades - the first 10 wires are pulled on GA1 and the
+    next 5 on GA2, each shifted back by the wires graded 5 in their group, the rest on GA3
+    """
+    grade_webApp = np.asarray(grade_webApp)
+    five_count_1 = int(np.count_nonzero(grade_webApp[:10] == 5))
+    five_count_2 = int(np.count_nonzero(grade_webApp[10-five_count_1:15-five_count_1] == 5))
+
+    wire = np.arange(len(grade_webApp))
+    return 1 + (wire >= 10-five_count_1) + (wire >= 15-(five_count_1+five_count_2))
+
+def grade_mapping(grade):
+    """
+    Method designed to change the grading criteria for the upload
+    and map it to the original grade list above
+    """
+
+    if grade >= 4:
+        return grade - 1
+    elif grade == 3:
+        return 0
+    else:
+        return int(grade)
@@ -2,7 +2,7 @@ import logging
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-from ITk_Importers import acquire_data 
+from ITk_Importers import acquire_array
 import os 
 import re
 from ITk_ModuleProcessors import *
@@ -11,7 +11,7 @@ from PySide6.QtCore import Qt
 
 def graph_plot(dat_path):
     
-    plot_data = acquire_data(dat_path)
+    plot_data = acquire_array(dat_path)
     file_basename = os.path.basename(dat_path)
     component_id = file_basename[:14]
 
@@ -28,7 +28,7 @@ def graph_plot(dat_path):
         z2 = process_points[:-3,2]
 
         # Unprocessed data and points
-        points = np.array(plot_data)
+        points = plot_data
 
         x = points[:-3,0]
         y = points[:-3,1]
@@ -47,8 +47,7 @@ def graph_plot(dat_path):
         y2 = process_points[0:,1]
         z2 = process_points[0:,2]
 
-        points_data = [row for row in plot_data if row[1] > 0.0 and row[2] > 50.0]
-        points = np.array(points_data)
+        points = plot_data[(plot_data[:,1] > 0.0) & (plot_data[:,2] > 50.0)]
         
         x = points[0:,0]
         y = points[0:,1]
@@ -66,7 +65,7 @@ def graph_plot(dat_path):
         y2 = process_points[0:,1]
         z2 = process_points[0:,2]
 
-        points = np.array(plot_data)
+        points = plot_data
 
         x = points[0:,0]
         y = points[0:,1]
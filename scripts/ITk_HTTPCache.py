@@ -0,0 +1,173 @@
+import logging
+import os
+import shutil
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from cachecontrol.caches.file_cache import FileCache
+from cachecontrol.heuristics import ExpiresAfter
+from itkdb.caching import CacheControlAdapter, CacheController
+from itkdb.caching import utils
+
+"""
+Persistent HTTP response cache for the read-only ITk database endpoints. Opt-in through ITK_HTTP_CACHE=1
+(.env file): the itkdb client then keeps the responses of the component, test run, user and test type
+lookups on disk for ITK_HTTP_CACHE_EXPIRES seconds, across restarts, keyed on the endpoint and the request
+body. Entries are grouped by endpoint so writes can drop the lookups they outdate, the directory is kept
+under ITK_HTTP_CACHE_MAX_BYTES and expired entries are still served when the database cannot be reached.
+A request sent with the "Cache-Control: no-cache" header (client.get(..., fresh=True)) bypasses it.
+"""
+
+HTTP_CACHE = os.environ.get("ITK_HTTP_CACHE", "0").lower() in ("1", "true", "yes")
+HTTP_CACHE_DIR = os.environ.get("ITK_HTTP_CACHE_DIR",
+                                os.path.join(os.path.expanduser("~"), ".cache", "itk_metrologist", "http"))
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("ITK_HTTP_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HTTP_CACHE_EXPIRES = int(os.environ.get("ITK_HTTP_CACHE_EXPIRES", 3600))
+
+# Endpoints whose responses only change through the writes that invalidate them
+cacheable_endpoints = {"getComponent",
+                       "getTestRun",
+                       "getUser",
+                       "getComponentTypeByCode",
+                       "getTestTypeByCode",
+                       "listTestTypes"}
+
+# Writes and the cached endpoints they outdate
+invalidated_by = {"setComponentStage": ("getComponent",),
+                  "uploadTestRunResults": ("getComponent",)}
+
+def request_endpoint(url: str):
+    return urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+class EndpointFileCache(FileCache):
+    """
+    FileCache with one directory per endpoint and a byte limit. Entries are never deleted by CacheControl
+    itself (forever), expired ones stay available for the offline fallback until evicted or overwritten
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 evict_every: int = 20):
+        super().__init__(directory, forever=True)
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+
+    def _fn(self, name: str):
+        hashed = self.encode(name)
+        return os.path.join(self.directory, request_endpoint(name) or "_", hashed[:2], hashed)
+
+    def get(self, key: str):
+        data = super().get(key)
+        if data is not None:
+            # Marks the entry as recently used for the eviction order
+            try:
+                os.utime(self._fn(key))
+            except OSError:
+                pass
+        return data
+
+    def set(self, key: str, value: bytes, expires=None):
+        super().set(key, value, expires)
+        self._writes += 1
+        if self._writes % self.evict_every == 1:
+            self.evict()
+
+    def entries(self):
+        """
+        Cached responses as (last used time, path, bytes), oldest first
+        """
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".lock"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes the least recently used responses until the cache fits within max_bytes
+        """
+        entries = self.entries()
+        total = sum(entry[2] for entry in entries)
+
+        for last_used, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear_endpoint(self, endpoint: str):
+        shutil.rmtree(os.path.join(self.directory, endpoint), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class ReadOnlyCacheAdapter(CacheControlAdapter):
+    """
+    itkdb cache adapter that only stores the responses of cacheable_endpoints
+    and falls back to the stored response when the database cannot be reached
+    """
+
+    def build_response(self, request, response, from_cache=False, cacheable_methods=None):
+        if not from_cache and request_endpoint(request.url) not in cacheable_endpoints:
+            # Passed on without being stored
+            resp = HTTPAdapter.build_response(self, request, response)
+            resp.from_cache = False
+            return resp
+        return super().build_response(request, response, from_cache, cacheable_methods)
+
+    def send(self, request, *args, **kwargs):
+        if request_endpoint(request.url) not in cacheable_endpoints:
+            # Neither looked up nor stored
+            return HTTPAdapter.send(self, request, *args, **kwargs)
+        try:
+            return super().send(request, *args, **kwargs)
+        except requests.ConnectionError:
+            if request.method != "GET":
+                raise
+            response = self.stored_response(request)
+            if response is None:
+                raise
+            logging.warning(f"ITk database unreachable, using the stored {request_endpoint(request.url)} response")
+            return response
+
+    def stored_response(self, request):
+        """
+        Stored response of a request regardless of its age, None if there is none
+        """
+        data = self.cache.get(self.controller.cache_url(utils.build_url(request)))
+        if data is None:
+            return None
+        response = self.controller.serializer.loads(request, data)
+        if response is None:
+            return None
+        return self.build_response(request, response, from_cache=True)
+
+def enable_http_cache(client, cache: EndpointFileCache = None, expires: int = HTTP_CACHE_EXPIRES):
+    """
+    Mounts the persistent cache on an itkdb client in place of its default one
+    """
+    cache = cache if cache is not None else EndpointFileCache()
+    client.mount(client.prefix_url,
+                 ReadOnlyCacheAdapter(controller_class=CacheController,
+                                      cache=cache,
+                                      heuristic=ExpiresAfter(seconds=expires)))
+    return client
+
+def invalidate_http_cache(client, endpoint: str):
+    """
+    Drops the cached endpoints outdated by a write to endpoint, if the client has the persistent cache
+    """
+    adapter = getattr(client, "adapters", {}).get(getattr(client, "prefix_url", None))
+    if isinstance(adapter, ReadOnlyCacheAdapter) and isinstance(adapter.cache, EndpointFileCache):
+        for cached_endpoint in invalidated_by.get(endpoint, ()):
+            adapter.cache.clear_endpoint(cached_endpoint)
@@ -1,9 +1,12 @@
 import logging
 import os
 import csv
+import mmap
+import numpy as np
 
 from PySide6.QtWidgets import QFileDialog, QMessageBox, QApplication, QLineEdit, QLabel
 from PySide6.QtCore import Qt
+from ITk_ScanCache import scan_cache
 
 def import_file(dat_text: QLineEdit,sta_text: QLineEdit,dat_label: QLabel,sta_label: QLabel):
 
@@ -99,17 +102,14 @@ def csv_import(csv_text: QLineEdit,csv_label: QLabel):
 
     """
     Function that imports .CSV files for wirebond pull test analysis.
-    Processes the file through a csv-reader, returns a seperate outfile 
-    that is used for obtaining data, and appends data points to a list for
-    better handling.
+    Reads the file in a single pass through read_pulltest() and returns the typed
+    pull test columns together with the component ID for better handling.
     """
 
     csv_basename = None
 
-    # New processed list for data analysis
-    csv_list = []
-    # Processed file to read from for analsysis
-    csv_new = "Processed ATLAS-Pixel Sample.csv"
+    # Typed pull test columns for data analysis
+    pull_data = {}
 
     choose_csv = QFileDialog.getOpenFileName(None, "Select a .CSV file", "", "CSV files (*.csv);;All files (*.*)")
 
@@ -125,25 +125,16 @@ def csv_import(csv_text: QLineEdit,csv_label: QLabel):
             QApplication.setAttribute(Qt.ApplicationAttribute.AA_DontUseNativeDialogs, False)
             csv_path = QFileDialog.getOpenFileName(None, "Select a .CSV file", "", "CSV files (*.csv);;All files (*.*)")
         else:
-            # Reading the csv file and creating a new output csv with new filtering settings 
-            with open(csv_path[0], 'r', newline='') as infile, open(csv_new, 'w', newline='') as outfile:
-                reader = csv.reader(infile, quotechar='"')
-                writer = csv.writer(outfile, quoting=csv.QUOTE_NONE, escapechar='\\')
-
-                for row in reader:
-                    writer.writerow(row)
-
-            # Removing end of line characters and seperating elements by comma
-            with open(csv_new) as file:
-                for line in file:
-                    line_list = line.rstrip().split(",")
-                    # Appending filtered data to a new list above
-                    csv_list.append(line_list)
-
             # Retriveting component ID and displaying it in the text widget on Page 2B
 
             try:
-                csv_basename = [row[1] for row in csv_list[3:6] if row[0] == "Object ID"]
+                object_id, grades, pulls = read_pulltest(csv_path[0])
+                if object_id is None:
+                    raise ValueError("Object ID not found in the file header")
+
+                pull_data = {"grade": grades,
+                             "pull": pulls}
+                csv_basename = [object_id]
                 csv_label.hide()
                 csv_text.setReadOnly(False) 
                 csv_text.clear()          
@@ -165,13 +156,42 @@ def csv_import(csv_text: QLineEdit,csv_label: QLabel):
                                         QMessageBox.Ok)
                     QApplication.setAttribute(Qt.ApplicationAttribute.AA_DontUseNativeDialogs, False)
                     csv_path = ""
-                    csv_list = ""
+                    pull_data = ""
                     csv_basename = ""
                     csv_text.setReadOnly(False)     
                     csv_text.clear()           
                     csv_text.setReadOnly(True) 
             
-            return csv_list, csv_basename, csv_path
+            return pull_data, csv_basename, csv_path
+
+def read_pulltest(file_name):
+
+    """
+    read_pulltest(Dage 4000 .CSV file) - single pass parser for the wirebond pull test export.
+    Reads the file straight from disk without writing any intermediate file, takes the Object ID
+    from the header and the grade and pull force of every TEST row into float64 arrays.
+    Returns the object ID (None if missing), grades and pull forces [g].
+    """
+
+    object_id = None
+    grades = []
+    pulls = []
+
+    with open(file_name, 'r', newline='') as file:
+        for row_number, row in enumerate(csv.reader(file, quotechar='"')):
+
+            if not row:
+                continue
+
+            # The Object ID sits in the header rows, the TEST rows start after the summary block
+            if 3 <= row_number < 6 and row[0] == "Object ID" and object_id is None:
+                object_id = row[1].strip()
+
+            elif row_number >= 19 and row[0] == "TEST":
+                grades.append(row[2])
+                pulls.append(row[3])
+
+    return object_id, np.array(grades, dtype=np.float64), np.array(pulls, dtype=np.float64)
 
 def acquire_data(file_name):
 
@@ -180,42 +200,169 @@ def acquire_data(file_name):
     any lines that do not have all x, y and z components. The filtered data is then returned upon calling
     the function.
 
-    """        
-    acq_data = []
+    Kept for callers that expect nested lists, the parsing itself is done in bulk by acquire_array()
+    """
+
+    if os.path.splitext(file_name)[1] == ".DAT":
+        return acquire_array(file_name).tolist()
+
+    elif os.path.splitext(file_name)[1] == ".STA":
+        values, offsets = acquire_array(file_name)
+        return [row.tolist() for row in sta_rows(values, offsets)]
 
-    with open(file_name, "r") as file:
-        lines = file.readlines()
+    else:
+        raise ValueError(f"File formatting error - {os.path.basename(file_name)} is not a .DAT or .STA file")
 
-        for line_number,line in enumerate(lines):
+def acquire_array(file_name, use_cache: bool = True, hasher=None):
+
+    """
+    acquire_array(imported file) - array version of acquire_data() with the same filtering rules.
+    Returns a contiguous (N, 3) float64 array of x, y and z points for a .DAT file, and a flat
+    array of values with row offsets for a .STA file (see sta_rows() for the ragged view).
+    Parsed .DAT scans are kept in the on-disk scan cache and memory mapped (read-only) when reopened,
+    hasher is the content hash function of the cache lookup (see ScanCache.fetch)
+    """
 
-            line_new = line.rstrip()    # removes all escape/end of line characters at end of line
-            if line_new == "" :
-                continue                # ignores all empty lines
+    if os.path.splitext(file_name)[1] == ".DAT":
+        if use_cache:
+            return scan_cache.fetch(file_name, read_dat, hasher)
+        return read_dat(file_name)
 
-            if os.path.splitext(file_name)[1] == ".DAT":
+    elif os.path.splitext(file_name)[1] == ".STA":
+        with open(file_name, "rb") as file:
+            return parse_sta_bytes(file.read())
 
-                line_list = line_new.split() # splits elements by empty white spaces
+    else:
+        raise ValueError(f"File formatting error - {os.path.basename(file_name)} is not a .DAT or .STA file")
 
-                if len(line_list) != 3:
-                    continue                 # ignores all lines which don't have 3 elements
+def read_dat(file_name):
 
-                if line_list == [',HV', 'Capacitor', '(RHS)']:
-                    continue
+    """
+    Parses a whole .DAT file into an (N, 3) array, assembled from the memory-mapped chunks
+    so the file text is never held in memory as a whole
+    """
 
-            elif os.path.splitext(file_name)[1] == ".STA":
+    blocks = list(iter_dat_chunks(file_name))
+    if not blocks:
+        return np.empty((0, 3), dtype=np.float64)
+    return np.concatenate(blocks)
 
-                if line_number == 0:            # skip the first line that contains letter characters
-                    continue
+# Size of the byte chunks the .DAT files are tokenized in (4 MiB)
+CHUNK_SIZE = 4 * 1024 * 1024
 
-                line_list = line_new.split(',') # splits elements by comma
-                while "" in line_list: 
-                    line_list.remove("")        # ignores empty spaces at the end of each line as a result of file formatting
-                
-            else:
-                print("File formatting error")
+def iter_dat_chunks(file_name, chunk_size: int = CHUNK_SIZE):
 
-            # Appending a filtered list to a new list and return the data upon calling the fucntion
-            line_list_numbered = [float(element) for element in line_list]
-            acq_data.append(line_list_numbered) 
-    
-    return acq_data
\ No newline at end of file
+    """
+    iter_dat_chunks(imported file) - memory-mapped reader for very large .DAT files.
+    Tokenizes the file in fixed-size chunks cut at the last line break of each chunk and
+    yields the points of every chunk as an (n, 3) float64 array, so the peak memory is
+    bounded by the chunk size rather than by the size of the file.
+    """
+
+    with open(file_name, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            start = 0
+            while start < size:
+                stop = min(start + chunk_size, size)
+
+                if stop < size:
+                    # Never split a line between two chunks
+                    cut = max(view.rfind(b"\n", start, stop), view.rfind(b"\r", start, stop))
+                    if cut == -1:
+                        # A single line longer than the chunk, read up to its end
+                        cut = view.find(b"\n", stop)
+                    stop = size if cut == -1 else cut + 1
+
+                block = parse_dat_bytes(view[start:stop])
+                if len(block):
+                    yield block
+
+                start = stop
+
+# Marker line found in between the point blocks of the .DAT files
+HV_MARKER = [b",HV", b"Capacitor", b"(RHS)"]
+
+def parse_dat_bytes(raw: bytes):
+
+    """
+    Parses the raw bytes of a .DAT file in bulk. Instead of splitting every line in Python,
+    the whitespace tokens are counted per line on a byte array, only the lines with exactly
+    3 elements are kept and their text is converted to floats in a single call.
+    """
+
+    if not raw:
+        return np.empty((0, 3), dtype=np.float64)
+
+    buf = np.frombuffer(raw, dtype=np.uint8)
+
+    # Carriage returns are treated as line breaks so \r\n, \n and \r files are all read alike
+    newline = (buf == 10) | (buf == 13)
+    space = newline | (buf == 32) | (buf == 9) | (buf == 11) | (buf == 12)
+
+    # Line number of each byte, the line break belongs to the line it ends
+    line_id = np.cumsum(newline) - newline
+    n_lines = int(line_id[-1]) + 1
+
+    # A token starts on every non-space byte preceded by a space or the start of the file
+    starts = ~space
+    starts[1:] &= space[:-1]
+    tokens = np.bincount(line_id[starts], minlength=n_lines)
+
+    # Ignores all empty lines and all lines which don't have 3 elements
+    keep_line = tokens == 3
+
+    # Ignores the HV capacitor marker, only checked on the few lines that contain a comma
+    line_ends = np.flatnonzero(newline)
+    for line in np.unique(line_id[buf == 44]):
+        if keep_line[line]:
+            start = line_ends[line - 1] + 1 if line > 0 else 0
+            stop = line_ends[line] if line < len(line_ends) else len(raw)
+            if raw[start:stop].split() == HV_MARKER:
+                keep_line[line] = False
+
+    kept = buf[keep_line[line_id]]
+    if kept.size == 0:
+        return np.empty((0, 3), dtype=np.float64)
+
+    return np.array(kept.tobytes().split(), dtype=np.float64).reshape(-1, 3)
+
+def parse_sta_bytes(raw: bytes):
+
+    """
+    Parses the raw bytes of a .STA file. The first line contains letter characters and is skipped,
+    every other line is split by commas with the empty elements at the end of each line ignored.
+    Returns a flat float64 array of all values and the offsets of each row within it.
+    """
+
+    lengths = []
+    elements = []
+
+    for line_number, line in enumerate(raw.splitlines()):
+
+        line_new = line.rstrip()
+        if line_number == 0 or line_new == b"":
+            continue
+
+        line_list = [element for element in line_new.split(b",") if element != b""]
+
+        lengths.append(len(line_list))
+        elements.extend(line_list)
+
+    values = np.array(elements, dtype=np.float64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return values, offsets
+
+def sta_rows(values, offsets):
+
+    """
+    Ragged-row view of a parsed .STA file - a list of array views, one per row, so that the
+    usual indexing such as new_sta[-1][0] or row[2] keeps working without copying the values
+    """
+
+    return [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
@@ -1,8 +1,12 @@
 import logging
 from PySide6.QtGui import QTextCursor
-from PySide6.QtCore import QTimer
+from PySide6.QtCore import QObject, Qt, Signal
 from PySide6.QtWidgets import QTextEdit
 
+class LogSignal(QObject):
+    # Carries the formatted records to the GUI thread
+    message = Signal(str)
+
 class TextHandler(logging.Handler): 
 
     """
@@ -17,17 +21,22 @@ class TextHandler(logging.Handler):
         logging.Handler.__init__(self)
         self.setFormatter(logging.Formatter(format))
         self.text = text
+        # Queued connection - records logged from the lookup and watcher threads are appended
+        # by the GUI thread, the same way as the records of the GUI thread itself
+        self.signal = LogSignal()
+        self.signal.message.connect(self.append, Qt.ConnectionType.QueuedConnection)
     
     # Emit method that takes the logRecord, format's it with the set format template,
     # and is inserted on instant schedule to the text widget
     def emit(self, record):
         message = self.format(record)   
-        def append():
-            self.text.setReadOnly(False)
-            self.text_insert(f"{message}\n",line = 1,column = 0, at_end = True)
-            self.text.setReadOnly(True)  
-            self.text.moveCursor(QTextCursor.End)
-        QTimer.singleShot(0, append)
+        self.signal.message.emit(message)
+
+    def append(self, message):
+        self.text.setReadOnly(False)
+        self.text_insert(f"{message}\n",line = 1,column = 0, at_end = True)
+        self.text.setReadOnly(True)  
+        self.text.moveCursor(QTextCursor.End)
 
     def text_insert(self, text, line = None, column = None, at_end = False):
         cursor = self.text.textCursor()
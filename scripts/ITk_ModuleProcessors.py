@@ -1,159 +1,208 @@
 """
 (Flex/Bare/Assem)Processor - classes designed for processing raw data from .DAT metrology files of
-the bare flex, bare module and assembled module. They contain methods of extracting data slices for each
-required component parts and filtering out data points that are out of specs i.e. contaminants that do not
-correspond to the actual component.
+the bare flex, bare module and assembled module. They extract the data slices of each required component
+part, as specified in the region table of ITk_Regions, and filter out data points that are out of specs
+i.e. contaminants that do not correspond to the actual component.
+Regions of very large scans are filtered in parallel worker processes that share the scan through shared memory.
 """
-from statistics import median
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from ITk_Regions import Region, RegionClassifier, regions, aggregates
+from ITk_Statistics import RunningStats
+
+# Scans with fewer points are processed in the calling process, starting the workers costs more than it saves
+PARALLEL_MIN_POINTS = int(os.environ.get("ITK_PARALLEL_MIN_POINTS", 2_000_000))
+# Worker processes of the region processing, 1 turns the parallel processing off
+REGION_WORKERS = int(os.environ.get("ITK_REGION_WORKERS", os.cpu_count() or 1))
 
 def process_template(valid_rows,valid_row_inf):
 
-    if not valid_rows:
-        raise ValueError(f"No valid rows found with {valid_row_inf} in the given data range.")
-    
-    # Median Absolute Deviation
-    z_values = [row[2] for row in valid_rows]
-    m = median(z_values)
-    mad = median(abs(z - m) for z in z_values)
+    """
+    Median Absolute Deviation filter of a region - keeps the rows whose z value lies within
+    3 MADs of the median. Returns the kept z values and the kept rows as arrays.
+    """
 
-    row2_data = [row[2] for row in valid_rows if abs(row[2] - m) <= 3 * mad]
-    all_data = [row for row in valid_rows if abs(row[2] - m) <= 3 * mad]
+    if len(valid_rows) == 0:
+        raise ValueError(f"No valid rows found with {valid_row_inf} in the given data range.")
 
-    return row2_data, all_data
+    valid_rows = np.asarray(valid_rows, dtype=np.float64)
+    z_values = valid_rows[:, 2]
+
+    # A single mask gives both the z values and the rows
+    within = mad_within(z_values)
+
+    return z_values[within], valid_rows[within]
+
+def mad_within(z_values):
+    """
+    Median Absolute Deviation mask - True for the z values within 3 MADs of the median
+    """
+    deviation = np.abs(z_values - np.median(z_values))
+    mad = np.median(deviation)
+    return deviation <= 3 * mad
+
+def region_worker(data_name: str,kept_name: str,shape: tuple,column: int,n_regions: int,region: Region):
+
+    """
+    Worker side of the parallel processing - classifies and filters one region of the scan in shared memory,
+    marks the kept points in its column of the shared (N, regions) kept matrix and returns their statistics
+    """
+
+    data_memory = SharedMemory(name=data_name)
+    kept_memory = SharedMemory(name=kept_name)
+    data = kept = None
+    try:
+        data = np.ndarray(shape, dtype=np.float64, buffer=data_memory.buf)
+        kept = np.ndarray((shape[0], n_regions), dtype=bool, buffer=kept_memory.buf)
+
+        rows = np.flatnonzero(RegionClassifier([region]).classify(data)[:, 0])
+        if len(rows) == 0:
+            raise ValueError(f"No valid rows found with {region.describe()} in the given data range.")
+
+        z_values = data[rows, 2]
+        within = mad_within(z_values)
+        kept[rows[within], column] = True
+        return RunningStats.from_values(z_values[within])
+    finally:
+        # The views have to be gone before the shared memory is closed
+        data = kept = None
+        data_memory.close()
+        kept_memory.close()
+
+def as_points(data):
+    """
+    Scan points as an (N, 3) float64 array - accepts the array from acquire_array(),
+    the nested lists from acquire_data() or an iterable of chunks from iter_dat_chunks()
+    """
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1, 3)
+    if isinstance(data, list):
+        return np.asarray(data, dtype=np.float64).reshape(-1, 3)
+
+    blocks = list(data)
+    if not blocks:
+        return np.empty((0, 3), dtype=np.float64)
+    return np.concatenate(blocks)
+
+class ScanProcessor:
+    """
+    Common base of the processors - holds the scan points and processes the regions of its
+    component type from the region table in ITk_Regions
+    """
+
+    # Component type in the region table
+    component = None
 
-class FlexProcessor:
+    def __init__(self, data):
+        self.data = as_points(data)
+        self.regions = {region.name: region for region in regions[self.component]}
+        # Running statistics of the filtered z values, per region, per fed attribute and per aggregate
+        self.stats = {}
+
+    def store(self, region: Region, valid_rows):
+        z_data, region_data = process_template(valid_rows, region.describe())
+        for attribute, value in zip(region.feeds, (z_data, region_data)):
+            setattr(self, attribute, value)
+
+        self.stats[region.name] = RunningStats.from_values(z_data)
+        self.stats[region.feeds[0]] = self.stats[region.name]
+
+    def process_region(self, name: str):
+        """
+        Processes a single region, also those left out of process_all() (the jigs of the flex)
+        """
+        region = self.regions[name]
+        self.store(region, self.data[RegionClassifier([region]).classify(self.data)[:, 0]])
+
+    # Calling fucntion to process everything at once
+    def process_all(self, workers: int = None):
+        """
+        workers - worker processes for the regions, REGION_WORKERS by default. Scans under PARALLEL_MIN_POINTS
+        and scans processed inside a worker process already (batch processing) are processed serially
+        """
+        active = [region for region in regions[self.component] if region.in_all]
+        workers = min(REGION_WORKERS if workers is None else workers, len(active))
+
+        if workers > 1 and len(self.data) >= PARALLEL_MIN_POINTS and multiprocessing.parent_process() is None:
+            self.process_parallel(active, workers)
+        else:
+            # Every point is labelled with its regions in a single pass over the scan
+            membership = RegionClassifier(active).classify(self.data)
+            for column, region in enumerate(active):
+                self.store(region, self.data[membership[:, column]])
+
+        # Aggregates are merged from the region statistics, the values themselves are never concatenated
+        for attribute, parts in aggregates[self.component].items():
+            self.stats[attribute] = RunningStats.combine(self.stats[part] for part in parts)
+
+    def process_parallel(self, active: list, workers: int):
+        """
+        Filters the regions in a process pool - the scan is copied once into shared memory, every worker
+        marks the points it keeps in a shared matrix and sends back only the statistics of its region
+        """
+        shape = self.data.shape
+        data_memory = SharedMemory(create=True, size=max(self.data.nbytes, 1))
+        kept_memory = SharedMemory(create=True, size=max(shape[0] * len(active), 1))
+        data = kept = None
+        try:
+            data = np.ndarray(shape, dtype=np.float64, buffer=data_memory.buf)
+            data[:] = self.data
+            kept = np.ndarray((shape[0], len(active)), dtype=bool, buffer=kept_memory.buf)
+            kept[:] = False
+
+            # Spawned, not forked - the GUI process has lookup threads running and a Qt log handler installed
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(region_worker, data_memory.name, kept_memory.name, shape,
+                                           column, len(active), region)
+                           for column, region in enumerate(active)]
+                region_stats = [future.result() for future in futures]
+
+            # Regions are stored in table order, as in the serial processing the region processed last sets the attribute
+            for column, (region, stats) in enumerate(zip(active, region_stats)):
+                region_data = self.data[kept[:, column]]
+                for attribute, value in zip(region.feeds, (region_data[:, 2].copy(), region_data)):
+                    setattr(self, attribute, value)
+                self.stats[region.name] = stats
+                self.stats[region.feeds[0]] = stats
+        finally:
+            data = kept = None
+            data_memory.close()
+            data_memory.unlink()
+            kept_memory.close()
+            kept_memory.unlink()
+
+class FlexProcessor(ScanProcessor):
+
+    component = "flex"
 
     def __init__(self, data):
         # Set of data list to store filtered values 
-        self.data = data
+        super().__init__(data)
         self.quad_data = []
         self.jig1_data = []
         self.jig2_data = []
         self.jig3_data = []
         self.flex_data = []
-    
-    def process_quad1(self):
-
-        valid_rows = [row for row in self.data[-308:-3] if row[0] >= 159.0]
-        valid_rows_inf = "row[0] >= 159.0"
-
-        self.quad_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-                                                                        
-    def process_quad2(self):
-
-        valid_rows = [row for row in self.data[-618:-309] if 146.0 < row[0] <= 158.0]
-        valid_rows_inf = "146.0 < row[0] <= 158.0"
-
-        self.quad_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_quad3(self):
-
-        valid_rows = [row for row in self.data if 130.0 < row[0] < 140.0 and 155.0 < row[1] < 170.0]
-        valid_rows_inf = "130.0 < row[0] <= 145.0 and 155.0 < row[1] < 170.0"
-
-        self.quad_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_quad4(self):
-
-        valid_rows = [row for row in self.data[-1278:-946] if row[0] >= 146.0]
-        valid_rows_inf = "row[0] >= 146.0"
 
-        self.quad_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-    
-    def process_jig1(self):
-        
-        valid_rows = [row for row in self.data[785:899] if row[1] > 180.0 and row[0] < 146.0]
-        valid_rows_inf = "row[1] > 180.0 and row[0] < 146.0"
+class BareProcessor(ScanProcessor):
 
-        self.jig1_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-    
-    def process_jig2(self):
-        
-        valid_rows = [row for row in self.data if 181.0 < row[1] < 190.0 and 148.0 < row[0] < 157.0]
-        valid_rows_inf = "181.0 < row[1] < 190.0 and 148.0 < row[0] < 157.0"
-
-        self.jig2_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_jig3(self):
-        
-        valid_rows = [row for row in self.data if 134.0 < row[1] < 150.0 and 135.0 < row[0] < 150.0]
-        valid_rows_inf = "134.0 < row[1] < 150.0 and 135.0 < row[0] < 150.0"
-
-        self.jig3_data, self.flex_data = process_template(valid_rows,valid_rows_inf)
-
-    # Calling fucntion to process everything above at once
-    def process_all(self):
-        self.process_quad1()
-        self.process_quad2()
-        self.process_quad3()
-        self.process_quad4()
-        # self.process_jig1()
-        # self.process_jig2()
-        # self.process_jig3()
-
-class BareProcessor:
+    component = "bare"
 
     def __init__(self,data):
-        self.data = data
+        super().__init__(data)
         self.sensor_data = []
         self.fe_data = []
         self.bare_data = []
-    
-    def process_sensor1(self):
-        
-        valid_rows = [row for row in self.data if 132 < row[0] < 161 and 146 < row[1] < 175]
-        valid_rows_inf = "132 < row[0] 161 and 146 < row[1] < 175"
-
-        self.sensor_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_sensor2(self):
-       
-        valid_rows = [row for row in self.data if 146 < row[0] < 148 and 132 < row[1] < 189]
-        valid_rows_inf = "146 < row[0] < 148 and 132 < row[1] < 189"
-
-        self.sensor_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_sensor3(self):
-       
-        valid_rows = [row for row in self.data if 118 < row[0] < 176 and 159 < row[1] < 162]
-        valid_rows_inf = "118 < row[0] < 176 and 159 < row[1] < 162"
-
-        self.sensor_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_fe1(self):
-        
-        valid_rows = [row for row in self.data if 147 < row[0] < 177 and 130 < row[1] < 162]
-        valid_rows_inf = "147.00 < row[0] < 177.00 and 130.00 < row[1] < 162.00"
-
-        self.fe_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
 
-    def process_fe2(self):
-        
-        valid_rows = [row for row in self.data if 126 < row[0] < 132 and 169 < row[1] < 176]
-        valid_rows_inf = "126.00 < row[0] < 133.00 and 169.00 < row[1] < 176.00"
+class AssemProcessor(ScanProcessor):
 
-        self.fe_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_fe3(self):
-        
-        valid_rows = [row for row in self.data if 140 < row[0] < 147 and 183 < row[1] < 191]
-        valid_rows_inf = "140.00 < row[0] < 147.00 and 183.00 < row[1] < 191.00"
-
-        self.fe_data, self.bare_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_all(self):
-        self.process_sensor1()
-        self.process_sensor2()
-        self.process_sensor3()
-        self.process_fe1()
-        self.process_fe2()
-        self.process_fe3()
-        self.full_z_data = self.sensor_data + self.fe_data
-
-class AssemProcessor:
+    component = "assem"
 
     def __init__(self,data):
-        self.data = data
+        super().__init__(data)
         self.assem_ga1 = []
         self.assem_ga2 = []
         self.assem_ga3 = []
@@ -162,62 +211,3 @@ class AssemProcessor:
         self.assem_sens2 = []
         self.assem_sens3 = []
         self.assem_data = []
-
-    def process_assem_ga1(self):
-
-        valid_rows = [row for row in self.data if 136.00 < row[0] < 138.00 and 159.00 < row[1] < 161.00]
-        valid_rows_inf = "136.00 < row[0] < 138.00 and 159.00 < row[1] < 161.00"
-
-        self.assem_ga1, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_assem_ga2(self):
-
-        valid_rows = [row for row in self.data if 147.00 < row[0] < 151.00 and 148.00 < row[1] < 152.00]
-        valid_rows_inf = "147.00 < row[0] < 151.00 and 148.00 < row[1] < 152.00"
-
-        self.assem_ga2, self.assem_data = process_template(valid_rows,valid_rows_inf)
-               
-    def process_assem_ga3(self):
-
-        valid_rows = [row for row in self.data if 158.00 < row[0] < 162.00 and 158.00 < row[1] < 162.00]
-        valid_rows_inf = "158.00 < row[0] < 162.00 and 158.00 < row[1] < 162.00"
-
-        self.assem_ga3, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_assem_ga4(self):
-
-        valid_rows = [row for row in self.data if 146.00 < row[0] < 149.00 and 172.00 < row[1] < 174.00]
-        valid_rows_inf = "147.00 < row[0] < 149.00 and row[1] > 172.00"
-        
-        self.assem_ga4, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_assem_sens1(self):
-
-        valid_rows = [row for row in self.data if 118.00 < row[0] < 132.00 and 147.00 < row[1] < 160.00]
-        valid_rows_inf = "138.00 < row[0] < 146.00 and 133.00 < row[1] < 141.00"
-
-        self.assem_sens1, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_assem_sens2(self):
-        
-        valid_rows = [row for row in self.data if 137.00 < row[0] < 146.00 and 132.00 < row[1] < 142.00]
-        valid_rows_inf = "137.00 < row[0] < 146.00 and row[1] < 142.00"
-
-        self.assem_sens2, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_assem_sens3(self):
-
-        valid_rows = [row for row in self.data if 147.00 < row[0] < 157.00 and 179.00 < row[1] < 190.00]
-        valid_rows_inf = "147.00 < row[0] and 179.00 < row[1]"
-
-        self.assem_sens3, self.assem_data = process_template(valid_rows,valid_rows_inf)
-
-    def process_all(self):
-        self.process_assem_ga1()
-        self.process_assem_ga2()
-        self.process_assem_ga3()
-        self.process_assem_ga4()
-        self.process_assem_sens1()
-        self.process_assem_sens2()
-        self.process_assem_sens3()
-        self.assem_quad = self.assem_ga1 + self.assem_ga2 + self.assem_ga3 + self.assem_ga4
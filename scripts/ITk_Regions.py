@@ -0,0 +1,158 @@
+import numpy as np
+
+"""
+Region specification of the metrology scans. Every region of the bare flex, bare module and assembled module
+is a row of a data table - the slice of the .DAT rows it is taken from, its x/y bounds and the processor
+attributes its filtered z values and rows are stored in. RegionClassifier compiles a table into a single
+vectorized pass that labels every scan point with the regions it belongs to.
+"""
+
+class Region:
+
+    def __init__(self, name: str, feeds: tuple, rows: tuple = None, x: tuple = (None, None), y: tuple = (None, None),
+                 closed: tuple = (), in_all: bool = True):
+        """
+        name - region name, processed with processor.process_region(name)
+        feeds - processor attributes set to the (z values, rows) of the region
+        rows - (start, stop) slice of the scan rows, None for the whole scan
+        x, y - (low, high) bounds, None for an open side; bounds are exclusive unless named in closed
+        closed - inclusive bounds out of "x_low", "x_high", "y_low", "y_high"
+        in_all - whether process_all() processes the region
+        """
+        self.name = name
+        self.feeds = feeds
+        self.rows = rows
+        self.x = x
+        self.y = y
+        self.closed = closed
+        self.in_all = in_all
+
+        # Strict bounds only, an inclusive bound is moved to the next float outside of it
+        bounds = []
+        for axis, (low, high) in (("x", x), ("y", y)):
+            if low is None:
+                low = -np.inf
+            elif f"{axis}_low" in closed:
+                low = np.nextafter(low, -np.inf)
+            if high is None:
+                high = np.inf
+            elif f"{axis}_high" in closed:
+                high = np.nextafter(high, np.inf)
+            bounds.extend([float(low), float(high)])
+        self.bounds = tuple(bounds)
+
+    def describe(self):
+        """
+        Condition of the region as text, generated from the bounds so it always matches the real condition
+        """
+        conditions = []
+        for axis, column, (low, high) in (("x", 0, self.x), ("y", 1, self.y)):
+            text = f"row[{column}]"
+            if low is not None:
+                text = f"{low} {'<=' if f'{axis}_low' in self.closed else '<'} {text}"
+            if high is not None:
+                text = f"{text} {'<=' if f'{axis}_high' in self.closed else '<'} {high}"
+            if low is not None or high is not None:
+                conditions.append(text)
+        if self.rows is not None:
+            conditions.append(f"rows [{self.rows[0]}:{self.rows[1]}]")
+        return " and ".join(conditions)
+
+class RegionClassifier:
+
+    def __init__(self, regions: list, chunk_size: int = 1 << 18):
+        """
+        Compiles a region table into bound and row-range arrays, one column per region
+        """
+        self.regions = regions
+        self.names = [region.name for region in regions]
+        self.chunk_size = chunk_size
+        self.bounds = np.array([region.bounds for region in regions], dtype=np.float64).T
+        # Open sides of the regions, they set no condition at all
+        self.open = np.isinf(self.bounds)
+
+    def row_ranges(self, n_points: int):
+        """
+        Resolves the row slices of every region against the scan length
+        """
+        starts = np.zeros(len(self.regions), dtype=np.intp)
+        stops = np.full(len(self.regions), n_points, dtype=np.intp)
+        for column, region in enumerate(self.regions):
+            if region.rows is not None:
+                starts[column], stops[column], _ = slice(*region.rows).indices(n_points)
+        return starts, stops
+
+    def members(self, x, y, row, starts, stops, open_sides: bool = False):
+        """
+        Region membership of the given points - (n, 1) x, y and row number columns against the (R,) region arrays
+        """
+        inside = (starts <= row) & (row < stops)
+        for passed, open_side in zip((self.bounds[0] < x, x < self.bounds[1], self.bounds[2] < y, y < self.bounds[3]),
+                                     self.open):
+            if open_sides:
+                passed |= open_side
+            inside &= passed
+        return inside
+
+    def classify(self, points):
+        """
+        Single pass over the scan - returns an (N, R) boolean matrix, True where point i belongs to region r
+        """
+        n_points = len(points)
+        starts, stops = self.row_ranges(n_points)
+        membership = np.empty((n_points, len(self.regions)), dtype=bool)
+        has_open = self.open.any()
+
+        # Chunks keep the (chunk, R) temporaries small on very large scans
+        for start in range(0, n_points, self.chunk_size):
+            chunk = points[start:start + self.chunk_size]
+            row = np.arange(start, start + len(chunk))[:, None]
+            membership[start:start + len(chunk)] = self.members(chunk[:, 0, None], chunk[:, 1, None], row, starts, stops)
+
+            # Only points with an infinite or NaN coordinate fail an open side, those are checked again without it
+            if has_open:
+                finite = np.isfinite(chunk[:, 0]) & np.isfinite(chunk[:, 1])
+                if not finite.all():
+                    odd = np.flatnonzero(~finite)
+                    membership[start + odd] = self.members(chunk[odd, 0, None], chunk[odd, 1, None], row[odd],
+                                                           starts, stops, open_sides=True)
+
+        return membership
+
+# Region table of each component type. Several regions feed the same attributes, as in the original
+# processing the region processed last sets the attribute.
+regions = {
+    "flex": [
+        Region("quad1", ("quad_data", "flex_data"), rows=(-308, -3), x=(159.0, None), closed=("x_low",)),
+        Region("quad2", ("quad_data", "flex_data"), rows=(-618, -309), x=(146.0, 158.0), closed=("x_high",)),
+        Region("quad3", ("quad_data", "flex_data"), x=(130.0, 140.0), y=(155.0, 170.0)),
+        Region("quad4", ("quad_data", "flex_data"), rows=(-1278, -946), x=(146.0, None), closed=("x_low",)),
+        Region("jig1", ("jig1_data", "flex_data"), rows=(785, 899), x=(None, 146.0), y=(180.0, None), in_all=False),
+        Region("jig2", ("jig2_data", "flex_data"), x=(148.0, 157.0), y=(181.0, 190.0), in_all=False),
+        Region("jig3", ("jig3_data", "flex_data"), x=(135.0, 150.0), y=(134.0, 150.0), in_all=False),
+    ],
+    "bare": [
+        Region("sensor1", ("sensor_data", "bare_data"), x=(132, 161), y=(146, 175)),
+        Region("sensor2", ("sensor_data", "bare_data"), x=(146, 148), y=(132, 189)),
+        Region("sensor3", ("sensor_data", "bare_data"), x=(118, 176), y=(159, 162)),
+        Region("fe1", ("fe_data", "bare_data"), x=(147, 177), y=(130, 162)),
+        Region("fe2", ("fe_data", "bare_data"), x=(126, 132), y=(169, 176)),
+        Region("fe3", ("fe_data", "bare_data"), x=(140, 147), y=(183, 191)),
+    ],
+    "assem": [
+        Region("assem_ga1", ("assem_ga1", "assem_data"), x=(136.00, 138.00), y=(159.00, 161.00)),
+        Region("assem_ga2", ("assem_ga2", "assem_data"), x=(147.00, 151.00), y=(148.00, 152.00)),
+        Region("assem_ga3", ("assem_ga3", "assem_data"), x=(158.00, 162.00), y=(158.00, 162.00)),
+        Region("assem_ga4", ("assem_ga4", "assem_data"), x=(146.00, 149.00), y=(172.00, 174.00)),
+        Region("assem_sens1", ("assem_sens1", "assem_data"), x=(118.00, 132.00), y=(147.00, 160.00)),
+        Region("assem_sens2", ("assem_sens2", "assem_data"), x=(137.00, 146.00), y=(132.00, 142.00)),
+        Region("assem_sens3", ("assem_sens3", "assem_data"), x=(147.00, 157.00), y=(179.00, 190.00)),
+    ],
+}
+
+# Statistics combined from several regions once process_all() has run (processor.stats)
+aggregates = {
+    "flex": {},
+    "bare": {"full_z_data": ("sensor_data", "fe_data")},
+    "assem": {"assem_quad": ("assem_ga1", "assem_ga2", "assem_ga3", "assem_ga4")},
+}
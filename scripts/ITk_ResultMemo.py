@@ -0,0 +1,98 @@
+import copy
+import dataclasses
+import os
+import threading
+from collections import OrderedDict
+from ITk_Engine import PROCESSOR_VERSION, scan_type, component_mass, component_carrier, fetch_component, mass_tests
+from ITk_ResultsStore import results_store
+from ITk_ScanCache import file_digest
+from ITk_Specs import specs
+
+"""
+ResultMemo - complete measurement results memoized on the content of their files. The key is the serial and
+stage of the files, the hash of the .DAT and the .STA file, the processor version and the specification version,
+so measuring the same pair again (Go Back, then Measure) returns the stage results, mass and carrier without
+parsing or processing. Identical files saved under another serial are measured as that component.
+The component is not memoized - its stage and location change with uploads - and is looked up again through
+the component cache. Results of earlier sessions are found in the local results store.
+"""
+
+class ResultMemo:
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        # Memo key -> MeasurementResult, least recently used first
+        self._entries = OrderedDict()
+        # (path, size, modification time) -> content hash, so unchanged files are not read again
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def file_hash(self, file_name: str):
+        stat = os.stat(file_name)
+        signature = (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(signature)
+        if digest is None:
+            digest = file_digest(file_name)
+            self._digests[signature] = digest
+        return digest
+
+    def key(self, dat_path: str, sta_path: str):
+        """
+        (serial, stage, DAT hash, STA hash, processor version, spec version) of a pair, None for files of no
+        metrology stage
+        """
+        dat_basename = os.path.basename(dat_path)
+        stage = scan_type(dat_basename, os.path.basename(sta_path))
+        if stage is None:
+            return None
+        return (dat_basename[:14], stage, self.file_hash(dat_path), self.file_hash(sta_path),
+                PROCESSOR_VERSION, specs[stage].version)
+
+    def get(self, key: tuple):
+        """
+        Memoized result of a key, None when the pair has not been measured in this session
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+            # Callers get their own copy, so nothing they change leaks into the memo
+            return copy.deepcopy(result)
+
+    def put(self, key: tuple, result):
+        with self._lock:
+            self._entries[key] = copy.deepcopy(dataclasses.replace(result, component=None))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stored_results(self, key: tuple):
+        """
+        Stage results of the same files measured in an earlier session, from the local results store
+        """
+        store = results_store()
+        if store is None:
+            return None
+        row = store.find(*key)
+        return None if row is None else row["results"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+
+def refresh_lookups(result, client):
+    """
+    Looks the component of a memoized result up again - through the component cache, which uploads and
+    stage changes invalidate - and the mass and carrier when they were missing, they may have been uploaded since
+    """
+    result.component = fetch_component(client, result.component_id)
+    if result.stage in mass_tests and result.mass is None:
+        result.mass = component_mass(client, result.component, mass_tests[result.stage])
+    if result.stage == "assem" and result.carrier is None:
+        result.carrier = component_carrier(result.component)
+    return result
+
+# Memo shared by the metrology measurements of the program
+result_memo = ResultMemo()
@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from ITk_Engine import PROCESSOR_VERSION
+from ITk_ScanCache import file_digest
+from ITk_Specs import specs
+
+"""
+ResultsStore - local SQLite history of every measurement. Each metrology scan and pull test that is measured
+(GUI or batch) is stored with its serial, stage, component type, pass/fail list, the hashes of its source files,
+the specification version it was judged against and every numeric result as a row of an indexed metrics table.
+History queries - all measurements of a serial, all bare modules of a month with the FE chips above some
+thickness - then run locally instead of through the database or the Google Sheet.
+"""
+
+# Database file, kept outside of the caches so clearing them keeps the history. An empty ITK_RESULTS_DB
+# (.env file) turns the store off
+RESULTS_DB = os.environ.get("ITK_RESULTS_DB",
+                            os.path.join(os.path.expanduser("~"), ".local", "share", "itk_metrologist", "results.sqlite"))
+
+# Component type of every stage, for results stored without the component from the database
+stage_types = {"flex": "PCB",
+               "bare": "BARE_MODULE",
+               "assem": "MODULE",
+               "pulltest": "MODULE"}
+
+# Comparisons allowed in the metric conditions of query()
+operators = ("<", "<=", ">", ">=", "=", "!=")
+
+schema = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    serial TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    component_type TEXT,
+    measured_at TEXT NOT NULL,
+    passed INTEGER,
+    pass_fail TEXT,
+    spec_version INTEGER,
+    processor_version INTEGER,
+    dat_hash TEXT,
+    sta_hash TEXT,
+    csv_hash TEXT,
+    files TEXT,
+    mass REAL,
+    carrier TEXT,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_serial ON measurements (serial, measured_at);
+CREATE INDEX IF NOT EXISTS measurements_date ON measurements (measured_at);
+CREATE INDEX IF NOT EXISTS measurements_stage ON measurements (stage, measured_at);
+CREATE INDEX IF NOT EXISTS measurements_files ON measurements (dat_hash, sta_hash);
+CREATE TABLE IF NOT EXISTS metrics (
+    measurement_id INTEGER NOT NULL REFERENCES measurements (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (measurement_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_value ON metrics (name, value);
+"""
+
+def flat_metrics(stage_results: dict):
+    """
+    Numeric results as metric -> value, list elements as "name[i]"; the pass/fail list and nested data are left out
+    """
+    metrics = {}
+    for name, value in stage_results.items():
+        if name == "pass_fail":
+            continue
+        if isinstance(value, (bool, int, float)):
+            metrics[name] = float(value)
+        elif isinstance(value, (list, tuple)) and all(isinstance(element, (bool, int, float)) for element in value):
+            for index, element in enumerate(value):
+                metrics[f"{name}[{index}]"] = float(element)
+    return metrics
+
+def json_default(value):
+    # NumPy scalars and arrays that made it into the results
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def timestamp(value):
+    """
+    ISO timestamp in UTC of a datetime, a date string is passed through
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+class ResultsStore:
+
+    def __init__(self, path: str = RESULTS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by the GUI and the lookup threads, the lock keeps one statement at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            # The GUI and batch runs can write at the same time
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript(schema)
+
+    def record(self, result, dat_path: str = None, sta_path: str = None, csv_path: str = None,
+               measured_at: datetime = None, hashes: dict = None):
+        """
+        Stores a MeasurementResult with the hashes of its source files, returns the row id
+        hashes - hashes already computed, by "dat", "sta" or "csv"
+        """
+        stage_results = result.stage_results
+        component_type = (result.component or {}).get('componentType', {}).get('code', stage_types.get(result.stage))
+        files = {name: path for name, path in (("dat", dat_path), ("sta", sta_path), ("csv", csv_path)) if path}
+        hashes = {name: (hashes or {}).get(name) or file_digest(path)
+                  for name, path in files.items() if os.path.isfile(path)}
+        pass_fail = stage_results["pass_fail"]
+
+        row = (result.component_id.upper(),
+               result.stage,
+               component_type,
+               timestamp(measured_at or datetime.now(timezone.utc)),
+               int(all(pass_fail)),
+               json.dumps(pass_fail, default=json_default),
+               specs[result.stage].version if result.stage in specs else None,
+               PROCESSOR_VERSION,
+               hashes.get("dat"),
+               hashes.get("sta"),
+               hashes.get("csv"),
+               json.dumps(files),
+               result.mass,
+               result.carrier,
+               json.dumps(stage_results, default=json_default))
+
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO measurements (serial, stage, component_type, measured_at, passed, pass_fail, spec_version, "
+                "processor_version, dat_hash, sta_hash, csv_hash, files, mass, carrier, results) "
+                "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", row)
+            measurement_id = cursor.lastrowid
+            self._connection.executemany("INSERT INTO metrics (measurement_id, name, value) VALUES (?,?,?)",
+                                         [(measurement_id, name, value)
+                                          for name, value in flat_metrics(stage_results).items()])
+        return measurement_id
+
+    def query(self, serial: str = None, stage: str = None, since=None, until=None, passed: bool = None,
+              metrics: dict = None, latest: bool = False, limit: int = None):
+        """
+        Stored measurements, newest first.
+        since, until - datetimes or ISO date strings, until is exclusive
+        metrics - (metric, operator, value) conditions, e.g. [("avg_fe_thickness", ">", 150)]
+        latest - only the newest measurement of every serial and stage
+        """
+        conditions = []
+        parameters = []
+        for column, operator, value in (("serial", "=", serial.upper() if serial else None), ("stage", "=", stage),
+                                        ("measured_at", ">=", timestamp(since)), ("measured_at", "<", timestamp(until)),
+                                        ("passed", "=", None if passed is None else int(passed))):
+            if value is not None:
+                conditions.append(f"m.{column} {operator} ?")
+                parameters.append(value)
+
+        for name, operator, value in metrics or ():
+            if operator not in operators:
+                raise ValueError(f"Unknown comparison {operator}, expected one of {', '.join(operators)}")
+            conditions.append(f"EXISTS (SELECT 1 FROM metrics WHERE measurement_id = m.id AND name = ? AND value {operator} ?)")
+            parameters.extend([name, value])
+
+        if latest:
+            conditions.append("m.id = (SELECT id FROM measurements WHERE serial = m.serial AND stage = m.stage "
+                              "ORDER BY measured_at DESC, id DESC LIMIT 1)")
+
+        sql = "SELECT * FROM measurements AS m"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY m.measured_at DESC, m.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [self._row(row) for row in rows]
+
+    def find(self, serial: str, stage: str, dat_hash: str, sta_hash: str, processor_version: int, spec_version: int):
+        """
+        Newest measurement of the serial and stage with the same .DAT/.STA content under the same processor
+        and specification, None otherwise
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM measurements WHERE dat_hash = ? AND sta_hash = ? "
+                                           "AND serial = ? AND stage = ? "
+                                           "AND processor_version = ? AND spec_version = ? "
+                                           "ORDER BY measured_at DESC, id DESC LIMIT 1",
+                                           (dat_hash, sta_hash, serial.upper(), stage,
+                                            processor_version, spec_version)).fetchone()
+        return None if row is None else self._row(row)
+
+    def history(self, serial: str, stage: str = None):
+        """
+        Every stored measurement of a serial, newest first
+        """
+        return self.query(serial=serial, stage=stage)
+
+    def metrics(self, measurement_id: int):
+        with self._lock:
+            rows = self._connection.execute("SELECT name, value FROM metrics WHERE measurement_id = ?",
+                                            (measurement_id,)).fetchall()
+        return {row["name"]: row["value"] for row in rows}
+
+    def _row(self, row: sqlite3.Row):
+        record = dict(row)
+        record["passed"] = None if record["passed"] is None else bool(record["passed"])
+        for key in ("pass_fail", "files", "results"):
+            record[key] = json.loads(record[key]) if record[key] is not None else None
+        return record
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def results_store():
+    """
+    Store shared by the program, None when turned off or when the database cannot be opened
+    """
+    global _store
+    if not RESULTS_DB:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ResultsStore(RESULTS_DB)
+            except (sqlite3.Error, OSError) as e:
+                logging.warning(f"Results store {RESULTS_DB} cannot be opened, results are not stored locally\n{e}")
+                return None
+        return _store
+
+def record_result(result, dat_path: str = None, sta_path: str = None, csv_path: str = None, hashes: dict = None):
+    """
+    Stores a measurement in the shared store - failures are logged, never raised, so storing the
+    history cannot stop a measurement from being shown or uploaded
+    """
+    store = results_store()
+    if store is None:
+        return None
+    try:
+        return store.record(result, dat_path, sta_path, csv_path, hashes=hashes)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"{result.component_id} could not be stored in the local results store\n{e}")
+        return None
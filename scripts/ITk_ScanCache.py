@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+"""
+ScanCache - on-disk cache of parsed .DAT scans. Every parsed point array is stored as a binary .npy sidecar
+in a cache directory together with a small .json record of the source file size, modification time and
+content hash. Re-opening the same scan memory maps the stored array instead of parsing the text again.
+The least recently used entries are evicted once the cache grows over its byte limit.
+"""
+
+# Fields every record must have, records missing one are treated as unreadable
+meta_fields = ("size", "mtime_ns", "hash")
+
+# Cache location and size limit, both can be changed through the environment (.env file)
+CACHE_DIR = os.environ.get("ITK_SCAN_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "itk_metrologist", "scans"))
+CACHE_MAX_BYTES = int(os.environ.get("ITK_SCAN_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+def file_digest(file_name, block_size: int = 1024 * 1024):
+    """
+    Content hash of a file, read in blocks so large scans are not loaded into memory at once
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_name, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ScanCache:
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _paths(self, file_name):
+        # Entries are keyed by the absolute path of the scan file
+        key = hashlib.sha1(os.path.abspath(file_name).encode()).hexdigest()
+        entry = os.path.join(self.directory, key)
+        return entry + ".npy", entry + ".json"
+
+    def fetch(self, file_name, loader, hasher=None):
+        """
+        Returns the parsed array of a scan - memory mapped from the cache when the stored record still
+        matches the file, otherwise parsed with loader(file_name) and stored for the next time.
+        hasher(file_name) gives the content hash, file_digest() by default - callers that have hashed
+        the file already pass theirs (ResultMemo.file_hash) so the file is not read once more
+        """
+        hasher = hasher or file_digest
+        stat = os.stat(file_name)
+        array_path, meta_path = self._paths(file_name)
+        digest = None
+
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            meta = None
+        if not isinstance(meta, dict) or any(field not in meta for field in meta_fields):
+            meta = None
+
+        if meta is not None and meta["size"] == stat.st_size:
+            valid = meta["mtime_ns"] == stat.st_mtime_ns
+            if not valid:
+                # Touched or copied files keep their entry as long as the content is the same
+                digest = hasher(file_name)
+                valid = digest == meta["hash"]
+                if valid:
+                    meta["mtime_ns"] = stat.st_mtime_ns
+                    self._write_meta(meta_path, meta)
+            if valid:
+                try:
+                    data = np.load(array_path, mmap_mode="r")
+                    # Marks the entry as recently used for the eviction order
+                    os.utime(meta_path)
+                    return data
+                except (OSError, ValueError):
+                    logging.warning(f"Cached scan for {os.path.basename(file_name)} is unreadable, parsing again")
+
+        data = loader(file_name)
+
+        try:
+            if digest is None:
+                digest = hasher(file_name)
+            # A file rewritten while it was parsed would be stored under a hash of other content
+            current = os.stat(file_name)
+            if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                logging.info(f"{os.path.basename(file_name)} changed while it was parsed, not cached")
+                return data
+            self.store(file_name, data, stat, digest)
+        except OSError as e:
+            logging.warning(f"Could not store {os.path.basename(file_name)} in the scan cache\n{e}")
+
+        return data
+
+    def store(self, file_name, data, stat: os.stat_result, digest: str):
+        """
+        Writes the array and its record, both through temporary files so readers never see half an entry
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        array_path, meta_path = self._paths(file_name)
+
+        temp_array = f"{array_path}.{os.getpid()}.tmp"
+        with open(temp_array, "wb") as file:
+            np.save(file, np.ascontiguousarray(data))
+        os.replace(temp_array, array_path)
+
+        self._write_meta(meta_path, {"path": os.path.abspath(file_name),
+                                     "size": stat.st_size,
+                                     "mtime_ns": stat.st_mtime_ns,
+                                     "hash": digest})
+        self.evict()
+
+    def _write_meta(self, meta_path, meta: dict):
+        temp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(temp_meta, "w") as file:
+            json.dump(meta, file)
+        os.replace(temp_meta, meta_path)
+
+    def entries(self):
+        """
+        Cached entries as (last used time, array path, record path, bytes), oldest first
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            array_path = meta_path[:-5] + ".npy"
+            try:
+                last_used = os.path.getmtime(meta_path)
+                size = os.path.getsize(array_path)
+            except OSError:
+                continue
+            entries.append((last_used, array_path, meta_path, size))
+
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits within max_bytes
+        """
+        entries = self.entries()
+        total = sum(entry[3] for entry in entries)
+
+        for last_used, array_path, meta_path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(meta_path)
+                os.remove(array_path)
+            except OSError:
+                # Still open by another process on some platforms, left for the next eviction
+                continue
+            total -= size
+
+    def clear(self):
+        for last_used, array_path, meta_path, size in self.entries():
+            try:
+                os.remove(meta_path)
+                os.remove(array_path)
+            except OSError:
+                continue
+
+# Shared cache used by acquire_array()
+scan_cache = ScanCache()
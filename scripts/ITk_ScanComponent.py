@@ -9,7 +9,8 @@ import webbrowser
 
 def table_allocate(table: QTableWidget, client: itkdb.Client, input: QLineEdit):
     try:
-        component = client.get('getComponent',json={"component":input.text(),"alternativeIdentifier":False})
+        # The stage and location shown have to be current, other stations may have changed them
+        component = client.get('getComponent',json={"component":input.text(),"alternativeIdentifier":False},fresh=True)
     except:
         QApplication.setAttribute(Qt.ApplicationAttribute.AA_DontUseNativeDialogs, True)
         QMessageBox.critical(None,"Error", "Component not found!",
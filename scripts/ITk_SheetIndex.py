@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+from gspread.utils import rowcol_to_a1
+
+"""
+SheetIndex - local index of the component rows of a worksheet. The serial number column is read once with a
+single ranged request and kept on disk, so an upload no longer searches the whole sheet (find) and reads the
+first column (col_values) to place its row. Before a row is written the index checks the cells it relies on
+with one small read, and is loaded again only when they no longer match (rows added or moved by others).
+"""
+
+# Index location, can be changed through the environment (.env file)
+INDEX_CACHE = os.environ.get("ITK_SHEET_INDEX_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "itk_metrologist", "sheet_index.json"))
+
+# Column holding the serial number of every worksheet, the first column decides where a new row goes
+key_columns = {"Hybrids": 1,
+               "Bare modules": 1,
+               "Assembled modules": 5}
+
+def column_range(title: str, column: int, first_row: int = None, last_row: int = None):
+    letter = rowcol_to_a1(1, column)[:-1]
+    title = title.replace("'", "''")
+    if first_row is None:
+        return f"'{title}'!{letter}:{letter}"
+    return f"'{title}'!{letter}{first_row}:{letter}{last_row or first_row}"
+
+def range_columns(response: dict):
+    """
+    Values of every requested single-column range (majorDimension COLUMNS), empty cells as ""
+    """
+    return [(value_range.get("values") or [[]])[0] for value_range in response.get("valueRanges", [])]
+
+class SheetIndex:
+
+    def __init__(self, sheet, key_column: int = None):
+        self.sheet = sheet
+        self.key_column = key_column or key_columns.get(sheet.title, 1)
+        self.key = f"{sheet.spreadsheet.id}/{sheet.id}"
+        self.rows = {}
+        self.next_row = None
+
+        cached = load_indexes().get(self.key)
+        if cached is not None and cached.get("key_column") == self.key_column:
+            self.rows = cached["rows"]
+            self.next_row = cached["next_row"]
+
+    def load(self):
+        """
+        Reads the serial column (and the first column) in one request
+        """
+        response = self.sheet.spreadsheet.values_batch_get(self.load_ranges(), params={"majorDimension": "COLUMNS"})
+        self.load_columns(range_columns(response))
+
+    def load_ranges(self):
+        ranges = [column_range(self.sheet.title, self.key_column)]
+        if self.key_column != 1:
+            ranges.append(column_range(self.sheet.title, 1))
+        return ranges
+
+    def load_columns(self, columns: list):
+        """
+        Builds the index from the columns read for load_ranges()
+        """
+        self.rows = {}
+        for row, serial in enumerate(columns[0], start=1):
+            # The first occurrence, as find() returned
+            if serial and serial not in self.rows:
+                self.rows[serial] = row
+        self.next_row = len(columns[-1]) + 1
+        self.save()
+
+    def check_ranges(self, serial: str):
+        """
+        Cells the row of a serial relies on - its own serial cell, or for a new row the last used and the
+        free cell of the first column and the free serial cell
+        """
+        row = self.rows.get(serial)
+        if row is not None:
+            return [column_range(self.sheet.title, self.key_column, row)]
+        ranges = [column_range(self.sheet.title, 1, max(self.next_row - 1, 1), self.next_row)]
+        if self.key_column != 1:
+            ranges.append(column_range(self.sheet.title, self.key_column, self.next_row))
+        return ranges
+
+    def valid(self, serial: str, columns: list):
+        """
+        Whether the checked cells still match the index
+        """
+        row = self.rows.get(serial)
+        if row is not None:
+            return columns[0][:1] == [serial]
+        first_column = columns[0]
+        if self.next_row > 1 and (len(first_column) != 1 or not first_column[0]):
+            return False
+        if self.next_row == 1 and any(first_column):
+            return False
+        return len(columns) == 1 or not any(columns[1])
+
+    def row(self, serial: str):
+        """
+        Row of the serial, the next free row when it is not in the sheet yet
+        """
+        if self.next_row is None:
+            self.load()
+        else:
+            response = self.sheet.spreadsheet.values_batch_get(self.check_ranges(serial),
+                                                               params={"majorDimension": "COLUMNS"})
+            if not self.valid(serial, range_columns(response)):
+                logging.info(f"Row index of {self.sheet.title} is out of date, reading it again")
+                self.load()
+
+        return self.rows.get(serial, self.next_row)
+
+    def written(self, serial: str, row: int, save: bool = True):
+        """
+        Records a written row, the index then follows the sheet without reading it again
+        """
+        self.rows.setdefault(serial, row)
+        if row >= self.next_row:
+            self.next_row = row + 1
+        if save:
+            self.save()
+
+    def save(self):
+        indexes = load_indexes()
+        indexes[self.key] = {"key_column": self.key_column, "rows": self.rows, "next_row": self.next_row}
+        try:
+            os.makedirs(os.path.dirname(INDEX_CACHE), exist_ok=True)
+            temp_path = f"{INDEX_CACHE}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(indexes, file)
+            os.replace(temp_path, INDEX_CACHE)
+        except OSError as e:
+            logging.warning(f"Could not store the row index of {self.sheet.title}\n{e}")
+
+def load_indexes():
+    try:
+        with open(INDEX_CACHE) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def resolve_rows(indexes: dict):
+    """
+    Rows of many serials in several worksheets of one spreadsheet - every index is checked with a single read,
+    and the worksheets whose index is missing or out of date are read again together in one more.
+    indexes - SheetIndex -> serials, returns SheetIndex -> {serial: row}; serials not in a worksheet yet get
+    its free rows one after another
+    """
+    if not indexes:
+        return {}
+    spreadsheet = next(iter(indexes)).sheet.spreadsheet
+    params = {"majorDimension": "COLUMNS"}
+
+    stale = [index for index in indexes if index.next_row is None]
+
+    # Every check range once, new serials of a worksheet all rely on the same cells
+    ranges = {}
+    checks = []
+    for index, serials in indexes.items():
+        if index.next_row is None:
+            continue
+        for serial in dict.fromkeys(serials):
+            checks.append((index, serial, [ranges.setdefault(cells, len(ranges)) for cells in index.check_ranges(serial)]))
+    if ranges:
+        columns = range_columns(spreadsheet.values_batch_get(list(ranges), params=params))
+        for index, serial, positions in checks:
+            if index not in stale and not index.valid(serial, [columns[position] for position in positions]):
+                logging.info(f"Row index of {index.sheet.title} is out of date, reading it again")
+                stale.append(index)
+
+    if stale:
+        load_ranges = [index.load_ranges() for index in stale]
+        columns = range_columns(spreadsheet.values_batch_get([cells for ranges in load_ranges for cells in ranges],
+                                                             params=params))
+        for index, ranges in zip(stale, load_ranges):
+            index.load_columns(columns[:len(ranges)])
+            columns = columns[len(ranges):]
+
+    rows = {}
+    for index, serials in indexes.items():
+        index_rows = rows[index] = {}
+        next_row = index.next_row
+        for serial in serials:
+            if serial in index_rows:
+                continue
+            row = index.rows.get(serial)
+            if row is None:
+                row = next_row
+                next_row += 1
+            index_rows[serial] = row
+    return rows
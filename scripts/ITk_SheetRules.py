@@ -1,11 +1,26 @@
 from gspread_formatting import *
 from gspread import worksheet
 from multiprocessing import Queue
+import hashlib
+import json
+import logging
+import os
+import time
+from ITk_Specs import specs
 
 """
-Setting conditional formatting rules for the Google Sheets when uploading metrology results
+Setting conditional formatting rules for the Google Sheets when uploading metrology results.
+The limits come from the specification tables (ITk_Specs.py), the same the pass/fail decisions are made with.
+The rules are only written when they differ from the ones in the sheet - a fingerprint of the rules last seen
+in every worksheet is kept on disk, so most uploads do not touch the rules at all
 """
 
+# Fingerprints of the worksheet rules and how long [s] they are trusted before the sheet is checked again,
+# both can be changed through the environment (.env file)
+RULES_CACHE = os.environ.get("ITK_SHEET_RULES_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "itk_metrologist", "sheet_rules.json"))
+RULES_CACHE_TTL = float(os.environ.get("ITK_SHEET_RULES_TTL", 24 * 3600))
+
 rule_dict = {"pass": 'NUMBER_BETWEEN',
             "fail": 'NUMBER_NOT_BETWEEN',
             "green": Color(0.8,1,0.8),
@@ -18,58 +33,133 @@ def conditional_rule(sheet: worksheet,range,condition,values,color_range):
                                  format=CellFormat(backgroundColor = color_range)))
     return rule
 
-def hybrid_rules(sheet: worksheet,queue: Queue):
+# Sheet columns coloured by the criteria of each specification, with the factor from the unit of the
+# specification to the unit the column is written in
+hybrid_columns = [("F:F", "x_dimension", 1),
+                  ("G:G", "y_dimension", 1),
+                  ("H:K", "ga_thickness", 1000),
+                  ("P:P", "hv_thickness", 1),
+                  ("Q:Q", "ftm_thickness", 1)]
+
+bare_columns = [("G:G", "fe_x", 1),
+                ("H:H", "fe_y", 1),
+                ("I:I", "sensor_x", 1),
+                ("J:J", "sensor_y", 1),
+                ("K:K", "fe_thickness", 0.001),
+                ("M:M", "bare_thickness", 0.001)]
+
+assem_columns = [("H:H", "x_value", 1),
+                 ("I:I", "y_value", 1),
+                 ("J:N", "ga_thickness", 1),
+                 ("S:S", "ftm_thickness", 0.001),
+                 ("T:T", "hv_thickness", 0.001)]
+
+def criterion_conditions(criterion,scale):
     """
-    Creating and storing custom rules for the Hybrid spreadsheet
+    (condition, values) of the green and of the red rule of a criterion, limits scaled to the sheet unit
     """
+    low = None if criterion.low is None else f"{criterion.low*scale:.10g}"
+    high = None if criterion.high is None else f"{criterion.high*scale:.10g}"
+
+    if low is not None and high is not None:
+        if criterion.strict:
+            raise ValueError(f"{criterion.name}: strict limits on both sides cannot be shown as a sheet rule")
+        return (rule_dict["pass"],[low,high]), (rule_dict["fail"],[low,high])
+    if high is not None:
+        if "high" in criterion.strict:
+            return ('NUMBER_LESS',[high]), ('NUMBER_GREATER_THAN_EQ',[high])
+        return ('NUMBER_LESS_THAN_EQ',[high]), ('NUMBER_GREATER',[high])
+    if "low" in criterion.strict:
+        return ('NUMBER_GREATER',[low]), ('NUMBER_LESS_THAN_EQ',[low])
+    return ('NUMBER_GREATER_THAN_EQ',[low]), ('NUMBER_LESS',[low])
+
+def spec_rules(sheet: worksheet,stage: str,columns: list):
+    """
+    Green and red rule of every column for the specification of the stage
+    """
+    rules = []
+    for column_range, name, scale in columns:
+        (pass_condition, pass_values), (fail_condition, fail_values) = criterion_conditions(specs[stage].criteria[name],scale)
+        rules.append(conditional_rule(sheet,column_range,pass_condition,pass_values,rule_dict["green"]))
+        rules.append(conditional_rule(sheet,column_range,fail_condition,fail_values,rule_dict["red"]))
+    return rules
+
+def rule_key(props: dict):
+    """
+    Comparable form of a rule - ranges, condition, values and background colour, with the defaults the API
+    leaves out of its responses (zero colour components, unbounded range sides) filled in
+    """
+    boolean_rule = props.get("booleanRule")
+    if boolean_rule is None:
+        return props
+    ranges = [[grid.get(key) for key in ("sheetId", "startRowIndex", "endRowIndex", "startColumnIndex", "endColumnIndex")]
+              for grid in props.get("ranges", [])]
+    condition = boolean_rule.get("condition", {})
+    values = [value.get("userEnteredValue") for value in condition.get("values", [])]
+    color = boolean_rule.get("format", {}).get("backgroundColor", {})
+    return [ranges, condition.get("type"), values, [round(color.get(key, 0), 4) for key in ("red", "green", "blue")]]
+
+def rules_fingerprint(rules):
+    keys = [rule_key(rule.to_props()) for rule in rules]
+    return hashlib.sha1(json.dumps(keys, sort_keys=True).encode()).hexdigest()
+
+def load_fingerprints():
+    try:
+        with open(RULES_CACHE) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def store_fingerprint(key: str,fingerprint: str):
+    fingerprints = load_fingerprints()
+    fingerprints[key] = {"fingerprint": fingerprint, "checked": time.time()}
+    try:
+        os.makedirs(os.path.dirname(RULES_CACHE), exist_ok=True)
+        temp_path = f"{RULES_CACHE}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(fingerprints, file)
+        os.replace(temp_path, RULES_CACHE)
+    except OSError as e:
+        logging.warning(f"Could not store the conditional format fingerprint\n{e}")
+
+def sync_rules(sheet: worksheet,desired: list,queue: Queue):
+    """
+    Makes the rules of the worksheet exactly the desired ones. Nothing is requested while the cached fingerprint
+    matches, the rules are read when it is missing, different or older than RULES_CACHE_TTL, and written only
+    when the sheet really differs. Returns whether the rules were written
+    """
+    key = f"{sheet.spreadsheet.id}/{sheet.id}"
+    fingerprint = rules_fingerprint(desired)
 
-    queue.put(45)
-
-    rules = get_conditional_format_rules(sheet)
-
-    rules.clear()
+    cached = load_fingerprints().get(key)
+    if cached is not None and cached["fingerprint"] == fingerprint and time.time() - cached["checked"] < RULES_CACHE_TTL:
+        return False
 
     queue.put(50)
 
-    x_rule_pass = conditional_rule(sheet,'F:F',rule_dict["pass"],['39.5','39.7'],rule_dict["green"]) 
-    rules.append(x_rule_pass)
-
-    x_rule_fail = conditional_rule(sheet,'F:F',rule_dict["fail"],['39.5','39.7'],rule_dict["red"]) 
-    rules.append(x_rule_fail)
-
-    queue.put(55)
-
-    y_rule_pass = conditional_rule(sheet,'G:G',rule_dict["pass"],['40.50','40.70'],rule_dict["green"])
-    rules.append(y_rule_pass)
-    
-    y_rule_fail = conditional_rule(sheet,'G:G',rule_dict["fail"],['40.50','40.70'],rule_dict["red"])
-    rules.append(y_rule_fail)
+    rules = get_conditional_format_rules(sheet)
+    if rules_fingerprint(rules) == fingerprint:
+        store_fingerprint(key, fingerprint)
+        return False
 
     queue.put(60)
 
-    quad_rule_pass = conditional_rule(sheet,'H:K',rule_dict["pass"],['201.0','301.0'],rule_dict["green"])
-    rules.append(quad_rule_pass)
-    
-    quad_rule_fail = conditional_rule(sheet,'H:K',rule_dict["fail"],['201.0','301.0'],rule_dict["red"])
-    rules.append(quad_rule_fail)
-
-    queue.put(65)
+    # Replaces every rule, duplicates left by earlier uploads included
+    rules.clear()
+    rules.extend(desired)
+    rules.save()
+    store_fingerprint(key, fingerprint)
+    logging.info(f"Conditional format rules of {sheet.title} updated")
+    return True
 
-    hv_rule_pass = conditional_rule(sheet,'P:P',rule_dict["pass"],['1.701','2.001'],rule_dict["green"])
-    rules.append(hv_rule_pass)
-    
-    hv_rule_fail = conditional_rule(sheet,'P:P',rule_dict["fail"],['1.701','2.001'],rule_dict["red"])
-    rules.append(hv_rule_fail)
+def hybrid_rules(sheet: worksheet,queue: Queue):
+    """
+    Creating and storing custom rules for the Hybrid spreadsheet
+    """
 
-    queue.put(70)
-    
-    ftm_rule_pass = conditional_rule(sheet,'Q:Q',rule_dict["pass"],['1.521','1.761'],rule_dict["green"])
-    rules.append(ftm_rule_pass)
-    
-    ftm_rule_fail = conditional_rule(sheet,'Q:Q',rule_dict["fail"],['1.521','1.761'],rule_dict["red"])
-    rules.append(ftm_rule_fail)
+    queue.put(45)
 
-    rules.save()
+    sync_rules(sheet,spec_rules(sheet,"flex",hybrid_columns),queue)
 
     queue.put(75)
 
@@ -80,57 +170,7 @@ def bare_rules(sheet: worksheet,queue: Queue):
     """
     queue.put(45)
 
-    rules = get_conditional_format_rules(sheet)
-
-    rules.clear()
-
-    queue.put(50)
-
-    fex_rule_pass = conditional_rule(sheet,'G:G',rule_dict["pass"],['42.187','42.257'],rule_dict["green"])
-    rules.append(fex_rule_pass)
-    
-    fex_rule_fail = conditional_rule(sheet,'G:G',rule_dict["fail"],['42.187','42.257'],rule_dict["red"])
-    rules.append(fex_rule_fail)
-
-    queue.put(55)
-
-    fey_rule_pass = conditional_rule(sheet,'H:H',rule_dict["pass"],['40.255','40.325'],rule_dict["green"])
-    rules.append(fey_rule_pass)
-    
-    fey_rule_fail = conditional_rule(sheet,'H:H',rule_dict["fail"],['40.255','40.325'],rule_dict["red"])
-    rules.append(fey_rule_fail)
-
-    queue.put(60)
-
-    senx_rule_pass = conditional_rule(sheet,'I:I',rule_dict["pass"],['39.5','39.55'],rule_dict["green"])
-    rules.append(senx_rule_pass)
-
-    senx_rule_fail = conditional_rule(sheet,'I:I',rule_dict["fail"],['39.5','39.55'],rule_dict["red"])
-    rules.append(senx_rule_fail)
-
-    queue.put(65)
-
-    seny_rule_pass = conditional_rule(sheet,'J:J',rule_dict["pass"],['41.0','41.15'],rule_dict["green"])
-    rules.append(seny_rule_pass)
-
-    seny_rule_fail = conditional_rule(sheet,'J:J',rule_dict["fail"],['41.0','41.15'],rule_dict["red"])
-    rules.append(seny_rule_fail)
-
-    queue.put(70)
-
-    fe_rule_pass = conditional_rule(sheet,'K:K',rule_dict["pass"],['0.140','0.175'],rule_dict["green"])
-    rules.append(fe_rule_pass)
-
-    fe_rule_fail = conditional_rule(sheet,'K:K',rule_dict["fail"],['0.140','0.175'],rule_dict["red"])
-    rules.append(fe_rule_fail)
-
-    bare_rule_pass = conditional_rule(sheet,'M:M',rule_dict["pass"],['0.285','0.415'],rule_dict["green"])
-    rules.append(bare_rule_pass)
-
-    bare_rule_fail = conditional_rule(sheet,'M:M',rule_dict["fail"],['0.285','0.415'],rule_dict["red"])
-    rules.append(bare_rule_fail)
-
-    rules.save()
+    sync_rules(sheet,spec_rules(sheet,"bare",bare_columns),queue)
 
     queue.put(75)
 
@@ -141,48 +181,6 @@ def assem_rules(sheet: worksheet,queue: Queue):
     """
     queue.put(45)
 
-    rules = get_conditional_format_rules(sheet)
-
-    queue.put(50)
-
-    xa_rule_pass = conditional_rule(sheet,'H:H',rule_dict["pass"],['42.187','42.257'],rule_dict["green"])
-    rules.append(xa_rule_pass)
-    
-    xa_rule_fail = conditional_rule(sheet,'H:H',rule_dict["fail"],['42.187','42.257'],rule_dict["red"])
-    rules.append(xa_rule_fail)
-
-    queue.put(55)
-
-    ya_rule_pass = conditional_rule(sheet,'I:I',rule_dict["pass"],['41.0','41.15'],rule_dict["green"])
-    rules.append(ya_rule_pass)
-    
-    ya_rule_fail = conditional_rule(sheet,'I:I',rule_dict["fail"],['41.0','41.15'],rule_dict["red"])
-    rules.append(ya_rule_fail)
-
-    queue.put(60)
-
-    quadA_rule_pass = conditional_rule(sheet,'J:N',rule_dict["pass"],['466.0','721.0'],rule_dict["green"])
-    rules.append(quadA_rule_pass)
-    
-    quadA_rule_fail = conditional_rule(sheet,'J:N',rule_dict["fail"],['466.0','721.0'],rule_dict["red"])
-    rules.append(quadA_rule_fail)
-
-    queue.put(65)
-
-    ftma_rule_pass = conditional_rule(sheet,'S:S',rule_dict["pass"],['1.781','2.181'],rule_dict["green"])
-    rules.append(ftma_rule_pass)
-    
-    ftma_rule_fail = conditional_rule(sheet,'S:S',rule_dict["fail"],['1.781','2.181'],rule_dict["red"])
-    rules.append(ftma_rule_fail)
-
-    queue.put(70)
-
-    hva_rule_pass = conditional_rule(sheet,'T:T',rule_dict["pass"],['1.961','2.531'],rule_dict["green"])
-    rules.append(hva_rule_pass)
-    
-    hva_rule_fail = conditional_rule(sheet,'T:T',rule_dict["fail"],['1.961','2.531'],rule_dict["red"])
-    rules.append(hva_rule_fail)
-
-    rules.save()
+    sync_rules(sheet,spec_rules(sheet,"assem",assem_columns),queue)
 
     queue.put(75)
\ No newline at end of file
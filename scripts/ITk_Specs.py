@@ -0,0 +1,263 @@
+import numpy as np
+
+"""
+Pass/fail specifications of the metrology and pull test stages. Every stage has one versioned table of
+criteria (metric, limits) and the pass/fail verdicts built from them, in the order of the "pass_fail"
+list of the results. A table compiles into limit arrays, so a whole batch of measurements is checked in
+one vectorized call - the engine checks a single measurement the same way, the Google Sheet rules colour
+the cells with the same limits, and re-evaluating the stored history after a spec revision is one call.
+"""
+
+class Criterion:
+
+    def __init__(self, name: str, metric: str, low: float = None, high: float = None, strict: tuple = (),
+                 width: int = 1, unit: str = ""):
+        """
+        name - criterion name, the column label of the evaluated matrix
+        metric - key of the measured value in the metrics dictionary
+        low, high - limits, None for an open side; limits are inclusive unless named in strict ("low", "high")
+        width - number of values of a per-element metric (e.g. the 4 pick-up areas), missing elements are skipped
+        unit - unit of the metric and the limits
+        """
+        self.name = name
+        self.metric = metric
+        self.low = low
+        self.high = high
+        self.strict = strict
+        self.width = width
+        self.unit = unit
+
+    def columns(self):
+        if self.width == 1:
+            return [self.name]
+        return [f"{self.name}[{element}]" for element in range(self.width)]
+
+    def describe(self):
+        text = self.metric
+        if self.low is not None:
+            text = f"{self.low} {'<' if 'low' in self.strict else '<='} {text}"
+        if self.high is not None:
+            text = f"{text} {'<' if 'high' in self.strict else '<='} {self.high}"
+        return f"{text} {self.unit}".rstrip()
+
+class SpecTable:
+
+    def __init__(self, stage: str, version: int, criteria: list, verdicts: list):
+        """
+        stage - "flex", "bare", "assem" or "pulltest"
+        version - revision of the limits, raised with every change of the table
+        criteria - Criterion list
+        verdicts - (verdict name, criterion names) in the order of the pass_fail list, a verdict passes when
+        all of its criteria pass; a per-element criterion gives one verdict per measured element.
+        Criteria in no verdict are evaluated and shown on the sheet only
+        """
+        self.stage = stage
+        self.version = version
+        self.criteria = {criterion.name: criterion for criterion in criteria}
+        self.verdicts = verdicts
+
+        # Limit arrays, one column per criterion element
+        self.columns = [column for criterion in criteria for column in criterion.columns()]
+        self.column_criteria = [criterion for criterion in criteria for _ in range(criterion.width)]
+        self.lows = np.array([-np.inf if c.low is None else c.low for c in self.column_criteria], dtype=np.float64)
+        self.highs = np.array([np.inf if c.high is None else c.high for c in self.column_criteria], dtype=np.float64)
+        self.strict_low = np.array(["low" in c.strict for c in self.column_criteria])
+        self.strict_high = np.array(["high" in c.strict for c in self.column_criteria])
+        # Columns of per-element criteria, whose missing elements are skipped rather than failed
+        self.element_columns = np.array([c.width > 1 for c in self.column_criteria])
+
+        # Columns of every criterion and the columns deciding the overall verdict
+        self.criterion_columns = {}
+        start = 0
+        for criterion in criteria:
+            self.criterion_columns[criterion.name] = slice(start, start + criterion.width)
+            start += criterion.width
+        self.verdict_columns = np.zeros(len(self.columns), dtype=bool)
+        for _, names in verdicts:
+            for name in names:
+                self.verdict_columns[self.criterion_columns[name]] = True
+
+    @property
+    def key(self):
+        return f"{self.stage}/v{self.version}"
+
+    def values(self, metrics):
+        """
+        (N, C) array of the measured values - metrics is one measurement (metric -> value) or a list of them.
+        Missing per-element values are NaN
+        """
+        rows = [metrics] if isinstance(metrics, dict) else metrics
+
+        blocks = []
+        for criterion in self.criteria.values():
+            if criterion.width == 1:
+                blocks.append(np.array([row[criterion.metric] for row in rows], dtype=np.float64).reshape(-1, 1))
+                continue
+            block = np.full((len(rows), criterion.width), np.nan)
+            for index, row in enumerate(rows):
+                elements = row[criterion.metric]
+                if len(elements) > criterion.width:
+                    raise ValueError(f"{criterion.metric} has {len(elements)} values, at most {criterion.width} expected")
+                block[index, :len(elements)] = elements
+            blocks.append(block)
+
+        return np.hstack(blocks)
+
+    def evaluate(self, metrics):
+        """
+        Per-criterion pass/fail of a batch - (N, C) boolean matrix with the columns of self.columns,
+        False where a value is outside the limits or missing
+        """
+        values = metrics if isinstance(metrics, np.ndarray) else self.values(metrics)
+        above = np.where(self.strict_low, values > self.lows, values >= self.lows)
+        below = np.where(self.strict_high, values < self.highs, values <= self.highs)
+        return above & below
+
+    def passed(self, metrics):
+        """
+        Overall verdict of every measurement of a batch, as all() of its pass_fail list - a missing
+        element of a per-element criterion is skipped, a missing single value fails as in check()
+        """
+        values = metrics if isinstance(metrics, np.ndarray) else self.values(metrics)
+        matrix = self.evaluate(values) | (np.isnan(values) & self.element_columns)
+        return matrix[:, self.verdict_columns].all(axis=1)
+
+    def check(self, metrics: dict):
+        """
+        Verdicts of a single measurement - verdict name -> bool, or a list of bools for a per-element criterion
+        """
+        values = self.values(metrics)
+        matrix = self.evaluate(values)[0]
+        present = ~np.isnan(values[0])
+
+        checks = {}
+        for name, criteria in self.verdicts:
+            columns = [self.criterion_columns[criterion] for criterion in criteria]
+            if len(columns) == 1 and self.criteria[criteria[0]].width > 1:
+                checks[name] = matrix[columns[0]][present[columns[0]]].tolist()
+            else:
+                checks[name] = bool(all(matrix[column].all() for column in columns))
+        return checks
+
+    def pass_fail(self, checks: dict):
+        """
+        pass_fail list of the results from the verdicts given by check()
+        """
+        pass_fail = []
+        for name, _ in self.verdicts:
+            if isinstance(checks[name], list):
+                pass_fail.extend(checks[name])
+            else:
+                pass_fail.append(checks[name])
+        return pass_fail
+
+# Every revision of the tables, the highest version of a stage is the one in use
+spec_history = {
+    "flex": {1: SpecTable("flex", 1, [
+        Criterion("x_dimension", "x_dimension", 39.50, 39.70, unit="mm"),
+        Criterion("y_dimension", "y_dimension", 40.50, 40.70, unit="mm"),
+        Criterion("hv_thickness", "hv_thickness", 1.701, 2.540, unit="mm"),
+        Criterion("ga_thickness", "ga_thickness", 0.201, 0.301, width=4, unit="mm"),
+        Criterion("ftm_thickness", "ftm_flex_thickness", 1.521, 1.761, unit="mm"),
+    ], [
+        ("xy_envelope", ("x_dimension", "y_dimension")),
+        ("hv_envelope", ("hv_thickness",)),
+        ("ga_pass", ("ga_thickness",)),
+        ("ftm_pass", ("ftm_thickness",)),
+    ])},
+    "bare": {1: SpecTable("bare", 1, [
+        Criterion("fe_x", "fe_x", 42.00, 42.350, unit="mm"),
+        Criterion("fe_y", "fe_y", 40.200, 40.450, unit="mm"),
+        Criterion("sensor_x", "sensor_x", 39.2, 39.80, unit="mm"),
+        Criterion("sensor_y", "sensor_y", 41.00, 41.15, unit="mm"),
+        Criterion("bare_thickness", "avg_bare_thickness", 250.0, 415.0, unit="µm"),
+        Criterion("fe_thickness", "avg_fe_thickness", 80.0, 250.0, unit="µm"),
+    ], [
+        ("fe_pass", ("fe_y", "fe_x")),
+        ("sensor_pass", ("sensor_y", "sensor_x")),
+        ("bare_thick_pass", ("bare_thickness",)),
+        ("fe_thick_pass", ("fe_thickness",)),
+    ])},
+    "assem": {1: SpecTable("assem", 1, [
+        Criterion("ftm_thickness", "ftm_thickness", 1831.0, 2231.0, unit="µm"),
+        Criterion("hv_thickness", "hv_assem_thickness", high=2540.0, unit="µm"),
+        Criterion("ga_thickness", "avg_assem_thickness", high=771.0, width=4, unit="µm"),
+        Criterion("fiducial_br_x", "fiducial_br_x", 2.119, 2.319, unit="mm"),
+        Criterion("fiducial_br_y", "fiducial_br_y", 0.650, 0.850, unit="mm"),
+        Criterion("fiducial_tl_x", "fiducial_tl_x", 2.119, 2.319, unit="mm"),
+        Criterion("fiducial_tl_y", "fiducial_tl_y", 0.650, 0.850, unit="mm"),
+        # Shown on the sheet, not part of the verdict
+        Criterion("x_value", "x_value", 42.187, 42.257, unit="mm"),
+        Criterion("y_value", "y_value", 41.00, 41.15, unit="mm"),
+    ], [
+        ("ftm_pass", ("ftm_thickness",)),
+        ("hv_pass", ("hv_thickness",)),
+        ("assem_pass", ("ga_thickness",)),
+        ("fbr_pass", ("fiducial_br_x", "fiducial_br_y")),
+        ("ftl_pass", ("fiducial_tl_x", "fiducial_tl_y")),
+    ])},
+    "pulltest": {1: SpecTable("pulltest", 1, [
+        Criterion("mean_pull", "mean_pull", low=8.00, unit="g"),
+        Criterion("standard_deviation", "standard_deviation", high=1.50, unit="g"),
+        Criterion("before5g", "before5g_count", high=0),
+        Criterion("percentage_3or4", "percentage_3or4", high=10.00, strict=("high",), unit="%"),
+    ], [
+        ("mean_pass", ("mean_pull",)),
+        ("stdev_pass", ("standard_deviation",)),
+        ("b5g_pass", ("before5g",)),
+        ("per3or4_pass", ("percentage_3or4",)),
+    ])},
+}
+
+# Tables in use
+specs = {stage: tables[max(tables)] for stage, tables in spec_history.items()}
+
+def spec_table(stage: str, version: int = None):
+    """
+    Table of a stage, the one in use unless an earlier version is asked for
+    """
+    if version is None:
+        return specs[stage]
+    return spec_history[stage][version]
+
+def metrics_from_results(stage: str, stage_results: dict):
+    """
+    Metrics of stored stage results for re-evaluating them against another table. The results keep some
+    values rounded (bare thicknesses, fiducials, pull test statistics), so a value within rounding of a
+    limit can come out differently than when it was measured
+    """
+    if stage == "flex":
+        return {"x_dimension": stage_results["x_dimension"],
+                "y_dimension": stage_results["y_dimension"],
+                "hv_thickness": stage_results["hv_thickness"],
+                "ga_thickness": stage_results["quad_thickness"],
+                "ftm_flex_thickness": stage_results["ftm_flex_thickness"]}
+    if stage == "bare":
+        return {key: stage_results[key] for key in ("fe_x", "fe_y", "sensor_x", "sensor_y",
+                                                    "avg_bare_thickness", "avg_fe_thickness")}
+    if stage == "assem":
+        return {"ftm_thickness": stage_results["ftm_thickness"],
+                "hv_assem_thickness": stage_results["hv_assem_thickness"],
+                "avg_assem_thickness": stage_results["avg_assem_thickness"],
+                "fiducial_br_x": stage_results["fiducial_br"][0]/1000,
+                "fiducial_br_y": stage_results["fiducial_br"][1]/1000,
+                "fiducial_tl_x": stage_results["fiducial_tl"][0]/1000,
+                "fiducial_tl_y": stage_results["fiducial_tl"][1]/1000,
+                "x_value": stage_results["x_value"],
+                "y_value": stage_results["y_value"]}
+    if stage == "pulltest":
+        before5g = stage_results["before5g_wires"]
+        return {"mean_pull": stage_results["mean_pull"],
+                "standard_deviation": stage_results["standard_deviation"],
+                "before5g_count": len(before5g) if isinstance(before5g, list) else 0,
+                "percentage_3or4": stage_results["percentage_3or4"]}
+    raise ValueError(f"Unknown stage {stage}")
+
+def evaluate_history(stage: str, stage_results: list, version: int = None):
+    """
+    Re-evaluates a list of stored stage results against a table - returns the (N, C) per-criterion
+    matrix and the overall verdicts
+    """
+    table = spec_table(stage, version)
+    values = table.values([metrics_from_results(stage, results) for results in stage_results])
+    return table.evaluate(values), table.passed(values)
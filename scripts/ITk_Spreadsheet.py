@@ -1,14 +1,21 @@
 import gspread
 from gspread import Worksheet
+from gspread.utils import rowcol_to_a1
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
+import logging
+import os
 import re
+import threading
 import tkinter.messagebox as box
 from gspread_formatting import *
 from tkinter import simpledialog
 from ITk_SheetRules import *
+from ITk_SheetIndex import SheetIndex, resolve_rows
 from statistics import mean
 import webbrowser
 import multiprocessing
+from queue import SimpleQueue
 
 """
 ITk Pixel Module Assembly Google Spreadsheet Automation:
@@ -19,62 +26,107 @@ as the program is run.
 # The scope of API operations
 scopes = ['https://www.googleapis.com/auth/spreadsheets']
 
-# Appending the credentials for editing sheets
-creds = Credentials.from_service_account_file("assets/credentials.json", scopes = scopes)
-
-# Authorising the client with given credentials
-client = gspread.authorize(creds)
+# Credentials for editing sheets
+credentials_file = "assets/credentials.json"
 
 sheet_id = "1O54CRUXG36WApvoALbAuL7MGo8sgtVgdQhKCYmQvUXY"
-workbook  = client.open_by_key(sheet_id)
 
-def upload_sh(results: dict,queue: multiprocessing.Queue):
+# Open the workbook in the background after login, so the first upload does not wait for Google.
+# ITK_SHEETS_WARM_UP=0 (.env file) leaves it to the first upload
+SHEETS_WARM_UP = os.environ.get("ITK_SHEETS_WARM_UP", "1") != "0"
+
+# Client and workbook, created the first time the sheet is used and kept for the rest of the session
+_client = None
+_workbook = None
+_lock = threading.Lock()
+
+def sheets_workbook():
+    """
+    Workbook of the tracking sheet. The client is authorised and the workbook opened on the first call only,
+    later calls reuse both - and the open connections of the client session - so nothing talks to Google
+    before something is uploaded
+    """
+    global _client, _workbook
+    with _lock:
+        if _workbook is None:
+            if _client is None:
+                creds = Credentials.from_service_account_file(credentials_file, scopes = scopes)
+                _client = gspread.authorize(creds)
+            _workbook = _client.open_by_key(sheet_id)
+        return _workbook
+
+def warm_up():
+    """
+    Opens the workbook in a background thread, failures (offline, no credentials) are left to the upload
+    """
+    def open_workbook():
+        try:
+            sheets_workbook()
+        except Exception as e:
+            logging.info(f"Google Sheets could not be opened in advance\n{e}")
+
+    thread = threading.Thread(target=open_workbook, name="sheets-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def _after_fork():
+    """
+    Uploads of the GUI run in a forked process - it keeps the token and the opened workbook, but gets its own
+    lock and session, since the parent's lock may be held and its connections cannot be shared
+    """
+    global _lock
+    _lock = threading.Lock()
+    if _client is not None:
+        _client.http_client.session = AuthorizedSession(_client.http_client.auth)
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def upload_sh(results: dict,queue: multiprocessing.Queue,prompts: dict = None):
+
+    """
+    prompts - answers given up front instead of the dialogs (command line): "assembled" ("yes"/"no"),
+    "date_assembled" and "open_results" ("yes"/"no")
+    """
 
     queue.put(5)
 
+    workbook = sheets_workbook()
+
     if re.match("PCB", results['component']['componentType']['code'], re.IGNORECASE):
 
         # Selecting worksheets
         sheet = workbook.worksheet("Hybrids")
 
-        # Fidning if component name is already in the spreadsheet
-        comp_name = sheet.find(results['component_id'])
-
-        # New bottom row if the component is not in the spreadsheet
-        new_row = len(sheet.col_values(1)) + 1
+        # Row of the component from the local row index, a new bottom row if it is not in the spreadsheet
+        index = SheetIndex(sheet)
+        row = index.row(results['component_id'])
 
         queue.put(10)
 
-        if not comp_name:
-            hybrid_cells(sheet,new_row,results,queue)
-        else:
-            hybrid_cells(sheet,comp_name.row,results,queue)
+        hybrid_cells(sheet,row,results,queue,prompts)
+        index.written(results['component_id'],row)
         hybrid_rules(sheet,queue)
 
     if re.match("BARE_MODULE", results['component']['componentType']['code'], re.IGNORECASE):
 
         sheet = workbook.worksheet("Bare modules") 
-        comp_name = sheet.find(results['component_id'])
-        new_row = len(sheet.col_values(1)) + 1
+        index = SheetIndex(sheet)
+        row = index.row(results['component_id'])
         queue.put(10)
 
-        if not comp_name:
-            bare_cells(sheet,new_row,results,queue)
-        else:
-            bare_cells(sheet,comp_name.row,results,queue)
+        bare_cells(sheet,row,results,queue,prompts)
+        index.written(results['component_id'],row)
         bare_rules(sheet,queue)
 
     if re.match("MODULE", results['component']['componentType']['code'], re.IGNORECASE):
 
         sheet = workbook.worksheet("Assembled modules") 
-        comp_name = sheet.find(results['component_id'])
-        new_row = len(sheet.col_values(1)) + 1
+        index = SheetIndex(sheet)
+        row = index.row(results['component_id'])
         queue.put(10)
 
-        if not comp_name:
-            assem_cells(sheet,new_row,results,queue)
-        else:
-            assem_cells(sheet,comp_name.row,results,queue)
+        assem_cells(sheet,row,results,queue,prompts)
+        index.written(results['component_id'],row)
         assem_rules(sheet,queue)
 
     # Signal the process is complete
@@ -82,105 +134,254 @@ def upload_sh(results: dict,queue: multiprocessing.Queue):
     queue.put(95)
     queue.put(100)
 
-    open_site = box.askquestion("Results", "Upload successful - Would you like to open the results in a browser?")
+    open_site = prompt(prompts, "open_results",
+                       lambda: box.askquestion("Results", "Upload successful - Would you like to open the results in a browser?"))
     if open_site == "yes":
         # Opening test web page
         webbrowser.open(f"https://docs.google.com/spreadsheets/d/{sheet_id}/edit?gid=0#gid=0",new = 2)
     else:
         return
 
-def hybrid_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue):
+class RowUpdate:
+    """
+    Cells and background colours of one sheet row, collected and then written with one values request
+    covering the row and one spreadsheets.batchUpdate for the colours, instead of a request per cell.
+    Columns that are not set are left as they are in the sheet
+    """
+
+    def __init__(self, sheet: gspread.Worksheet, row: int):
+        self.sheet = sheet
+        self.row = row
+        self.values = {}
+        self.backgrounds = {}
+
+    def set(self, column: int, value):
+        self.values[column] = value
+
+    def background(self, column: int, color: dict):
+        self.backgrounds[column] = color
+
+    def value_range(self):
+        """
+        Row range of the values request, unset columns in between are sent as null and skipped by the API
+        """
+        first, last = min(self.values), max(self.values)
+        title = self.sheet.title.replace("'", "''")
+        return {"range": f"'{title}'!{rowcol_to_a1(self.row, first)}:{rowcol_to_a1(self.row, last)}",
+                "values": [[self.values.get(column) for column in range(first, last + 1)]]}
+
+    def format_requests(self):
+        return [{"repeatCell": {"range": {"sheetId": self.sheet.id,
+                                          "startRowIndex": self.row - 1,
+                                          "endRowIndex": self.row,
+                                          "startColumnIndex": column - 1,
+                                          "endColumnIndex": column},
+                                "cell": {"userEnteredFormat": {"backgroundColor": color}},
+                                "fields": "userEnteredFormat.backgroundColor"}}
+                for column, color in self.backgrounds.items()]
+
+    def write(self):
+        write_rows(self.sheet.spreadsheet, [self])
+
+def write_rows(workbook: gspread.Spreadsheet, updates: list):
+    """
+    Values of any number of RowUpdates of a workbook in one values request, their colours in one batchUpdate
+    """
+    data = [update.value_range() for update in updates if update.values]
+    requests = [request for update in updates for request in update.format_requests()]
+    # Entered as if typed in, as update_cell() did, so dates and numbers are parsed by the sheet
+    if data:
+        workbook.values_batch_update({"valueInputOption": "USER_ENTERED", "data": data})
+    if requests:
+        workbook.batch_update({"requests": requests})
+
+def hybrid_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue,prompts: dict = None):
 
     """
-    Updating cells for the hybrid component using update_cell function
+    Updating cells for the hybrid component, the whole row is written at once
     """
 
-    sheet.update_cell(row, 1, results['component_id'])
-    sheet.update_cell(row, 3, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
-    sheet.update_cell(row, 4, results['component']['currentLocation']['name'])
     queue.put(15)
-    assembly_call(sheet,row,results)
-    sheet.update_cell(row, 6, results["flex_results"]["x_dimension"])
-    sheet.update_cell(row, 7, results["flex_results"]["y_dimension"])
+    update = hybrid_row(sheet,row,results,prompts)
     queue.put(20)
-    sheet.update_cell(row, 8, results["flex_results"]["quad_thickness"][0]*1000)
-    sheet.update_cell(row, 9, results["flex_results"]["quad_thickness"][1]*1000)
-    sheet.update_cell(row, 10, results["flex_results"]["quad_thickness"][2]*1000)
-    queue.put(25)
-    sheet.update_cell(row, 11, results["flex_results"]["quad_thickness"][3]*1000)
-    sheet.update_cell(row, 12, results["flex_results"]["avg_thickness"]*1000)
-    sheet.format(f"L{row}", {"backgroundColor": {"red": 0.85,"green": 0.85,"blue": 0.85}})
-    queue.put(30)
-    sheet.update_cell(row, 13, results["flex_results"]["avg_stdev"]*1000)
-    sheet.update_cell(row, 15, results['mass'])
-    sheet.update_cell(row, 16, results["flex_results"]["hv_thickness"])
-    sheet.update_cell(row, 17, results["flex_results"]["ftm_flex_thickness"])
+    update.write()
 
     queue.put(40)
 
-def bare_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue):
+def hybrid_row(sheet: gspread.Worksheet,row: int,results: dict,prompts: dict = None):
+
+    update = RowUpdate(sheet, row)
+    update.set(1, results['component_id'])
+    update.set(3, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
+    update.set(4, results['component']['currentLocation']['name'])
+    assembly_call(update,results,prompts)
+    update.set(6, results["flex_results"]["x_dimension"])
+    update.set(7, results["flex_results"]["y_dimension"])
+    update.set(8, results["flex_results"]["quad_thickness"][0]*1000)
+    update.set(9, results["flex_results"]["quad_thickness"][1]*1000)
+    update.set(10, results["flex_results"]["quad_thickness"][2]*1000)
+    update.set(11, results["flex_results"]["quad_thickness"][3]*1000)
+    update.set(12, results["flex_results"]["avg_thickness"]*1000)
+    update.background(12, {"red": 0.85,"green": 0.85,"blue": 0.85})
+    update.set(13, results["flex_results"]["avg_stdev"]*1000)
+    update.set(15, results['mass'])
+    update.set(16, results["flex_results"]["hv_thickness"])
+    update.set(17, results["flex_results"]["ftm_flex_thickness"])
+    return update
+
+def bare_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue,prompts: dict = None):
 
-    sheet.update_cell(row, 1, results['component_id'])
     queue.put(15)
-    assembly_call(sheet,row,results)
-    sheet.update_cell(row, 6, results['mass'])
-    sheet.update_cell(row, 7, results["bare_results"]["fe_x"])
+    update = bare_row(sheet,row,results,prompts)
     queue.put(20)
-    sheet.update_cell(row, 8, results["bare_results"]["fe_y"])
-    sheet.update_cell(row, 9, results["bare_results"]["sensor_x"])
-    queue.put(25)
-    sheet.update_cell(row, 10, results["bare_results"]["sensor_y"])
-    sheet.update_cell(row, 11, results["bare_results"]["avg_fe_thickness"]*0.001)
-    queue.put(30)
-    sheet.update_cell(row, 12, results["bare_results"]["avg_stdev_fe"])
-    sheet.update_cell(row, 13, results["bare_results"]["avg_bare_thickness"]*0.001)
-    queue.put(35)
-    sheet.update_cell(row, 14, results["bare_results"]["avg_stdev_bare"])
-    sheet.update_cell(row, 18, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
+    update.write()
 
     queue.put(40)
 
-def assem_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue):
+def bare_row(sheet: gspread.Worksheet,row: int,results: dict,prompts: dict = None):
+
+    update = RowUpdate(sheet, row)
+    update.set(1, results['component_id'])
+    assembly_call(update,results,prompts)
+    update.set(6, results['mass'])
+    update.set(7, results["bare_results"]["fe_x"])
+    update.set(8, results["bare_results"]["fe_y"])
+    update.set(9, results["bare_results"]["sensor_x"])
+    update.set(10, results["bare_results"]["sensor_y"])
+    update.set(11, results["bare_results"]["avg_fe_thickness"]*0.001)
+    update.set(12, results["bare_results"]["avg_stdev_fe"])
+    update.set(13, results["bare_results"]["avg_bare_thickness"]*0.001)
+    update.set(14, results["bare_results"]["avg_stdev_bare"])
+    update.set(18, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
+    return update
+
+def assem_cells(sheet: gspread.Worksheet,row: int,results: dict,queue: multiprocessing.Queue,prompts: dict = None):
 
-    sheet.update_cell(row, 1, results['component']['currentLocation']['name'])
     queue.put(15)
-    sheet.update_cell(row, 2, simpledialog.askstring(title="Date Assembled",
-                                                            prompt="When was the module assembled? (dd/mm/yy)"))
-    sheet.update_cell(row, 5, results['component_id'])
-    sheet.update_cell(row, 6, results['carrier'])
+    update = assem_row(sheet,row,results,prompts)
     queue.put(20)
-    sheet.update_cell(row, 7, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
-    sheet.update_cell(row, 8, results["assem_results"]["x_value"])
-    sheet.update_cell(row, 9, results["assem_results"]["y_value"])
-    queue.put(25)
-    sheet.update_cell(row, 10, results["assem_results"]["avg_assem_thickness"][0])
-    sheet.update_cell(row, 11, results["assem_results"]["avg_assem_thickness"][1])
-    sheet.update_cell(row, 12, results["assem_results"]["avg_assem_thickness"][2])
-    queue.put(30)
-    sheet.update_cell(row, 13, results["assem_results"]["avg_assem_thickness"][3])
-    sheet.update_cell(row, 14, mean(results["assem_results"]["avg_assem_thickness"]))
-    sheet.update_cell(row, 15, results["assem_results"]["quad_stdev_all"])
-    queue.put(35)
-    sheet.update_cell(row, 17, results['mass'])
-    sheet.update_cell(row, 19, results["assem_results"]["ftm_thickness"]*0.001)
-    sheet.update_cell(row, 20, results["assem_results"]["hv_assem_thickness"]*0.001)
+    update.write()
 
     queue.put(40)
 
-def assembly_call(sheet: gspread.Worksheet,row: int,results: dict):
+def assem_row(sheet: gspread.Worksheet,row: int,results: dict,prompts: dict = None):
+
+    update = RowUpdate(sheet, row)
+    update.set(1, results['component']['currentLocation']['name'])
+    update.set(2, prompt(prompts, "date_assembled",
+                         lambda: simpledialog.askstring(title="Date Assembled",
+                                                        prompt="When was the module assembled? (dd/mm/yy)")))
+    update.set(5, results['component_id'])
+    update.set(6, results['carrier'])
+    update.set(7, f"https://itkpd-test.unicorncollege.cz/componentView?code={results['component']['code']}")
+    update.set(8, results["assem_results"]["x_value"])
+    update.set(9, results["assem_results"]["y_value"])
+    update.set(10, results["assem_results"]["avg_assem_thickness"][0])
+    update.set(11, results["assem_results"]["avg_assem_thickness"][1])
+    update.set(12, results["assem_results"]["avg_assem_thickness"][2])
+    update.set(13, results["assem_results"]["avg_assem_thickness"][3])
+    update.set(14, mean(results["assem_results"]["avg_assem_thickness"]))
+    update.set(15, results["assem_results"]["quad_stdev_all"])
+    update.set(17, results['mass'])
+    update.set(19, results["assem_results"]["ftm_thickness"]*0.001)
+    update.set(20, results["assem_results"]["hv_assem_thickness"]*0.001)
+    return update
+
+def assembly_call(update: RowUpdate,results: dict,prompts: dict = None):
 
     """
     Yes/No call to state whether the hybrid flex has been assembled
     """
     if results['component']['componentType']['code'] == "PCB":
-        call_choice = box.askquestion("Assembly Call", "Is this flex assembled?")
+        call_choice = prompt(prompts, "assembled", lambda: box.askquestion("Assembly Call", "Is this flex assembled?"))
     else:
-        call_choice = box.askquestion("Assembly Call", "Is this bare module assembled?")
+        call_choice = prompt(prompts, "assembled", lambda: box.askquestion("Assembly Call", "Is this bare module assembled?"))
 
     if call_choice == "yes":
-        sheet.update_cell(row, 5, "Yes")
-        sheet.format(f"E{row}", {"backgroundColor": {"red": 0.8,"green": 1.0,"blue": 0.8}})
+        update.set(5, "Yes")
+        update.background(5, {"red": 0.8,"green": 1.0,"blue": 0.8})
     else: 
-        sheet.update_cell(row, 5, "No")
+        update.set(5, "No")
         if results['component']['componentType']['code'] == "BARE_MODULE":
-            sheet.format(f"E{row}", {"backgroundColor": {"red": 1.0,"green": 0.9,"blue": 0.9}})
\ No newline at end of file
+            update.background(5, {"red": 1.0,"green": 0.9,"blue": 0.9})
+
+def prompt(prompts: dict,key: str,dialog):
+    """
+    Answer given up front in prompts, otherwise asked with the dialog
+    """
+    if prompts is not None and key in prompts:
+        return prompts[key]
+    return dialog()
+
+# Worksheet of every component type (start of the type code, as matched by upload_sh), its row and its rules
+component_sheets = {"PCB": "Hybrids",
+                    "BARE_MODULE": "Bare modules",
+                    "MODULE": "Assembled modules"}
+sheet_rows = {"Hybrids": hybrid_row,
+              "Bare modules": bare_row,
+              "Assembled modules": assem_row}
+sheet_rules = {"Hybrids": hybrid_rules,
+               "Bare modules": bare_rules,
+               "Assembled modules": assem_rules}
+
+def component_sheet(results: dict):
+    code = results['component']['componentType']['code']
+    for pattern, title in component_sheets.items():
+        if re.match(pattern, code, re.IGNORECASE):
+            return title
+    return None
+
+def upload_many(results_list: list,queue: multiprocessing.Queue = None,prompts: dict = None):
+
+    """
+    Writes the results of many components - hybrids, bare modules and assembled modules mixed - in one go:
+    one read places the rows of every worksheet, one values request and one batchUpdate write all of them.
+    A component given more than once is written with its last results, other component types are skipped.
+    Returns (component_id, worksheet, row) of every written component
+    """
+
+    if queue is None:
+        queue = SimpleQueue()
+    queue.put(5)
+
+    # Results by worksheet and component
+    grouped = {}
+    for results in results_list:
+        title = component_sheet(results)
+        if title is None:
+            logging.warning(f"{results['component_id']} is not a hybrid, bare or assembled module, "
+                            f"it is not written to the sheet")
+            continue
+        grouped.setdefault(title, {})[results['component_id']] = results
+    if not grouped:
+        queue.put(100)
+        return []
+
+    workbook = sheets_workbook()
+    worksheets = {sheet.title: sheet for sheet in workbook.worksheets()}
+    indexes = {SheetIndex(worksheets[title]): list(components) for title, components in grouped.items()}
+    rows = resolve_rows(indexes)
+    queue.put(10)
+
+    updates = []
+    written = []
+    for index, serials in indexes.items():
+        title = index.sheet.title
+        for serial in serials:
+            row = rows[index][serial]
+            updates.append(sheet_rows[title](index.sheet,row,grouped[title][serial],prompts))
+            written.append((serial, title, row))
+    queue.put(20)
+    write_rows(workbook, updates)
+    queue.put(40)
+
+    for index, serials in indexes.items():
+        for serial in serials:
+            index.written(serial,rows[index][serial],save=False)
+        index.save()
+        sheet_rules[index.sheet.title](index.sheet,queue)
+
+    queue.put(85)
+    queue.put(95)
+    queue.put(100)
+    return written
@@ -0,0 +1,93 @@
+import math
+import numpy as np
+
+"""
+RunningStats - mergeable streaming statistics (count, mean, M2, min and max) of the region thickness values.
+Accumulators are updated chunk by chunk with Welford/Chan updates and can be merged across regions, chunks
+and worker processes, giving the standard deviation of a union of data sets without concatenating them.
+"""
+
+class RunningStats:
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 minimum: float = math.inf, maximum: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        # Sum of squared deviations from the mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    @classmethod
+    def from_values(cls, values):
+        stats = cls()
+        stats.update(values)
+        return stats
+
+    def update(self, values):
+        """
+        Adds a chunk of values - the chunk statistics are computed with NumPy and merged in
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return self
+
+        chunk_mean = float(values.mean())
+        chunk = RunningStats(values.size,
+                             chunk_mean,
+                             float(np.square(values - chunk_mean).sum()),
+                             float(values.min()),
+                             float(values.max()))
+        return self.merge(chunk)
+
+    def merge(self, other: "RunningStats"):
+        """
+        Merges another accumulator into this one (Chan et al. parallel update)
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __add__(self, other: "RunningStats"):
+        return RunningStats(self.count, self.mean, self.m2, self.min, self.max).merge(other)
+
+    @classmethod
+    def combine(cls, parts):
+        """
+        Single accumulator of several accumulators, leaving the parts untouched
+        """
+        combined = cls()
+        for part in parts:
+            combined.merge(part)
+        return combined
+
+    @property
+    def variance(self):
+        """
+        Sample variance, as statistics.variance()
+        """
+        if self.count < 2:
+            raise ValueError("variance requires at least two data points")
+        return self.m2 / (self.count - 1)
+
+    @property
+    def stdev(self):
+        """
+        Sample standard deviation, as statistics.stdev()
+        """
+        return math.sqrt(self.variance)
+
+    def __repr__(self):
+        return f"RunningStats(count={self.count}, mean={self.mean}, m2={self.m2}, min={self.min}, max={self.max})"
@@ -0,0 +1,162 @@
+import ctypes
+import ctypes.util
+import logging
+import multiprocessing
+import os
+import queue
+import select
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ITk_Batch import find_scan_pairs, process_pair
+
+"""
+ScanWatcher - watch-folder mode for the Smartscope export directory. Waits for a .DAT/.STA pair to be
+complete and stable on disk and measures it straight away in a background worker, so the results are
+queued for the operator before the Measure button is pressed. Uses inotify on Linux and falls back to
+polling the directory everywhere else.
+"""
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+def scan_signature(dat_path: str, sta_path: str):
+    """
+    Size and modification time of both files, used to tell whether a pair is still being written
+    and whether a queued result still belongs to the files on disk
+    """
+    dat_stat = os.stat(dat_path)
+    sta_stat = os.stat(sta_path)
+    return (dat_stat.st_size, dat_stat.st_mtime_ns, sta_stat.st_size, sta_stat.st_mtime_ns)
+
+class Inotify:
+    """
+    Minimal inotify binding through ctypes - blocks until something is written or moved into the directory
+    """
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float):
+        """
+        Returns True if any event arrived within the timeout, the pending events are drained
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class ScanWatcher(threading.Thread):
+
+    def __init__(self, directory: str, results: queue.Queue = None, settle: float = 2.0,
+                 poll_interval: float = 1.0, max_workers: int = 1):
+        super().__init__(name="ScanWatcher", daemon=True)
+        self.directory = directory
+        # Finished process_pair() entries for the GUI, each with the "signature" of the measured files
+        self.results = results if results is not None else queue.Queue()
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self._stop_event = threading.Event()
+        # Last seen signature of each pair and when it last changed
+        self._seen = {}
+        # Signatures already submitted, so a pair is only measured again after it has been rewritten
+        self._submitted = {}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        notifier = None
+        if sys.platform.startswith("linux"):
+            try:
+                notifier = Inotify(self.directory)
+            except OSError as e:
+                logging.warning(f"inotify unavailable, polling {self.directory} instead\n{e}")
+
+        # Spawned, not forked from this thread - the children would inherit the locks held by the other
+        # threads of the GUI process and its Qt log handler
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            while not self._stop_event.is_set():
+                self._check_pairs(executor)
+
+                # While a pair is settling the directory is checked again after the poll interval
+                if notifier is not None and not self._seen:
+                    notifier.wait(self.poll_interval * 5)
+                elif notifier is not None:
+                    notifier.wait(self.poll_interval)
+                else:
+                    self._stop_event.wait(self.poll_interval)
+        finally:
+            if notifier is not None:
+                notifier.close()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _check_pairs(self, executor: ProcessPoolExecutor):
+        try:
+            pairs = find_scan_pairs(self.directory, warn_unpaired=False)
+        except OSError as e:
+            logging.error(f"Cannot read the watched directory {self.directory}\n{e}")
+            return
+
+        now = time.monotonic()
+        for serial, stage, dat_path, sta_path in pairs:
+            key = (dat_path, sta_path)
+            try:
+                signature = scan_signature(dat_path, sta_path)
+            except OSError:
+                # Removed or renamed in the meantime
+                continue
+
+            if self._submitted.get(key) == signature:
+                self._seen.pop(key, None)
+                continue
+
+            previous = self._seen.get(key)
+            if previous is None or previous[0] != signature:
+                self._seen[key] = (signature, now)
+                continue
+
+            # Unchanged for the settle time, the Smartscope has finished writing both files
+            if now - previous[1] >= self.settle:
+                del self._seen[key]
+                self._submitted[key] = signature
+                future = executor.submit(process_pair, serial, stage, dat_path, sta_path)
+                future.add_done_callback(lambda done, pair=(serial, stage, dat_path, sta_path), signature=signature:
+                                         self._finished(done, pair, signature))
+
+    def _finished(self, future, pair, signature):
+        # Runs outside the GUI thread, errors are passed on in the entry for the GUI to report
+        serial, stage, dat_path, sta_path = pair
+        try:
+            entry = future.result()
+        except Exception as e:
+            entry = {"component_id": serial,
+                     "stage": stage,
+                     "dat_path": dat_path,
+                     "sta_path": sta_path,
+                     f"{stage}_results": None,
+                     "error": f"{e}"}
+        entry["signature"] = signature
+        self.results.put(entry)
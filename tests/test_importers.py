@@ -0,0 +1,206 @@
+import numpy as np
+import pytest
+import ITk_Importers
+from ITk_Importers import acquire_array, acquire_data, iter_dat_chunks, parse_sta_bytes, read_dat, sta_rows
+from ITk_ScanCache import ScanCache
+
+"""
+Golden tests of the bulk .DAT and .STA readers against the line by line acquire_data() they replaced
+"""
+
+def reference_acquire_data(file_name):
+    # acquire_data() before the bulk reader, .DAT part
+    acq_data = []
+
+    with open(file_name, "r") as file:
+        lines = file.readlines()
+
+        for line_number,line in enumerate(lines):
+
+            line_new = line.rstrip()
+            if line_new == "" :
+                continue
+
+            line_list = line_new.split()
+
+            if len(line_list) != 3:
+                continue
+
+            if line_list == [',HV', 'Capacitor', '(RHS)']:
+                continue
+
+            line_list_numbered = [float(element) for element in line_list]
+            acq_data.append(line_list_numbered)
+
+    return acq_data
+
+def reference_acquire_sta(file_name):
+    # acquire_data() before the bulk reader, .STA part
+    acq_data = []
+
+    with open(file_name, "r") as file:
+        lines = file.readlines()
+
+        for line_number,line in enumerate(lines):
+
+            line_new = line.rstrip()
+            if line_new == "" :
+                continue
+
+            if line_number == 0:
+                continue
+
+            line_list = line_new.split(',')
+            while "" in line_list:
+                line_list.remove("")
+
+            line_list_numbered = [float(element) for element in line_list]
+            acq_data.append(line_list_numbered)
+
+    return acq_data
+
+def write_scan(tmp_path, text: str, name: str = "scan.DAT"):
+    path = tmp_path / name
+    path.write_bytes(text.encode())
+    return str(path)
+
+def chunked(file_name, chunk_size: int):
+    blocks = list(iter_dat_chunks(file_name, chunk_size))
+    for block in blocks:
+        assert block.shape[1] == 3 and len(block) > 0
+    return np.concatenate(blocks).tolist() if blocks else []
+
+# A scan with the export header, marker lines, blank lines and odd spacing
+LINES = ["Smartscope export header v2",
+         "",
+         "Program vc3",
+         "165.7417   175.1021   54.2327",
+         "173.2689\t185.3744  53.8933   ",
+         "   180.6845 139.9454 54.7406",
+         ",HV Capacitor (RHS)",
+         "131.0478   185.1747",
+         "   ",
+         "1 2 3 4",
+         "-135.7753   1.637579e2   -53.8244",
+         ",HV Capacitor (RHS)",
+         "172.2515   143.8042   53.0376"]
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 16, 33, 64, 1 << 20])
+def test_chunk_boundaries(tmp_path, newline, chunk_size):
+    # Small chunks cut lines, \r\n pairs and the marker lines at every possible position
+    file_name = write_scan(tmp_path, newline.join(LINES) + newline)
+    expected = reference_acquire_data(file_name)
+    assert len(expected) == 5
+    assert chunked(file_name, chunk_size) == expected
+    assert read_dat(file_name).tolist() == expected
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("chunk_size", [3, 40, 1 << 20])
+def test_empty_trailing_chunk(tmp_path, newline, chunk_size):
+    # The last chunks hold only blank lines and a marker, they must add nothing
+    text = newline.join(LINES[3:6]) + newline * 50 + "   " + newline + ",HV Capacitor (RHS)" + newline * 3
+    file_name = write_scan(tmp_path, text)
+    expected = reference_acquire_data(file_name)
+    assert chunked(file_name, chunk_size) == expected
+    assert read_dat(file_name).tolist() == expected
+
+@pytest.mark.parametrize("text", ["", "\n\n\r\n", "Smartscope export header v2\r\n\r\nProgram vc3\r\n",
+                                  ",HV Capacitor (RHS)"])
+def test_no_points(tmp_path, text):
+    file_name = write_scan(tmp_path, text)
+    assert reference_acquire_data(file_name) == []
+    assert chunked(file_name, 4) == []
+    points = read_dat(file_name)
+    assert points.shape == (0, 3) and points.dtype == np.float64
+
+def test_no_final_line_break(tmp_path):
+    file_name = write_scan(tmp_path, "\n".join(LINES))
+    assert chunked(file_name, 5) == reference_acquire_data(file_name)
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_scans(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    spaces = [" ", "  ", "   ", "\t", " \t "]
+    lines = []
+    for _ in range(int(rng.integers(0, 300))):
+        kind = rng.random()
+        if kind < 0.75:
+            values = rng.normal(150, 40, 3).round(int(rng.integers(0, 6)))
+            separators = [spaces[i] for i in rng.integers(0, len(spaces), 2)]
+            line = f"{values[0]}{separators[0]}{values[1]}{separators[1]}{values[2]}"
+            lines.append(spaces[rng.integers(0, len(spaces))] * int(rng.integers(0, 2)) + line)
+        elif kind < 0.85:
+            lines.append(",HV Capacitor (RHS)")
+        elif kind < 0.9:
+            lines.append(" ".join(str(value) for value in rng.normal(0, 1, int(rng.integers(1, 6)))))
+        else:
+            lines.append(spaces[rng.integers(0, len(spaces))] * int(rng.integers(0, 2)))
+    newline = ["\n", "\r\n", "\r"][seed % 3]
+    file_name = write_scan(tmp_path, newline.join(lines) + newline * int(rng.integers(0, 3)))
+
+    expected = reference_acquire_data(file_name)
+    assert chunked(file_name, int(rng.integers(1, 200))) == expected
+    assert read_dat(file_name).tolist() == expected
+
+def test_acquire_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(ITk_Importers, "scan_cache", ScanCache(str(tmp_path / "cache")))
+    rng = np.random.default_rng(1)
+    points = "\r\n".join(f"{x:.4f}   {y:.4f}   {z:.4f}" for x, y, z in rng.normal(150, 30, (5000, 3)))
+    file_name = write_scan(tmp_path, "\r\n".join(LINES[:3]) + "\r\n" + points + "\r\n,HV Capacitor (RHS)\r\n")
+    expected = reference_acquire_data(file_name)
+    assert len(expected) == 5000
+    # Parsed, then read back from the scan cache
+    assert acquire_data(file_name) == expected
+    assert acquire_data(file_name) == expected
+
+def test_other_extensions(tmp_path):
+    file_name = write_scan(tmp_path, "1 2 3\n", "scan.txt")
+    with pytest.raises(ValueError, match="not a .DAT or .STA file"):
+        acquire_data(file_name)
+
+# A status file with the header, the trailing commas of the export and blank lines
+STA_LINES = ["Feature,X,Y,Z,",
+             "1,2,3,,",
+             "",
+             "165.7417,175.1021,54.2327,,",
+             "-1.5e-3, 2.25 ,3,",
+             "   ",
+             "39.5,,",
+             ",,7,,8",
+             "0.2"]
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("ending", ["", "\n", "\r\n\r\n"])
+def test_sta(tmp_path, newline, ending):
+    file_name = write_scan(tmp_path, newline.join(STA_LINES) + ending, "scan.STA")
+    expected = reference_acquire_sta(file_name)
+    assert len(expected) == 6
+    assert acquire_data(file_name) == expected
+
+    values, offsets = acquire_array(file_name)
+    assert values.dtype == np.float64 and offsets[0] == 0 and offsets[-1] == len(values)
+    rows = sta_rows(values, offsets)
+    assert [row.tolist() for row in rows] == expected
+    assert rows[-1][0] == 0.2
+
+@pytest.mark.parametrize("text", ["", "Feature,X,Y,Z,", "Feature,X,Y,Z,\r\n\r\n", "\n1,2,3,,\n", ",,,\n,,\n"])
+def test_sta_edges(tmp_path, text):
+    # A blank first line is still the skipped header line
+    file_name = write_scan(tmp_path, text, "scan.STA")
+    assert acquire_data(file_name) == reference_acquire_sta(file_name)
+
+@pytest.mark.parametrize("seed", range(30))
+def test_random_sta(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    lines = ["Feature,X,Y,Z,"]
+    for _ in range(int(rng.integers(0, 200))):
+        values = [str(value) for value in rng.normal(50, 30, int(rng.integers(1, 6))).round(int(rng.integers(0, 5)))]
+        lines.append(",".join(values) + "," * int(rng.integers(0, 3)) if rng.random() < 0.9 else "")
+    newline = ["\n", "\r\n", "\r"][seed % 3]
+    raw = (newline.join(lines) + newline).encode()
+    file_name = write_scan(tmp_path, raw.decode(), "scan.STA")
+
+    expected = reference_acquire_sta(file_name)
+    assert [row.tolist() for row in sta_rows(*parse_sta_bytes(raw))] == expected
+    assert acquire_data(file_name) == expected
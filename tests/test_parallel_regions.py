@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import ITk_ModuleProcessors
+from ITk_ModuleProcessors import FlexProcessor, BareProcessor, AssemProcessor
+from ITk_Regions import RegionClassifier, regions
+
+"""
+The parallel region processing (shared memory, worker processes) gives bit-identical results to the serial one
+"""
+
+processors = {"flex": FlexProcessor, "bare": BareProcessor, "assem": AssemProcessor}
+
+def synthetic_scan(component: str, n_points: int = 40_000):
+    """
+    Points spread over the x/y extent of the region table of the component, with a contaminated z
+    """
+    bounds = [value for region in regions[component] for value in (*region.x, *region.y) if value is not None]
+    low, high = min(bounds) - 5.0, max(bounds) + 5.0
+
+    rng = np.random.default_rng(20)
+    points = np.empty((n_points, 3))
+    points[:, 0] = rng.uniform(low, high, n_points)
+    points[:, 1] = rng.uniform(low, high, n_points)
+    points[:, 2] = rng.normal(0.3, 0.01, n_points)
+    outliers = rng.random(n_points) < 0.03
+    points[outliers, 2] = rng.uniform(0.5, 3.0, outliers.sum())
+    return points
+
+def stats_state(stats):
+    return {name: (value.count, value.mean, value.m2, value.min, value.max) for name, value in stats.items()}
+
+@pytest.mark.parametrize("component", list(processors))
+def test_parallel_matches_serial(component, monkeypatch):
+    data = synthetic_scan(component)
+    active = [region for region in regions[component] if region.in_all]
+    # Every region has points, so both paths really filter every region
+    assert RegionClassifier(active).classify(data).any(axis=0).all()
+
+    serial = processors[component](data)
+    serial.process_all(workers=1)
+
+    monkeypatch.setattr(ITk_ModuleProcessors, "PARALLEL_MIN_POINTS", 0)
+    calls = []
+    process_parallel = ITk_ModuleProcessors.ScanProcessor.process_parallel
+    monkeypatch.setattr(ITk_ModuleProcessors.ScanProcessor, "process_parallel",
+                        lambda self, *args: calls.append(args) or process_parallel(self, *args))
+    parallel = processors[component](data)
+    parallel.process_all(workers=2)
+    assert len(calls) == 1
+
+    assert stats_state(parallel.stats) == stats_state(serial.stats)
+    for attribute in {feed for region in active for feed in region.feeds}:
+        assert np.array_equal(getattr(parallel, attribute), getattr(serial, attribute)), attribute
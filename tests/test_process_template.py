@@ -0,0 +1,75 @@
+from statistics import median
+import numpy as np
+import pytest
+from ITk_ModuleProcessors import process_template, mad_within
+
+"""
+Golden tests of the vectorized MAD filter against the statistics.median implementation it replaced
+"""
+
+def reference_template(valid_rows, valid_row_inf):
+    # process_template() before the vectorization
+    if not valid_rows:
+        raise ValueError(f"No valid rows found with {valid_row_inf} in the given data range.")
+
+    z_values = [row[2] for row in valid_rows]
+    m = median(z_values)
+    mad = median(abs(z - m) for z in z_values)
+
+    row2_data = [row[2] for row in valid_rows if abs(row[2] - m) <= 3 * mad]
+    all_data = [row for row in valid_rows if abs(row[2] - m) <= 3 * mad]
+
+    return row2_data, all_data
+
+def rows_of(z_values):
+    return [[float(index), float(index) * 0.5, float(z)] for index, z in enumerate(z_values)]
+
+rng = np.random.default_rng(20261018)
+
+cases = {
+    "single point": [0.25],
+    "two points": [0.25, 0.75],
+    "odd length": [0.30, 0.31, 0.29, 0.30, 0.95],
+    "even length": [0.30, 0.31, 0.29, 0.30, 0.95, 0.28],
+    "all equal": [0.5] * 7,
+    "mad of zero with outliers": [0.5, 0.5, 0.5, 0.5, 0.9, 0.1],
+    "negative values": [-1.2, -1.1, -1.3, -1.15, -4.0, 2.0],
+    "exactly 3 mad": [0.0, 1.0, -1.0, 1.0, -1.0, 3.0, -3.0],
+    "contaminated scan": list(np.round(np.concatenate([rng.normal(0.35, 0.004, 400),
+                                                       rng.uniform(0.5, 2.0, 25)]), 4)),
+    "wide spread": list(rng.standard_cauchy(1001)),
+}
+
+@pytest.mark.parametrize("z_values", list(cases.values()), ids=list(cases))
+def test_same_rows_as_reference(z_values):
+    rows = rows_of(z_values)
+    expected_z, expected_rows = reference_template(rows, "the test region")
+
+    z_data, region_data = process_template(rows, "the test region")
+
+    assert z_data.tolist() == expected_z
+    assert region_data.tolist() == expected_rows
+
+@pytest.mark.parametrize("z_values", list(cases.values()), ids=list(cases))
+def test_array_input_matches_list_input(z_values):
+    rows = rows_of(z_values)
+
+    from_list = process_template(rows, "the test region")
+    from_array = process_template(np.array(rows), "the test region")
+
+    for list_result, array_result in zip(from_list, from_array):
+        assert np.array_equal(list_result, array_result)
+
+def test_mask_matches_reference_condition():
+    z_values = np.array(cases["contaminated scan"])
+    m = median(z_values.tolist())
+    mad = median(abs(z - m) for z in z_values.tolist())
+
+    assert mad_within(z_values).tolist() == [abs(z - m) <= 3 * mad for z in z_values.tolist()]
+
+@pytest.mark.parametrize("empty", [[], np.empty((0, 3))], ids=["list", "array"])
+def test_empty_region_raises(empty):
+    with pytest.raises(ValueError, match="No valid rows found with the test region"):
+        reference_template([], "the test region")
+    with pytest.raises(ValueError, match="No valid rows found with the test region"):
+        process_template(empty, "the test region")
@@ -0,0 +1,99 @@
+from statistics import mean, stdev
+import numpy as np
+import pytest
+from ITk_Engine import pulltest_measurements
+
+"""
+Golden tests of the NumPy pull test evaluation against the list implementation it replaced
+"""
+
+def reference_grade_mapping(grade):
+    if grade >= 4:
+        return grade - 1
+    elif grade == 3:
+        return 0
+    else:
+        return int(grade)
+
+def reference_pulltest(pull_data: dict):
+    # pulltest_measurements() before the vectorization
+    pull_pass_fail = []
+
+    val_pull_list = pull_data["pull"].tolist()
+
+    mean_pull = mean(val_pull_list)
+    standard_deviation = stdev(val_pull_list)
+
+    pull_pass_fail.append(mean_pull >= 8.00)
+    pull_pass_fail.append(standard_deviation <= 1.50)
+
+    before5g_wires = [value for value in val_pull_list if value < 5.0]
+    if len(before5g_wires) == 0:
+        before5g_wires = 0
+        pull_pass_fail.append(True)
+    else:
+        pull_pass_fail.append(False)
+
+    minimum_pull = min(val_pull_list)
+    maximum_pull = max(val_pull_list)
+
+    val_grade_list = pull_data["grade"].tolist()
+    grade_webApp = list(map(reference_grade_mapping, val_grade_list))
+    pull_location = list(map(reference_grade_mapping, val_grade_list))
+    five_count_1 = pull_location[:10].count(5)
+    pull_location[:10-five_count_1] = [1]*(10-five_count_1)
+    five_count_2 = pull_location[(10-five_count_1):(15-five_count_1)].count(5)
+    pull_location[(10-five_count_1):(15-(five_count_1+five_count_2))] = [2]*((15-five_count_2)-10)
+    pull_location[(15-(five_count_1+five_count_2)):] = [3]*(len(pull_location)-(15-(five_count_1+five_count_2)))
+    pull_strength_data = [[[x],[y],[z]] for x,y,z in zip(val_pull_list,grade_webApp,pull_location)]
+
+    percentage_2 = (len([val for val in grade_webApp if val == 2])/len(grade_webApp))*100
+    percentage_1 = (len([val for val in grade_webApp if val == 1])/len(grade_webApp))*100
+    percentage_3or4 = (len([val for val in grade_webApp if val == 3 or val == 4])/len(grade_webApp))*100
+
+    bondpeel_val = [x for x,y in zip(val_pull_list,grade_webApp) if y == 3 or y == 4]
+    bondpeel_less7 = [val for val in bondpeel_val if val < 7.0]
+    if len(bondpeel_less7) == 0:
+        percentage_less7 = float(0.0)
+    else:
+        percentage_less7 = (len(bondpeel_less7)/len(grade_webApp))*100
+
+    pull_pass_fail.append(percentage_3or4 < 10.00)
+
+    return {"pass_fail": pull_pass_fail,
+            "mean_pull": round(mean_pull,3),
+            "standard_deviation": round(standard_deviation,3),
+            "before5g_wires": before5g_wires,
+            "minimum_pull": round(minimum_pull,3),
+            "maximum_pull": round(maximum_pull,3),
+            "percentage_2": round(percentage_2,2),
+            "percentage_1": round(percentage_1,2),
+            "percentage_3or4": round(percentage_3or4,2),
+            "percentage_less7": round(percentage_less7,2),
+            "numberofwires": len(grade_webApp),
+            "pull_strength_data": pull_strength_data}
+
+def random_pulltest(rng, n_wires: int):
+    # Grades as read from the Dage export (float64) - grade 6 maps to 5, which moves the pull locations
+    grades = rng.choice([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0], size=n_wires, p=[0.05, 0.6, 0.1, 0.05, 0.1, 0.05, 0.05])
+    pulls = np.round(rng.normal(rng.uniform(6.0, 11.0), rng.uniform(0.3, 2.5), size=n_wires), 2)
+    return {"grade": grades, "pull": pulls}
+
+def pull_cases():
+    rng = np.random.default_rng(16)
+    cases = [random_pulltest(rng, int(n_wires)) for n_wires in rng.integers(2, 60, size=400)]
+    # Standard 20-wire tests around the limits
+    cases += [random_pulltest(rng, 20) for _ in range(200)]
+    # Uniform tests - no wire below 5 g, no bond peel
+    cases.append({"grade": np.full(20, 2.0), "pull": np.full(20, 9.5)})
+    cases.append({"grade": np.array([5.0] * 12 + [2.0] * 8), "pull": np.linspace(4.0, 12.0, 20)})
+    return cases
+
+@pytest.mark.parametrize("pull_data", pull_cases())
+def test_same_results_as_reference(pull_data):
+    expected = reference_pulltest(pull_data)
+    results = pulltest_measurements(pull_data)
+
+    assert results == expected
+    # Same types as well, so the uploaded JSON and the sheet values are unchanged
+    assert repr(results) == repr(expected)
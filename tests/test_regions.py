@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from ITk_Regions import RegionClassifier, regions
+
+"""
+Golden tests of the region classifier against the per-region comprehensions of the processors it replaced
+"""
+
+# (row slice, condition) of every region, as written in the original process_* methods
+reference_regions = {
+    "flex": {
+        "quad1": (slice(-308, -3), lambda row: row[0] >= 159.0),
+        "quad2": (slice(-618, -309), lambda row: 146.0 < row[0] <= 158.0),
+        "quad3": (slice(None), lambda row: 130.0 < row[0] < 140.0 and 155.0 < row[1] < 170.0),
+        "quad4": (slice(-1278, -946), lambda row: row[0] >= 146.0),
+        "jig1": (slice(785, 899), lambda row: row[1] > 180.0 and row[0] < 146.0),
+        "jig2": (slice(None), lambda row: 181.0 < row[1] < 190.0 and 148.0 < row[0] < 157.0),
+        "jig3": (slice(None), lambda row: 134.0 < row[1] < 150.0 and 135.0 < row[0] < 150.0),
+    },
+    "bare": {
+        "sensor1": (slice(None), lambda row: 132 < row[0] < 161 and 146 < row[1] < 175),
+        "sensor2": (slice(None), lambda row: 146 < row[0] < 148 and 132 < row[1] < 189),
+        "sensor3": (slice(None), lambda row: 118 < row[0] < 176 and 159 < row[1] < 162),
+        "fe1": (slice(None), lambda row: 147 < row[0] < 177 and 130 < row[1] < 162),
+        "fe2": (slice(None), lambda row: 126 < row[0] < 132 and 169 < row[1] < 176),
+        "fe3": (slice(None), lambda row: 140 < row[0] < 147 and 183 < row[1] < 191),
+    },
+    "assem": {
+        "assem_ga1": (slice(None), lambda row: 136.00 < row[0] < 138.00 and 159.00 < row[1] < 161.00),
+        "assem_ga2": (slice(None), lambda row: 147.00 < row[0] < 151.00 and 148.00 < row[1] < 152.00),
+        "assem_ga3": (slice(None), lambda row: 158.00 < row[0] < 162.00 and 158.00 < row[1] < 162.00),
+        "assem_ga4": (slice(None), lambda row: 146.00 < row[0] < 149.00 and 172.00 < row[1] < 174.00),
+        "assem_sens1": (slice(None), lambda row: 118.00 < row[0] < 132.00 and 147.00 < row[1] < 160.00),
+        "assem_sens2": (slice(None), lambda row: 137.00 < row[0] < 146.00 and 132.00 < row[1] < 142.00),
+        "assem_sens3": (slice(None), lambda row: 147.00 < row[0] < 157.00 and 179.00 < row[1] < 190.00),
+    },
+}
+
+def reference_mask(points, rows: slice, condition):
+    mask = np.zeros(len(points), dtype=bool)
+    for index in range(len(points))[rows]:
+        mask[index] = condition(points[index].tolist())
+    return mask
+
+def boundary_points(component: str, rng):
+    """
+    Every bound of the table, the floats right next to it and a few values in between, crossed for x and y
+    """
+    edges = set()
+    for region in regions[component]:
+        edges.update(value for value in region.x + region.y if value is not None)
+    values = set()
+    for edge in edges:
+        values.update([edge, np.nextafter(edge, -np.inf), np.nextafter(edge, np.inf), edge + 0.5])
+    values = np.array(sorted(values) + [np.nan, -np.inf, np.inf])
+    x, y = np.meshgrid(values, values)
+    points = np.column_stack([x.ravel(), y.ravel(), rng.normal(1, 0.1, x.size)])
+    return points[rng.permutation(len(points))]
+
+def test_table_matches_reference():
+    for component, table in regions.items():
+        assert [region.name for region in table] == list(reference_regions[component])
+
+@pytest.mark.parametrize("component", ["flex", "bare", "assem"])
+@pytest.mark.parametrize("chunk_size", [1 << 18, 997])
+def test_boundaries(component, chunk_size):
+    points = boundary_points(component, np.random.default_rng(0))
+    membership = RegionClassifier(regions[component], chunk_size=chunk_size).classify(points)
+
+    assert membership.shape == (len(points), len(regions[component]))
+    for column, region in enumerate(regions[component]):
+        rows, condition = reference_regions[component][region.name]
+        expected = reference_mask(points, rows, condition)
+        assert expected.any()
+        assert np.array_equal(membership[:, column], expected), region.name
+
+@pytest.mark.parametrize("component", ["flex", "bare", "assem"])
+@pytest.mark.parametrize("n_points", [0, 5, 400, 1000, 5000])
+def test_random_scans(component, n_points):
+    # Short scans cut the row slices of the flex regions short or leave them empty
+    rng = np.random.default_rng(n_points)
+    points = np.column_stack([rng.uniform(110, 185, n_points).round(1), rng.uniform(125, 195, n_points).round(1),
+                              rng.normal(1, 0.1, n_points)])
+    membership = RegionClassifier(regions[component], chunk_size=256).classify(points)
+
+    for column, region in enumerate(regions[component]):
+        rows, condition = reference_regions[component][region.name]
+        assert np.array_equal(membership[:, column], reference_mask(points, rows, condition)), region.name
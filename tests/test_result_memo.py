@@ -0,0 +1,89 @@
+import os
+import pytest
+import ITk_Measurements
+import ITk_ResultsStore
+from ITk_Engine import MeasurementResult, PROCESSOR_VERSION
+from ITk_ResultMemo import ResultMemo
+from ITk_ResultsStore import ResultsStore
+from ITk_Specs import specs
+
+"""
+The result memo and the results store never hand the results of one component to another whose files have
+the same content
+"""
+
+class FakeClient:
+    # getComponent answers with the requested serial, so the component shows which serial was looked up
+    def __init__(self):
+        self.requested = []
+
+    def get(self, endpoint, json=None):
+        if endpoint == "getComponent":
+            self.requested.append(json["component"])
+            return {"code": f"code-{json['component']}", "serialNumber": json["component"],
+                    "alternativeIdentifier": None, "currentStage": {"code": "PCB_RECEPTION"},
+                    "componentType": {"code": "PCB"}, "currentLocation": {"code": "LIV"},
+                    "tests": [{"code": "MASS", "testRuns": [{"id": "run"}]}], "children": []}
+        if endpoint == "getTestRun":
+            return {"results": [{"value": 1.23}]}
+        raise RuntimeError(endpoint)
+
+flex_results = {"avg_thickness": 0.25, "quad_thickness": [0.25, 0.25, 0.25, 0.25], "ftm_flex_thickness": 1.6,
+                "hv_thickness": 2.0, "hv_envelope": True, "avg_stdev": 0.001, "xy_envelope": True,
+                "x_dimension": 39.6, "y_dimension": 40.6, "pass_fail": [True] * 7}
+
+def write_pair(directory, serial: str):
+    # Every serial gets byte-identical files
+    paths = []
+    for extension in ("DAT", "STA"):
+        path = directory / f"{serial}_vc3_bare_flex_metrology.{extension}"
+        path.write_text(f"same {extension} content\n")
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ITk_ResultsStore, "RESULTS_DB", str(tmp_path / "results.sqlite"))
+    monkeypatch.setattr(ITk_ResultsStore, "_store", None)
+    yield
+    if ITk_ResultsStore._store is not None:
+        ITk_ResultsStore._store.close()
+
+def measure(client, dat_path: str, sta_path: str):
+    ok, results = ITk_Measurements.met_measurements(dat_path, sta_path, os.path.basename(dat_path),
+                                                    os.path.basename(sta_path), client,
+                                                    stage_results=dict(flex_results))
+    assert ok
+    return results["component"]
+
+def test_same_content_other_serial(tmp_path, monkeypatch, store):
+    monkeypatch.setattr(ITk_Measurements, "result_memo", ResultMemo())
+    client = FakeClient()
+    first = write_pair(tmp_path, "20UPGPQ0000001")
+    second = write_pair(tmp_path, "20UPGPQ0000002")
+
+    assert measure(client, *first)["serialNumber"] == "20UPGPQ0000001"
+    assert measure(client, *second)["serialNumber"] == "20UPGPQ0000002"
+    # The first serial again is a memo hit, its component is looked up again
+    assert measure(client, *first)["serialNumber"] == "20UPGPQ0000001"
+    assert "20UPGPQ0000002" in client.requested
+
+    memo = ITk_Measurements.result_memo
+    first_key, second_key = memo.key(*first), memo.key(*second)
+    assert first_key[2:] == second_key[2:]
+    assert memo.get(first_key).component_id == "20UPGPQ0000001"
+    assert memo.get(second_key).component_id == "20UPGPQ0000002"
+
+def test_store_find(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    memo = ResultMemo()
+    first = write_pair(tmp_path, "20upgpq0000001")
+    second = write_pair(tmp_path, "20UPGPQ0000002")
+    store.record(MeasurementResult("20upgpq0000001", "flex", dict(flex_results)), *first)
+
+    # Found again under its own serial, whatever the case of the file name, never under another serial
+    assert store.find(*memo.key(*first))["serial"] == "20UPGPQ0000001"
+    assert store.find(*memo.key(*second)) is None
+    hashes = memo.key(*first)[2:4]
+    assert store.find("20UPGPQ0000001", "bare", *hashes, PROCESSOR_VERSION, specs["flex"].version) is None
+    store.close()
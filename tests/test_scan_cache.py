@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+import pytest
+import ITk_ResultMemo
+import ITk_ScanCache
+from ITk_ResultMemo import ResultMemo
+from ITk_ScanCache import ScanCache
+
+"""
+Tests of the on-disk scan cache - stale records, LRU eviction, damaged entries and the shared content hash
+"""
+
+class Loader:
+    # Parses a scan of "x y z" lines and counts the calls
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, file_name):
+        self.calls += 1
+        return np.loadtxt(file_name, ndmin=2)
+
+def write_scan(path, rows):
+    path.write_text("".join(f"{x} {y} {z}\n" for x, y, z in rows))
+    return str(path)
+
+@pytest.fixture
+def cache(tmp_path):
+    return ScanCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+
+@pytest.fixture
+def scan(tmp_path):
+    return write_scan(tmp_path / "scan.DAT", [(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)])
+
+def set_mtime(file_name, mtime_ns: int):
+    os.utime(file_name, ns=(mtime_ns, mtime_ns))
+
+def test_hit(cache, scan):
+    loader = Loader()
+    first = cache.fetch(scan, loader)
+    second = cache.fetch(scan, loader)
+    assert loader.calls == 1
+    assert isinstance(second, np.memmap) and not second.flags.writeable
+    assert np.array_equal(first, second)
+
+def test_size_change(cache, scan, tmp_path):
+    loader = Loader()
+    cache.fetch(scan, loader)
+    mtime = os.stat(scan).st_mtime_ns
+    write_scan(tmp_path / "scan.DAT", [(1.0, 2.0, 3.0), (4.0, 5.0, 6.0), (7.0, 8.0, 9.0)])
+    set_mtime(scan, mtime)
+    assert len(cache.fetch(scan, loader)) == 3
+    assert loader.calls == 2
+
+def test_content_change(cache, scan, tmp_path):
+    # Same size, other content and a new modification time - the hash tells them apart
+    loader = Loader()
+    cache.fetch(scan, loader)
+    write_scan(tmp_path / "scan.DAT", [(1.0, 2.0, 3.0), (4.0, 5.0, 7.0)])
+    set_mtime(scan, os.stat(scan).st_mtime_ns + 10**9)
+    assert cache.fetch(scan, loader)[1, 2] == 7.0
+    assert loader.calls == 2
+    # Stored again for the new content
+    assert cache.fetch(scan, loader)[1, 2] == 7.0
+    assert loader.calls == 2
+
+def test_touched(cache, scan):
+    # Same content with a new modification time keeps the entry and updates its record
+    loader = Loader()
+    cache.fetch(scan, loader)
+    mtime = os.stat(scan).st_mtime_ns + 10**9
+    set_mtime(scan, mtime)
+    cache.fetch(scan, loader)
+    assert loader.calls == 1
+    with open(cache._paths(scan)[1]) as file:
+        assert json.load(file)["mtime_ns"] == mtime
+
+def test_lru_eviction(tmp_path):
+    loader = Loader()
+    scans = [write_scan(tmp_path / f"scan{i}.DAT", [(i, i, i)] * 10) for i in range(3)]
+    cache = ScanCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+
+    for number, file_name in enumerate(scans[:2]):
+        cache.fetch(file_name, loader)
+        # Distinct last used times, oldest first
+        meta_path = cache._paths(file_name)[1]
+        os.utime(meta_path, (1000 + number, 1000 + number))
+    entry_bytes = os.path.getsize(cache._paths(scans[0])[0])
+
+    # Using the first scan again makes the second the least recently used
+    cache.fetch(scans[0], loader)
+    cache.max_bytes = 2 * entry_bytes
+    cache.fetch(scans[2], loader)
+
+    assert [os.path.exists(cache._paths(file_name)[0]) for file_name in scans] == [True, False, True]
+    assert sum(entry[3] for entry in cache.entries()) <= cache.max_bytes
+    assert loader.calls == 3
+    cache.fetch(scans[1], loader)
+    assert loader.calls == 4
+
+@pytest.mark.parametrize("damage", ["npy", "json", "fields", "missing npy"])
+def test_damaged_entry(cache, scan, damage):
+    loader = Loader()
+    expected = np.array(cache.fetch(scan, loader))
+    array_path, meta_path = cache._paths(scan)
+    if damage == "npy":
+        with open(array_path, "wb") as file:
+            file.write(b"not an array")
+    elif damage == "json":
+        with open(meta_path, "w") as file:
+            file.write("{")
+    elif damage == "fields":
+        with open(meta_path, "w") as file:
+            json.dump({"size": os.stat(scan).st_size}, file)
+    else:
+        os.remove(array_path)
+
+    assert np.array_equal(cache.fetch(scan, loader), expected)
+    assert loader.calls == 2
+    # The entry is written again and used from then on
+    assert np.array_equal(cache.fetch(scan, loader), expected)
+    assert loader.calls == 2
+
+def test_changed_while_parsed(cache, scan, tmp_path):
+    def rewriting_loader(file_name):
+        data = np.loadtxt(file_name, ndmin=2)
+        write_scan(tmp_path / "scan.DAT", [(9.0, 9.0, 9.0)])
+        return data
+
+    assert len(cache.fetch(scan, rewriting_loader)) == 2
+    assert not os.path.exists(cache._paths(scan)[1])
+
+def test_shared_hash(cache, scan, monkeypatch):
+    # The memo key and the cache lookup read the file for its hash once between them
+    reads = []
+    digest = ITk_ScanCache.file_digest
+    def counting_digest(file_name, *args):
+        reads.append(file_name)
+        return digest(file_name, *args)
+    monkeypatch.setattr(ITk_ScanCache, "file_digest", counting_digest)
+    monkeypatch.setattr(ITk_ResultMemo, "file_digest", counting_digest)
+
+    memo = ResultMemo()
+    memo_hash = memo.file_hash(scan)
+    cache.fetch(scan, Loader(), memo.file_hash)
+    assert reads == [scan]
+    with open(cache._paths(scan)[1]) as file:
+        assert json.load(file)["hash"] == memo_hash
+
+    # Without the memo the cache hashes the file itself
+    ScanCache(cache.directory + "2").fetch(scan, Loader())
+    assert reads == [scan, scan]
@@ -0,0 +1,87 @@
+import copy
+import queue
+import pytest
+import ITk_SheetRules
+from ITk_SheetRules import sync_rules, spec_rules, hybrid_columns, bare_columns, conditional_rule, rule_dict
+
+"""
+sync_rules() against a stubbed worksheet - requests are only made when the cached fingerprint is missing,
+different or expired, and the rules are only written when the sheet really differs
+"""
+
+class StubSpreadsheet:
+
+    id = "spreadsheet"
+
+    def __init__(self):
+        self.rules = {}
+        self.requests = []
+
+    def fetch_sheet_metadata(self, params=None):
+        self.requests.append("read")
+        return {"sheets": [{"properties": {"sheetId": sheet_id}, "conditionalFormats": copy.deepcopy(rules)}
+                           for sheet_id, rules in self.rules.items()]}
+
+    def batch_update(self, body):
+        self.requests.append("write")
+        for request in body["requests"]:
+            if "deleteConditionalFormatRule" in request:
+                delete = request["deleteConditionalFormatRule"]
+                del self.rules[delete["sheetId"]][delete["index"]]
+            else:
+                add = request["addConditionalFormatRule"]
+                sheet_id = add["rule"]["ranges"][0]["sheetId"]
+                self.rules.setdefault(sheet_id, []).insert(add["index"], copy.deepcopy(add["rule"]))
+        return {}
+
+class StubWorksheet:
+
+    def __init__(self, spreadsheet, sheet_id, title):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+
+@pytest.fixture
+def sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(ITk_SheetRules, "RULES_CACHE", str(tmp_path / "sheet_rules.json"))
+    return StubWorksheet(StubSpreadsheet(), 7, "Hybrids")
+
+def test_rules_written_once_then_left_alone(sheet):
+    desired = spec_rules(sheet, "flex", hybrid_columns)
+
+    assert sync_rules(sheet, desired, queue.Queue()) is True
+    assert sheet.spreadsheet.requests == ["read", "write"]
+    assert len(sheet.spreadsheet.rules[sheet.id]) == len(desired)
+
+    # The cached fingerprint matches, nothing is requested
+    sheet.spreadsheet.requests.clear()
+    assert sync_rules(sheet, spec_rules(sheet, "flex", hybrid_columns), queue.Queue()) is False
+    assert sheet.spreadsheet.requests == []
+
+def test_matching_sheet_read_but_not_written(sheet, monkeypatch):
+    sync_rules(sheet, spec_rules(sheet, "flex", hybrid_columns), queue.Queue())
+
+    # An expired fingerprint is checked against the sheet, which still has the same rules
+    monkeypatch.setattr(ITk_SheetRules, "RULES_CACHE_TTL", 0)
+    sheet.spreadsheet.requests.clear()
+    assert sync_rules(sheet, spec_rules(sheet, "flex", hybrid_columns), queue.Queue()) is False
+    assert sheet.spreadsheet.requests == ["read"]
+
+def test_changed_rules_replace_every_rule(sheet):
+    # Rules of earlier uploads, duplicated
+    stray = conditional_rule(sheet, "P:P", rule_dict["pass"], ["1.701", "2.001"], rule_dict["green"])
+    sheet.spreadsheet.rules[sheet.id] = [stray.to_props() for _ in range(3)]
+
+    desired = spec_rules(sheet, "flex", hybrid_columns)
+    assert sync_rules(sheet, desired, queue.Queue()) is True
+    assert sheet.spreadsheet.rules[sheet.id] == [rule.to_props() for rule in desired]
+
+def test_other_worksheets_keep_their_fingerprint(sheet):
+    other = StubWorksheet(sheet.spreadsheet, 8, "Bare modules")
+    sync_rules(sheet, spec_rules(sheet, "flex", hybrid_columns), queue.Queue())
+    sync_rules(other, spec_rules(other, "bare", bare_columns), queue.Queue())
+
+    sheet.spreadsheet.requests.clear()
+    sync_rules(sheet, spec_rules(sheet, "flex", hybrid_columns), queue.Queue())
+    sync_rules(other, spec_rules(other, "bare", bare_columns), queue.Queue())
+    assert sheet.spreadsheet.requests == []
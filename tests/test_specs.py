@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from ITk_Specs import specs
+
+"""
+Spec tables checked against the literal pass/fail conditions the engine had before the tables, on random
+values concentrated around every limit (the limits themselves and their neighbouring floats included)
+"""
+
+def reference_flex(m):
+    pass_fail = [39.50 <= m["x_dimension"] <= 39.70 and 40.50 <= m["y_dimension"] <= 40.70,
+                 1.701 <= m["hv_thickness"] <= 2.540]
+    pass_fail += [0.201 <= row <= 0.301 for row in m["ga_thickness"]]
+    pass_fail.append(1.521 <= m["ftm_flex_thickness"] <= 1.761)
+    return pass_fail
+
+def reference_bare(m):
+    return [40.200 <= m["fe_y"] <= 40.450 and 42.00 <= m["fe_x"] <= 42.350,
+            41.00 <= m["sensor_y"] <= 41.15 and 39.2 <= m["sensor_x"] <= 39.80,
+            250.0 <= m["avg_bare_thickness"] <= 415.0,
+            80.0 <= m["avg_fe_thickness"] <= 250.0]
+
+def reference_assem(m):
+    def within_bounds(x, y):
+        return 2.119 <= x <= 2.319 and 0.650 <= y <= 0.850
+
+    pass_fail = [1831.0 <= m["ftm_thickness"] <= 2231.0,
+                 m["hv_assem_thickness"] <= 2540.0]
+    pass_fail += [row <= 771.0 for row in m["avg_assem_thickness"]]
+    pass_fail += [within_bounds(m["fiducial_br_x"], m["fiducial_br_y"]),
+                  within_bounds(m["fiducial_tl_x"], m["fiducial_tl_y"])]
+    return pass_fail
+
+def reference_pulltest(m):
+    return [m["mean_pull"] >= 8.00,
+            m["standard_deviation"] <= 1.50,
+            m["before5g_count"] == 0,
+            m["percentage_3or4"] < 10.00]
+
+# Limits of every metric as the engine had them, the values are drawn around these
+limits = {"flex": {"x_dimension": (39.50, 39.70), "y_dimension": (40.50, 40.70), "hv_thickness": (1.701, 2.540),
+                   "ga_thickness": (0.201, 0.301), "ftm_flex_thickness": (1.521, 1.761)},
+          "bare": {"fe_x": (42.00, 42.350), "fe_y": (40.200, 40.450), "sensor_x": (39.2, 39.80),
+                   "sensor_y": (41.00, 41.15), "avg_bare_thickness": (250.0, 415.0), "avg_fe_thickness": (80.0, 250.0)},
+          "assem": {"ftm_thickness": (1831.0, 2231.0), "hv_assem_thickness": (2000.0, 2540.0),
+                    "avg_assem_thickness": (600.0, 771.0), "fiducial_br_x": (2.119, 2.319),
+                    "fiducial_br_y": (0.650, 0.850), "fiducial_tl_x": (2.119, 2.319), "fiducial_tl_y": (0.650, 0.850),
+                    "x_value": (42.187, 42.257), "y_value": (41.00, 41.15)},
+          "pulltest": {"mean_pull": (6.0, 8.00), "standard_deviation": (0.5, 1.50), "before5g_count": (0, 2),
+                       "percentage_3or4": (5.0, 10.00)}}
+
+# Per-element metrics, 1 to 4 values
+element_metrics = ("ga_thickness", "avg_assem_thickness")
+
+references = {"flex": reference_flex, "bare": reference_bare, "assem": reference_assem, "pulltest": reference_pulltest}
+
+def around(rng, low: float, high: float):
+    limit = low if rng.random() < 0.5 else high
+    choice = rng.integers(5)
+    if choice == 0:
+        return limit
+    if choice == 1:
+        return float(np.nextafter(limit, np.inf))
+    if choice == 2:
+        return float(np.nextafter(limit, -np.inf))
+    if choice == 3:
+        return limit + rng.uniform(-0.01, 0.01) * (high - low)
+    return rng.uniform(low - 0.2 * (high - low), high + 0.2 * (high - low))
+
+def random_metrics(rng, stage: str):
+    metrics = {}
+    for metric, (low, high) in limits[stage].items():
+        if metric in element_metrics:
+            metrics[metric] = [around(rng, low, high) for _ in range(rng.integers(1, 5))]
+        elif metric == "before5g_count":
+            metrics[metric] = int(rng.integers(0, 3))
+        else:
+            metrics[metric] = around(rng, low, high)
+    return metrics
+
+@pytest.mark.parametrize("stage", list(references))
+def test_pass_fail_matches_reference(stage):
+    rng = np.random.default_rng(17)
+    table = specs[stage]
+    batch = [random_metrics(rng, stage) for _ in range(12_500)]
+
+    for metrics in batch:
+        assert table.pass_fail(table.check(metrics)) == references[stage](metrics), metrics
+
+    # The whole batch in one vectorized call gives the same overall verdicts
+    expected = [all(references[stage](metrics)) for metrics in batch]
+    assert table.passed(batch).tolist() == expected
+
+def test_limits_are_inclusive_except_strict_ones():
+    flex = specs["flex"]
+    metrics = {"x_dimension": 39.50, "y_dimension": 40.70, "hv_thickness": 1.701, "ga_thickness": [0.201, 0.301],
+               "ftm_flex_thickness": 1.761}
+    assert flex.pass_fail(flex.check(metrics)) == [True, True, True, True, True]
+
+    pulltest = specs["pulltest"]
+    metrics = {"mean_pull": 8.00, "standard_deviation": 1.50, "before5g_count": 0, "percentage_3or4": 10.00}
+    assert pulltest.pass_fail(pulltest.check(metrics)) == [True, True, True, False]
+
+@pytest.mark.parametrize("stage", list(references))
+def test_missing_values(stage):
+    # A missing single value fails its verdict in both check() and passed(), missing elements are skipped
+    rng = np.random.default_rng(5)
+    table = specs[stage]
+    scalars = [metric for metric in limits[stage] if metric not in element_metrics]
+    in_verdict = {criterion.metric for criterion, used in zip(table.column_criteria, table.verdict_columns) if used}
+
+    for metric in scalars:
+        for missing in (None, float("nan")):
+            metrics = random_metrics(rng, stage)
+            metrics[metric] = missing
+            pass_fail = table.pass_fail(table.check(metrics))
+            if metric in in_verdict:
+                assert not all(pass_fail)
+            assert table.passed([metrics]).tolist() == [all(pass_fail)]
+
+    for metric in [metric for metric in limits[stage] if metric in element_metrics]:
+        metrics = random_metrics(rng, stage)
+        metrics[metric] = []
+        assert table.passed([metrics]).tolist() == [all(table.pass_fail(table.check(metrics)))]
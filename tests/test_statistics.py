@@ -0,0 +1,101 @@
+import statistics
+import numpy as np
+import pytest
+from ITk_ModuleProcessors import BareProcessor, AssemProcessor
+from ITk_Regions import regions
+from ITk_Statistics import RunningStats
+
+"""
+Merged running statistics against statistics.stdev over the concatenated values, after the rounding of the engine
+"""
+
+def engine_roundings(value: float):
+    # avg_stdev [mm], avg_stdev_fe/avg_stdev_bare [µm] and quad_stdev_all [µm]
+    return round(value, 4), round(value * 1000, 3), round(value * 1000, 2)
+
+def random_partition(values, rng, n_parts: int):
+    cuts = np.sort(rng.integers(0, len(values) + 1, n_parts - 1))
+    return np.split(values, cuts)
+
+def scan_values(rng, n_values: int):
+    # Thickness values with the 4 decimals of the .DAT files
+    return rng.normal(rng.uniform(0.1, 2.0), rng.uniform(0.001, 0.05), n_values).round(4)
+
+@pytest.mark.parametrize("seed", range(300))
+def test_merge_matches_stdev(seed):
+    rng = np.random.default_rng(seed)
+    values = scan_values(rng, int(rng.integers(2, 5000)))
+    parts = random_partition(values, rng, int(rng.integers(1, 8)))
+
+    expected = statistics.stdev(values.tolist())
+    merged = RunningStats()
+    for part in parts:
+        merged.merge(RunningStats.from_values(part))
+    combined = RunningStats.combine(RunningStats.from_values(part) for part in parts)
+
+    for stats in (merged, combined):
+        assert stats.count == len(values)
+        assert stats.min == values.min() and stats.max == values.max()
+        assert engine_roundings(stats.stdev) == engine_roundings(expected)
+        assert stats.stdev == pytest.approx(expected, rel=1e-12)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_empty_and_single_partitions(seed):
+    rng = np.random.default_rng(seed)
+    values = scan_values(rng, int(rng.integers(2, 200)))
+    # Every value on its own, with empty accumulators in between
+    parts = [RunningStats.from_values(values[index:index + 1]) for index in range(len(values))]
+    for position in rng.integers(0, len(parts) + 1, 5):
+        parts.insert(position, RunningStats.from_values(np.empty(0)) if position % 2 else RunningStats())
+    assert sum(part.count == 1 for part in parts) == len(values)
+
+    expected = statistics.stdev(values.tolist())
+    combined = RunningStats.combine(parts)
+    chained = RunningStats()
+    for part in parts:
+        chained = chained + part
+    for stats in (combined, chained):
+        assert engine_roundings(stats.stdev) == engine_roundings(expected)
+
+def test_chunked_updates():
+    rng = np.random.default_rng(7)
+    values = scan_values(rng, 10_000)
+    stats = RunningStats()
+    for chunk in np.array_split(values, 37):
+        stats.update(chunk)
+    assert engine_roundings(stats.stdev) == engine_roundings(statistics.stdev(values.tolist()))
+    assert stats.mean == pytest.approx(statistics.mean(values.tolist()), rel=1e-13)
+
+@pytest.mark.parametrize("values", [[], [0.25]])
+def test_too_few_values(values):
+    # As statistics.stdev, which raises a StatisticsError (a ValueError)
+    with pytest.raises(ValueError):
+        statistics.stdev(values)
+    with pytest.raises(ValueError):
+        RunningStats.from_values(values).stdev
+    with pytest.raises(ValueError):
+        RunningStats.combine([RunningStats(), RunningStats.from_values(values)]).stdev
+
+def region_scan(component: str, seed: int, n_points: int = 60_000):
+    bounds = [value for region in regions[component] for value in (*region.x, *region.y) if value is not None]
+    low, high = min(bounds) - 5.0, max(bounds) + 5.0
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([rng.uniform(low, high, n_points), rng.uniform(low, high, n_points),
+                              rng.normal(0.3, 0.01, n_points).round(4)])
+    outliers = rng.random(n_points) < 0.03
+    points[outliers, 2] = rng.uniform(0.5, 3.0, outliers.sum()).round(4)
+    return points
+
+@pytest.mark.parametrize("seed", range(5))
+def test_processor_aggregates(seed):
+    # The aggregates the engine reports, merged from the regions against the concatenated region values
+    bare = BareProcessor(region_scan("bare", seed))
+    bare.process_all(workers=1)
+    full = statistics.stdev(np.concatenate([bare.sensor_data, bare.fe_data]).tolist())
+    assert engine_roundings(bare.stats["full_z_data"].stdev) == engine_roundings(full)
+    assert engine_roundings(bare.stats["fe_data"].stdev) == engine_roundings(statistics.stdev(bare.fe_data.tolist()))
+
+    assem = AssemProcessor(region_scan("assem", seed))
+    assem.process_all(workers=1)
+    quad = np.concatenate([assem.assem_ga1, assem.assem_ga2, assem.assem_ga3, assem.assem_ga4])
+    assert engine_roundings(assem.stats["assem_quad"].stdev) == engine_roundings(statistics.stdev(quad.tolist()))